@@ -0,0 +1,181 @@
+import mmap, struct
+from nodes import *
+
+# Layout, all integers little-endian:
+#   header   magic, version, number of strings
+#   strings  length and UTF-8 bytes of every interned name and number
+#   program  number of top-level statements, then the nodes in pre-order
+# A node is its kind byte followed by its fields, names as string indices.
+magic = b'PYAS'
+version = 1
+# Marks a missing node, a conditional expression may have no condition
+no_node = 0xff
+
+header = struct.Struct('<4sHI')
+u8 = struct.Struct('<B')
+u32 = struct.Struct('<I')
+kind_index = struct.Struct('<BI')
+# Kinds whose first field is a string index
+named_kinds = (NUMBER, ID, FUNCTION_CALL, ASSIGNMENT, FUNCTION)
+
+class ASTFormatError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return 'ASTFormatError: {}'.format(self.msg)
+
+class Writer:
+    def __init__(self):
+        self.data = bytearray()
+        self.strings = {}
+
+    def __string(self, text):
+        index = self.strings.get(text)
+        if index == None:
+            index = self.strings[text] = len(self.strings)
+        return index
+
+    def __body(self, body):
+        self.data += u32.pack(len(body))
+        for node in body:
+            self.node(node)
+
+    def node(self, node):
+        data = self.data
+        if node == None:
+            data += u8.pack(no_node)
+            return
+        kind = node.kind
+        if kind == NUMBER:
+            data += kind_index.pack(kind, self.__string(node.value))
+        elif kind == ID:
+            data += kind_index.pack(kind, self.__string(node.name))
+        elif kind in binary_ops:
+            data += u8.pack(kind)
+            self.node(node.op1)
+            self.node(node.op2)
+        elif kind == FUNCTION_CALL:
+            data += kind_index.pack(kind, self.__string(node.name))
+            self.__body(node.parameters)
+        elif kind == ASSIGNMENT:
+            data += kind_index.pack(kind, self.__string(node.name))
+            self.node(node.value)
+            self.node(node.ternary)
+        elif kind in (RETURN, PRINT):
+            data += u8.pack(kind)
+            self.node(node.expression)
+        elif kind in (IF, WHILE):
+            data += u8.pack(kind)
+            self.node(node.condition)
+            self.__body(node.body)
+        elif kind == FUNCTION:
+            data += kind_index.pack(kind, self.__string(node.name))
+            data += u32.pack(len(node.parameters))
+            for parameter in node.parameters:
+                data += u32.pack(self.__string(parameter))
+            self.__body(node.body)
+        else:
+            raise ASTFormatError('Cannot store node "{}"'.format(kind_names[kind]))
+
+    def write(self, ast):
+        self.__body(ast)
+        strings = bytearray()
+        for text in self.strings:
+            encoded = text.encode('utf-8')
+            strings += u32.pack(len(encoded))
+            strings += encoded
+        return header.pack(magic, version, len(self.strings)) + bytes(strings) + bytes(self.data)
+
+class Reader:
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.pos = 0
+        self.strings = []
+
+    def __index(self):
+        index = u32.unpack_from(self.buffer, self.pos)[0]
+        self.pos += 4
+        return index
+
+    def __body(self):
+        count = self.__index()
+        return [self.node() for _ in range(count)]
+
+    def node(self):
+        kind = self.buffer[self.pos]
+        self.pos += 1
+        if kind == no_node:
+            return None
+        if kind in named_kinds:
+            name = self.strings[self.__index()]
+            if kind == NUMBER:
+                return Number(name)
+            if kind == ID:
+                return Id(name)
+            if kind == FUNCTION_CALL:
+                return FunctionCall(name, self.__body())
+            if kind == ASSIGNMENT:
+                value = self.node()
+                return Assignment(name, value, self.node())
+            count = self.__index()
+            parameters = [self.strings[self.__index()] for _ in range(count)]
+            return Function(name, parameters, self.__body())
+        if kind in binary_ops:
+            op1 = self.node()
+            return BinaryOp(kind, op1, self.node())
+        if kind == RETURN:
+            return Return(self.node())
+        if kind == PRINT:
+            return Print(self.node())
+        if kind in (IF, WHILE):
+            condition = self.node()
+            body = self.__body()
+            return If(condition, body) if kind == IF else While(condition, body)
+        raise ASTFormatError('Unknown node kind {} at offset {}'.format(kind, self.pos - 1))
+
+    def read(self):
+        buffer = self.buffer
+        if len(buffer) < header.size:
+            raise ASTFormatError('Not an AST file')
+        tag, file_version, count = header.unpack_from(buffer, 0)
+        if tag != magic:
+            raise ASTFormatError('Not an AST file')
+        if file_version != version:
+            raise ASTFormatError('Unsupported version {}, expected {}'.format(file_version, version))
+        self.pos = header.size
+        # Bounds are checked once here rather than on every field
+        try:
+            for _ in range(count):
+                length = self.__index()
+                if self.pos + length > len(buffer):
+                    raise ASTFormatError('Unexpected end of data at offset {}'.format(self.pos))
+                self.strings.append(bytes(buffer[self.pos:self.pos + length]).decode('utf-8'))
+                self.pos += length
+            ast = self.__body()
+        except (struct.error, IndexError):
+            raise ASTFormatError('Unexpected end of data or bad string index at offset {}'.format(self.pos))
+        except UnicodeDecodeError:
+            raise ASTFormatError('Invalid string at offset {}'.format(self.pos))
+        if self.pos != len(buffer):
+            raise ASTFormatError('{} bytes of trailing data'.format(len(buffer) - self.pos))
+        return ast
+
+def dumps(ast):
+    return Writer().write(ast)
+
+def loads(buffer):
+    return Reader(buffer).read()
+
+def dump(ast, filename):
+    with open(filename, 'wb') as file:
+        file.write(dumps(ast))
+
+def load(filename):
+    with open(filename, 'rb') as file:
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise ASTFormatError('Empty file')
+        with data:
+            return loads(data)
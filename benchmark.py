@@ -0,0 +1,461 @@
+import os, sys, json, time, resource, tracemalloc, argparse, tempfile, shutil, subprocess
+import multiprocessing
+import tokenizer
+from lexer import Lexer
+from compiler import token_list, compile_text, Result
+from parse import Parser
+from pratt import PrattParser
+from nodes import to_json, from_json, write_json, count_nodes, key
+import astfile
+from generator import Generator
+from regalloc import RegisterGenerator
+from optimizer import Optimizer, wrap
+from executor import Executor, remainder
+
+function_template = """def divisors_{0}(n):
+    i = 1
+    div_sum = 0
+    while i < n:
+        remainder = n % i
+        if remainder == 0:
+            div_sum = div_sum + i
+        i = i + 1
+    return div_sum
+"""
+
+main_template = """a{0} = {1}
+b{0} = 100
+a{0} = a{0} if a{0} < b{0} else b{0}
+s{0} = divisors_{0}(a{0})
+print(s{0})
+"""
+
+def synthetic_program(functions):
+    parts = []
+    for i in range(functions):
+        parts.append(function_template.format(i))
+    for i in range(functions):
+        parts.append(main_template.format(i, 100 + i % 50))
+    return '\n'.join(parts)
+
+def nested_program(depth):
+    lines = ['x = 0']
+    for i in range(depth):
+        indent = '    ' * i
+        lines.append('{}{} x < {}:'.format(indent, 'while' if i % 2 else 'if', i + 1))
+        lines.append('{}    x = x + 1'.format(indent))
+    return '\n'.join(lines)
+
+def wide_program(width):
+    # Expressions only take two operands, so a wide one is spelled as a tree of temporaries
+    lines = ['v{} = {}'.format(i, i + 1) for i in range(width)]
+    names = ['v{}'.format(i) for i in range(width)]
+    operators = ['+', '-', '*']
+    temp = 0
+    while len(names) > 1:
+        reduced = []
+        for i in range(0, len(names) - 1, 2):
+            lines.append('t{} = {} {} {}'.format(temp, names[i], operators[temp % 3], names[i + 1]))
+            reduced.append('t{}'.format(temp))
+            temp += 1
+        if len(names) % 2:
+            reduced.append(names[-1])
+        names = reduced
+    lines.append('print({})'.format(names[0]))
+    return '\n'.join(lines)
+
+def functions_program(functions):
+    parts = []
+    for i in range(functions):
+        parts.append('def f{0}(x):\n    y = x + {0}\n    return y\n'.format(i))
+    lines = ['x = 1']
+    for i in range(functions):
+        lines.append('x = f{}(x)'.format(i))
+    lines.append('print(x)')
+    parts.append('\n'.join(lines))
+    return '\n'.join(parts)
+
+def arguments_program(arguments, calls=20):
+    names = ['a{}'.format(i) for i in range(arguments)]
+    lines = ['def wide({}):'.format(', '.join(names)), '    return a0 + a{}'.format(arguments - 1), '']
+    lines.extend('{} = {}'.format(name, i) for i, name in enumerate(names))
+    for i in range(calls):
+        lines.append('r{} = wide({})'.format(i, ', '.join(names)))
+    lines.append('print(r0)')
+    return '\n'.join(lines)
+
+def helpers_program(functions, used):
+    # A generated module where main only reaches every few helpers, and each helper keeps a dead store
+    parts = []
+    for i in range(functions):
+        parts.append('def h{0}(x):\n    unused = x * {0}\n    y = x + {0}\n    return y\n    y = 0\n'.format(i))
+    lines = ['x = 1']
+    for i in range(0, functions, max(functions // used, 1)):
+        lines.append('x = h{}(x)'.format(i))
+    lines.append('print(x)')
+    parts.append('\n'.join(lines))
+    return '\n'.join(parts)
+
+def loop_program(n):
+    # algorithm.py with a bigger input, nearly all of the time is spent in the loop
+    with open('algorithm.py', 'r') as file:
+        return file.read().strip().replace('a = 122', 'a = {}'.format(n)).replace('b = 100', 'b = {}'.format(n))
+
+workloads = {
+    'long': lambda: synthetic_program(200),
+    'nested': lambda: nested_program(200),
+    'wide': lambda: wide_program(512),
+    'functions': lambda: functions_program(500),
+    'arguments': lambda: arguments_program(100)
+}
+
+def parse_text(text):
+    return Parser().parse(tokenizer.tokenize(text, token_list))
+
+def build_ast(text, variant):
+    ast = parse_text(text)
+    if variant == 'dict':
+        # Convert one statement at a time so both shapes never coexist
+        for i in range(len(ast)):
+            ast[i] = to_json(ast[i])
+    return ast
+
+def isolated(queue, func, args):
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((elapsed, after - before))
+
+def run_isolated(func, *args):
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    process = context.Process(target=isolated, args=(queue, func, args))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+def retained_size(func, *args):
+    tracemalloc.start()
+    result = func(*args)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+def bench_ast(functions):
+    text = synthetic_program(functions)
+    print('source: {} lines, {} bytes'.format(text.count('\n') + 1, len(text)))
+    print('{:<8}{:>12}{:>16}{:>16}'.format('ast', 'time, s', 'peak RSS, KiB', 'retained, KiB'))
+    for variant in ['dict', 'nodes']:
+        elapsed, rss = run_isolated(build_ast, text, variant)
+        size = retained_size(build_ast, text, variant)
+        print('{:<8}{:>12.3f}{:>16}{:>16}'.format(variant, elapsed, rss, size // 1024))
+
+def bench_nesting(depths):
+    sys.setrecursionlimit(max(depths) * 4 + 1000)
+    print('{:<8}{:>12}{:>16}'.format('depth', 'time, ms', 'us per level'))
+    for depth in depths:
+        ast = parse_text(nested_program(depth))
+        elapsed = min(timed(Generator().generate, ast) for _ in range(3))
+        print('{:<8}{:>12.2f}{:>16.2f}'.format(depth, elapsed * 1e3, elapsed * 1e6 / depth))
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+def stages(text):
+    tokens = list(tokenizer.tokenize(text, token_list))
+    ast = Parser().parse(tokens)
+    lexer = Lexer(token_list)
+    return [
+        ('tokenize', lambda: list(tokenizer.tokenize(text, token_list))),
+        ('dfa', lambda: list(lexer.tokenize(text))),
+        ('parse', lambda: Parser().parse(tokens)),
+        ('pratt', lambda: PrattParser().parse(tokens)),
+        ('optimize', lambda: Optimizer().optimize(ast)),
+        ('generate', lambda: Generator().generate(ast)),
+        ('registers', lambda: RegisterGenerator().generate(ast))
+    ], len(tokens), count_nodes(ast)
+
+def peak_size(func):
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peak
+
+def bench_suite(repeat):
+    results = {}
+    print('{:<24}{:>12}{:>16}{:>14}'.format('stage', 'time, ms', 'throughput', 'peak, KiB'))
+    for workload, program in workloads.items():
+        functions, lines, nodes = stages(program())
+        for stage, func in functions:
+            elapsed = min(timed(func) for _ in range(repeat))
+            # Tokenizing is measured per line, every later stage per AST node
+            unit, amount = ('lines/s', lines) if stage in ('tokenize', 'dfa') else ('nodes/s', nodes)
+            throughput = amount / elapsed
+            peak = peak_size(func)
+            name = '{}/{}'.format(workload, stage)
+            results[name] = {'time': elapsed, 'throughput': throughput, 'unit': unit, 'peak': peak}
+            print('{:<24}{:>12.2f}{:>9.0f} {}{:>14}'.format(name, elapsed * 1e3, throughput, unit, peak // 1024))
+    return results
+
+def bench_parsers(functions, repeat):
+    print('{:<24}{:>10}{:>14}{:>14}{:>10}'.format('workload', 'tokens', 'parse, ms', 'pratt, ms', 'speedup'))
+    programs = [('{}x{}'.format(name, functions), program(functions)) for name, program in [
+        ('synthetic', synthetic_program), ('functions', functions_program), ('wide', wide_program)
+    ]]
+    for name, text in programs:
+        # The recursive parser flips conditional operators in place, so each gets its own tokens
+        tokens = list(tokenizer.tokenize(text, token_list))
+        if to_json(Parser().parse(tokenizer.tokenize(text, token_list))) != to_json(PrattParser().parse(tokens)):
+            print('{:<24}AST MISMATCH'.format(name))
+            sys.exit(1)
+        count = sum(len(line) for level, line in tokens)
+        old = min(timed(Parser().parse, tokens) for _ in range(repeat))
+        new = min(timed(PrattParser().parse, tokens) for _ in range(repeat))
+        print('{:<24}{:>10}{:>14.2f}{:>14.2f}{:>9.2f}x'.format(name, count, old * 1e3, new * 1e3, old / new))
+
+def token_stream(lines):
+    return [(level, [(x.kind, x.value, x.pos) for x in tokens]) for level, tokens in lines]
+
+def bench_lexers(functions, repeat):
+    print('{:<24}{:>10}{:>12}{:>12}{:>14}{:>10}'.format('workload', 'tokens', 'regex, ms', 'dfa, ms', 'dfa tokens/s', 'speedup'))
+    lexer = Lexer(token_list)
+    programs = [('{}x{}'.format(name, functions), program(functions)) for name, program in [
+        ('synthetic', synthetic_program), ('functions', functions_program), ('wide', wide_program)
+    ]] + [('nestedx200', nested_program(200))]
+    for name, text in programs:
+        tokens = list(tokenizer.tokenize(text, token_list))
+        if token_stream(tokens) != token_stream(lexer.tokenize(text)):
+            print('{:<24}TOKEN MISMATCH'.format(name))
+            sys.exit(1)
+        count = sum(len(line) for level, line in tokens)
+        old = min(timed(lambda: list(tokenizer.tokenize(text, token_list))) for _ in range(repeat))
+        new = min(timed(lambda: list(lexer.tokenize(text))) for _ in range(repeat))
+        print('{:<24}{:>10}{:>12.2f}{:>12.2f}{:>14.0f}{:>9.2f}x'.format(name, count, old * 1e3, new * 1e3, count / new, old / new))
+
+def load_file(filename):
+    with open(filename, 'r') as file:
+        return from_json(json.load(file))
+
+def dump_file(filename, ast, compact):
+    with open(filename, 'w') as file:
+        if compact:
+            json.dump(to_json(ast), file, separators=(',', ':'))
+        else:
+            write_json(ast, file)
+
+def bench_formats(functions, repeat):
+    ast = parse_text(synthetic_program(functions))
+    print('{} AST nodes'.format(count_nodes(ast)))
+    print('{:<16}{:>12}{:>12}{:>12}'.format('format', 'size, KiB', 'dump, ms', 'load, ms'))
+    directory = tempfile.mkdtemp()
+    formats = [
+        ('json indent=4', '.json', lambda f: dump_file(f, ast, False), load_file),
+        ('json compact', '.json', lambda f: dump_file(f, ast, True), load_file),
+        ('binary mmap', '.ast', lambda f: astfile.dump(ast, f), astfile.load)
+    ]
+    for i, (name, extension, dump, load) in enumerate(formats):
+        filename = os.path.join(directory, '{}{}'.format(i, extension))
+        dumped = min(timed(dump, filename) for _ in range(repeat))
+        loaded = min(timed(load, filename) for _ in range(repeat))
+        if key(load(filename)) != key(ast):
+            print('{:<16}ROUND TRIP MISMATCH'.format(name))
+            sys.exit(1)
+        print('{:<16}{:>12}{:>12.2f}{:>12.2f}'.format(name, os.path.getsize(filename) // 1024, dumped * 1e3, loaded * 1e3))
+        os.remove(filename)
+    os.rmdir(directory)
+
+class TreeWalker:
+    # The naive baseline for the executor, walks the JSON dicts and looks names up on every access
+    def __init__(self, ast):
+        self.tree = to_json(ast)
+        self.functions = {node['name']: node for node in self.tree if node['type'] == 'function'}
+        self.output = []
+
+    def run(self):
+        env = {}
+        self.body([node for node in self.tree if node['type'] != 'function'], env)
+        return self.output
+
+    def body(self, body, env):
+        for node in body:
+            result = self.statement(node, env)
+            if result != None:
+                return result
+
+    def statement(self, node, env):
+        kind = node['type']
+        if kind == 'assignment':
+            env[node['name']] = self.expression(node['value'], env)
+            if 'ternary' in node:
+                self.statement(node['ternary'], env)
+        elif kind == 'return':
+            return self.expression(node['expression'], env)
+        elif kind == 'print':
+            self.output.append(int(self.expression(node['expression'], env)))
+        elif kind == 'if':
+            if self.expression(node['condition'], env):
+                return self.body(node['body'], env)
+        elif kind == 'while':
+            while self.expression(node['condition'], env):
+                result = self.body(node['body'], env)
+                if result != None:
+                    return result
+
+    def expression(self, node, env):
+        kind = node['type']
+        if kind == 'number':
+            return int(node['value'])
+        if kind == 'id':
+            if node['name'] in ('True', 'False'):
+                return int(node['name'] == 'True')
+            return env[node['name']]
+        if kind == 'function_call':
+            function = self.functions[node['name']]
+            args = [self.expression(x, env) for x in node['parameters']]
+            return self.body(function['body'], dict(zip(function['parameters'], reversed(args))))
+        op1 = self.expression(node['op1'], env)
+        op2 = self.expression(node['op2'], env)
+        if kind == 'plus':
+            return wrap(op1 + op2)
+        if kind == 'minus':
+            return wrap(op1 - op2)
+        if kind == 'mul':
+            return wrap(op1 * op2)
+        if kind == 'percent':
+            return remainder(op1, op2)
+        if kind == 'less':
+            return int(op1 < op2)
+        if kind == 'greater':
+            return int(op1 > op2)
+        if kind == 'equals':
+            return int(op1 == op2)
+        if kind == 'shl':
+            return wrap(op1 << op2)
+        bias = op2 if op1 < 0 else 0
+        return ((op1 + bias) & op2) - bias
+
+def bench_executor(repeat):
+    print('{:<24}{:>14}{:>14}{:>10}'.format('workload', 'walker, ms', 'closures, ms', 'speedup'))
+    programs = [('loop 2000', loop_program(2000)), ('loop 20000', loop_program(20000)), ('synthetic x50', synthetic_program(50))]
+    for name, text in programs:
+        ast = parse_text(text)
+        walked = TreeWalker(ast).run()
+        if walked != Executor(ast).run():
+            print('{:<24}OUTPUT MISMATCH'.format(name))
+            sys.exit(1)
+        naive = min(timed(TreeWalker(ast).run) for _ in range(repeat))
+        # Compiling the closures is part of the measured time
+        fast = min(timed(lambda: Executor(ast).run()) for _ in range(repeat))
+        print('{:<24}{:>14.2f}{:>14.2f}{:>9.1f}x'.format(name, naive * 1e3, fast * 1e3, naive / fast))
+
+def assemble_time(text, directory):
+    source = os.path.join(directory, 'program.s')
+    with open(source, 'w') as file:
+        file.write(text)
+    start = time.perf_counter()
+    subprocess.run(['as', '--32', source, '-o', os.path.join(directory, 'program.o')], check=True)
+    return time.perf_counter() - start
+
+def bench_dce(functions, repeat):
+    assembler = shutil.which('as') != None
+    directory = tempfile.mkdtemp()
+    print('{:<24}{:<8}{:>12}{:>14}{:>12}{:>10}'.format('workload', 'dce', 'size, KiB', 'compile, ms', 'as, ms', 'removed'))
+    for used in (functions, functions // 10, functions // 100):
+        name = '{} of {}'.format(used, functions)
+        text = helpers_program(functions, used)
+        for dce in (False, True):
+            result = Result(name)
+            output = compile_text(text, result, target='gas', dce=dce)
+            elapsed = min(timed(compile_text, text, Result(name), 'stack', False, False, False, None, 'recursive', 'gas', 'dfa', dce) for _ in range(repeat))
+            assembled = '{:.2f}'.format(min(assemble_time(output, directory) for _ in range(repeat)) * 1e3) if assembler else '-'
+            removed = result.messages[0].split(': ')[1].split(' functions')[0] if dce else '-'
+            print('{:<24}{:<8}{:>12.1f}{:>14.2f}{:>12}{:>10}'.format(name, 'on' if dce else 'off', len(output) / 1024, elapsed * 1e3, assembled, removed))
+    shutil.rmtree(directory)
+
+def generate_with(ast, jobs):
+    # A fresh generator, so every function is generated rather than taken from the fragment cache
+    generator = RegisterGenerator()
+    generator.jobs = jobs
+    return generator.generate(ast)
+
+def bench_parallel(functions, repeat):
+    print('{} cores'.format(os.cpu_count()))
+    print('{:<24}{:>6}{:>14}{:>10}'.format('workload', 'jobs', 'generate, ms', 'speedup'))
+    counts = sorted({1, 2, 4, os.cpu_count() or 1})
+    for name, text in [('synthetic x{}'.format(functions), synthetic_program(functions)), ('functions x{}'.format(functions), functions_program(functions))]:
+        ast = parse_text(text)
+        expected = generate_with(ast, 1)
+        serial = None
+        for jobs in counts:
+            if generate_with(ast, jobs) != expected:
+                print('{:<24}{:>6}  OUTPUT MISMATCH'.format(name, jobs))
+                sys.exit(1)
+            elapsed = min(timed(generate_with, ast, jobs) for _ in range(repeat))
+            if serial == None:
+                serial = elapsed
+            print('{:<24}{:>6}{:>14.2f}{:>9.2f}x'.format(name, jobs, elapsed * 1e3, serial / elapsed))
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        slowdown = old['throughput'] / result['throughput'] - 1
+        growth = result['peak'] / max(old['peak'], 1) - 1
+        if slowdown > threshold:
+            regressions.append('{}: throughput {:.0f} -> {:.0f} {} ({:+.0%})'.format(name, old['throughput'], result['throughput'], result['unit'], -slowdown))
+        if growth > threshold:
+            regressions.append('{}: peak memory {} -> {} KiB ({:+.0%})'.format(name, old['peak'] // 1024, result['peak'] // 1024, growth))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compiler benchmarks')
+    parser.add_argument('benchmark', choices=['ast', 'nesting', 'suite', 'parsers', 'formats', 'executor', 'lexers', 'dce', 'parallel'])
+    parser.add_argument('-n', '--functions', type=int, default=2000)
+    parser.add_argument('-d', '--depths', type=int, nargs='+', default=[250, 500, 1000, 2000])
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('--baseline', default='benchmark_baseline.json')
+    parser.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative regression')
+    args = parser.parse_args()
+
+    if args.benchmark == 'ast':
+        bench_ast(args.functions)
+    elif args.benchmark == 'nesting':
+        bench_nesting(args.depths)
+    elif args.benchmark == 'parsers':
+        bench_parsers(args.functions, args.repeat)
+    elif args.benchmark == 'formats':
+        bench_formats(args.functions, args.repeat)
+    elif args.benchmark == 'lexers':
+        bench_lexers(args.functions, args.repeat)
+    elif args.benchmark == 'parallel':
+        bench_parallel(args.functions, args.repeat)
+    elif args.benchmark == 'dce':
+        bench_dce(args.functions, args.repeat)
+    elif args.benchmark == 'executor':
+        bench_executor(args.repeat)
+    elif args.benchmark == 'suite':
+        sys.setrecursionlimit(10000)
+        results = bench_suite(args.repeat)
+        if args.save:
+            with open(args.baseline, 'w') as file:
+                json.dump(results, file, indent=4)
+            print('Baseline saved to {}'.format(args.baseline))
+        elif os.path.exists(args.baseline):
+            with open(args.baseline, 'r') as file:
+                regressions = compare(results, json.load(file), args.threshold)
+            for line in regressions:
+                print('Regression: {}'.format(line))
+            if regressions:
+                sys.exit(1)
+            print('No regressions against {}'.format(args.baseline))
@@ -0,0 +1,85 @@
+import os, sys, json, hashlib, threading
+
+fingerprints = {}
+
+def fingerprint(modules):
+    # the compiler's own sources are part of the key, so editing it invalidates old entries
+    modules = tuple(modules)
+    if modules not in fingerprints:
+        digest = hashlib.sha256()
+        for name in modules:
+            with open(sys.modules[name].__file__, 'rb') as file:
+                digest.update(file.read())
+        fingerprints[modules] = digest.hexdigest()
+    return fingerprints[modules]
+
+class Cache:
+    def __init__(self, directory, limit=64 * 2 ** 20):
+        self.directory = directory
+        self.limit = limit
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def key(self, text, token_list, settings, modules=()):
+        digest = hashlib.sha256()
+        digest.update(text.encode('utf-8'))
+        digest.update(repr(token_list).encode('utf-8'))
+        digest.update(repr(settings).encode('utf-8'))
+        digest.update(fingerprint(modules).encode('utf-8'))
+        return digest.hexdigest()
+
+    def __path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def record(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def get(self, key):
+        path = self.__path(key)
+        try:
+            with open(path, 'r') as file:
+                entry = json.load(file)
+            os.utime(path)
+        except (OSError, ValueError):
+            self.record(False)
+            return None
+        self.record(True)
+        return entry
+
+    def put(self, key, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.__path(key)
+        # The compile server writes from several threads of one process
+        temporary = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+        with open(temporary, 'w') as file:
+            json.dump(entry, file)
+        os.replace(temporary, path)
+
+    def evict(self):
+        try:
+            names = [x for x in os.listdir(self.directory) if x.endswith('.json')]
+        except OSError:
+            return
+        entries = []
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total = sum(x[1] for x in entries)
+        for mtime, size, path in entries:
+            if total <= self.limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evicted += 1
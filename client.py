@@ -0,0 +1,86 @@
+import os, sys, json, socket, argparse
+
+# Kept free of compiler imports, so a request costs a connection instead of a start-up
+default_address = '.compiler.sock'
+
+def request(address, message):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(address)
+        client.sendall((json.dumps(message) + '\n').encode('utf-8'))
+        data = b''
+        while not data.endswith(b'\n'):
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    finally:
+        client.close()
+    if not data:
+        raise OSError('the server closed the connection')
+    return json.loads(data.decode('utf-8'))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile through a running server.py')
+    parser.add_argument('inputs', nargs='*', default=['algorithm.py'])
+    parser.add_argument('--socket', default=default_address)
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--registers', action='store_const', dest='backend', const='registers', default='stack')
+    group.add_argument('--ir', action='store_const', dest='backend', const='ir')
+    parser.add_argument('--lexer', choices=['dfa', 'regex'], default='dfa')
+    parser.add_argument('--parser', choices=['recursive', 'pratt'], default='recursive')
+    parser.add_argument('--target', choices=['masm', 'gas'], default='masm')
+    parser.add_argument('--optimize', action='store_true')
+    parser.add_argument('--peephole', action='store_true')
+    parser.add_argument('--inline', action='store_true')
+    parser.add_argument('--dce', action='store_true')
+    parser.add_argument('--dump-json', action='store_true')
+    parser.add_argument('--dump-ast', action='store_true')
+    parser.add_argument('--status', action='store_true', help='print the server statistics')
+    parser.add_argument('--stop', action='store_true', help='stop the server')
+    args = parser.parse_args()
+
+    if args.status:
+        message = {'command': 'status'}
+    elif args.stop:
+        message = {'command': 'stop'}
+    else:
+        # The server has its own working directory
+        message = {'command': 'compile', 'files': [os.path.abspath(x) for x in args.inputs], 'options': {
+            'backend': args.backend,
+            'lexer': args.lexer,
+            'parser': args.parser,
+            'target': args.target,
+            'optimize': args.optimize,
+            'peephole': args.peephole,
+            'inline': args.inline,
+            'dce': args.dce,
+            'dump_json': args.dump_json,
+            'dump_ast': args.dump_ast
+        }}
+
+    try:
+        response = request(args.socket, message)
+    except OSError as e:
+        print('No compile server on {} ({}), start one with server.py'.format(args.socket, e.strerror or e))
+        sys.exit(2)
+
+    if 'error' in response:
+        print(response['error'])
+        sys.exit(1)
+    if 'results' not in response:
+        for name, value in response.items():
+            print('{}: {}'.format(name, value))
+        sys.exit(0)
+
+    failed = 0
+    for result in response['results']:
+        for line in result['messages']:
+            print(line)
+        filename = os.path.relpath(result['filename'])
+        if result['error'] != None:
+            failed += 1
+            print('{}: {} ({:.1f} ms)'.format(filename, result['error'], result['elapsed'] * 1000))
+        else:
+            print('{} -> {} ({:.1f} ms)'.format(filename, os.path.relpath(result['output']), result['elapsed'] * 1000))
+    sys.exit(1 if failed else 0)
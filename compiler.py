@@ -1,7 +1,22 @@
-import sys, json
+import sys, os, glob, time, argparse, threading
+from concurrent.futures import ProcessPoolExecutor
 import tokenizer
+from lexer import tokenize as dfa_tokenize
 from parse import *
+from pratt import PrattParser
 from generator import *
+from regalloc import RegisterGenerator
+from lowering import IRGenerator
+from optimizer import Optimizer
+from peephole import Peephole
+from inliner import Inliner
+from deadcode import DeadCodeEliminator
+from emitter import count_instructions
+from nodes import write_json, count_nodes
+from cache import Cache
+from profiler import Profiler, null_profiler
+import astfile
+from targets import targets
 
 token_list = [
     ('PLUS', r'\+'),
@@ -29,35 +44,283 @@ token_list = [
     ('ID', r'[a-zA-Z][a-zA-Z0-9_]*')
 ]
 
-if __name__ == '__main__':
-    filename = "algorithm.py"#sys.argv[1]
-    text = ''
+backends = {
+    'stack': Generator,
+    'registers': RegisterGenerator,
+    'ir': IRGenerator
+}
 
-    with open(filename, 'r') as file:
-        text = file.read().strip()
-    
-    tokens = []
-    try:
-        tokens = tokenizer.tokenize(text, token_list)
-    except tokenizer.TokenError as e:
-        print(e)
-    
-    ast = []
-    parser = Parser()
-    try:
-        ast = parser.parse(tokens)
-    except ParseError as e:
-        print(e)
-        
-    json_obj = json.dumps(ast, indent=4)
-    print(json_obj)
-    
-    generator = Generator()
-    text = ''
+lexers = {
+    'dfa': dfa_tokenize,
+    'regex': tokenizer.tokenize
+}
+
+parsers = {
+    'recursive': Parser,
+    'pratt': PrattParser
+}
+
+modules = ['tokenizer', 'lexer', 'parse', 'pratt', 'nodes', 'semantics', 'generator', 'regalloc', 'frame', 'ir', 'lowering', 'loops', 'optimizer', 'inliner', 'deadcode', 'peephole', 'emitter', 'profiler', 'targets', __name__]
+
+class GeneratorPool:
+    # Generators keep their fragment cache between compiles with the same settings.
+    # A compile takes one for itself, so a concurrent compile builds its own.
+    def __init__(self):
+        self.generators = {}
+        self.lock = threading.Lock()
+
+    def take(self, settings):
+        with self.lock:
+            return self.generators.pop(settings, None)
+
+    def give(self, settings, generator):
+        with self.lock:
+            self.generators[settings] = generator
+
+class Result:
+    def __init__(self, filename, output=None):
+        self.filename = filename
+        self.output = output
+        self.error = None
+        self.messages = []
+        self.elapsed = 0
+        self.cached = None
+        self.profiler = None
+
+def parse_text(text, profiler=None, parser='recursive', lexer='dfa'):
+    profiling = profiler != None
+    if not profiling:
+        profiler = null_profiler
+
+    with profiler.phase('tokenize') as phase:
+        tokens = lexers[lexer](text, token_list)
+        if profiling:
+            # The parser pulls lines lazily, so tokenize up front to time it on its own
+            tokens = list(tokens)
+            phase.counts['lines'] = len(tokens)
+            phase.counts['tokens'] = sum(len(x[1]) for x in tokens)
+
+    with profiler.phase('parse') as phase:
+        ast = parsers[parser]().parse(tokens)
+        if profiling:
+            phase.counts['nodes'] = count_nodes(ast)
+    return ast
+
+def compile_ast(ast, result, backend='stack', optimize=False, peephole=False, inline=False, profiler=None, target='masm', dce=False, jobs=1, generators=None):
+    profiling = profiler != None
+    if not profiling:
+        profiler = null_profiler
+
+    inliner = None
+    if inline:
+        with profiler.phase('inline') as phase:
+            inliner = Inliner()
+            ast = inliner.inline(ast)
+            if profiling:
+                phase.counts['nodes'] = count_nodes(ast)
+        result.messages.extend(inliner.report())
+
+    optimizer = None
+    if optimize:
+        with profiler.phase('optimize') as phase:
+            optimizer = Optimizer()
+            original, ast = ast, optimizer.optimize(ast)
+            if profiling:
+                phase.counts['nodes'] = count_nodes(ast)
+
+    eliminator = None
+    if dce:
+        # After inlining and folding, which both leave functions and stores behind
+        with profiler.phase('dce') as phase:
+            eliminator = DeadCodeEliminator()
+            ast = eliminator.eliminate(ast)
+            if profiling:
+                phase.counts['nodes'] = count_nodes(ast)
+        result.messages.extend(eliminator.report())
+
+    settings = (backend, optimize, peephole, inline, target)
+    generator = None if generators == None else generators.take(settings)
+    if generator == None:
+        generator = backends[backend](Peephole() if peephole else None, optimize)
+        generator.tail_calls = inline
+        generator.target = targets[target]
+    generator.jobs = jobs
+    generator.profiler = profiler if profiling else None
+    with profiler.phase('generate') as phase:
+        try:
+            text = generator.generate(ast)
+        finally:
+            if generators != None:
+                generators.give(settings, generator)
+        if profiling:
+            phase.counts['instructions'] = count_instructions(text)
+
+    if optimizer != None:
+        with profiler.phase('report'):
+            # Same settings as the real run, so the difference is the optimizer's alone
+            reference = backends[backend](Peephole() if peephole else None, optimize)
+            reference.tail_calls = inline
+            reference.target = targets[target]
+            reference.jobs = jobs
+            if eliminator != None:
+                # Measure the optimizer alone, with dead code removed on both sides
+                original = DeadCodeEliminator().eliminate(original)
+            removed = count_instructions(reference.generate(original)) - count_instructions(text)
+        result.messages.append('Optimizer: {} folded, {} simplified, {} strength-reduced, {} propagated, {} branches eliminated, {} instructions removed'.format(
+            optimizer.folded, optimizer.simplified, optimizer.reduced, optimizer.propagated, optimizer.eliminated, removed))
+    if inline:
+        result.messages.append('Tail calls: {}'.format(', '.join(generator.tail_jumps) or 'none'))
+    if isinstance(generator, IRGenerator):
+        passes = generator.passes
+        result.messages.append('IR: {} propagated, {} common subexpressions, {} dead instructions, {} unreachable blocks'.format(
+            passes.propagated, passes.cse, passes.eliminated, passes.unreachable))
+    if peephole:
+        result.messages.append('Peephole: {}'.format(', '.join('{} {}'.format(name, hits) for name, hits in generator.peephole.hits.items() if hits)))
+    if generators != None:
+        result.messages.append('Fragments: {} generated, {} reused'.format(generator.generated, generator.reused))
+    return text
+
+def compile_text(text, result, backend='stack', optimize=False, peephole=False, inline=False, profiler=None, parser='recursive', target='masm', lexer='dfa', dce=False, jobs=1, generators=None):
+    ast = parse_text(text, profiler, parser, lexer)
+    return compile_ast(ast, result, backend, optimize, peephole, inline, profiler, target, dce, jobs, generators)
+
+def compile_file(filename, backend='stack', optimize=False, peephole=False, inline=False, cache=None, profile=False, parser='recursive', dump_json=False, dump_ast=False, target='masm', lexer='dfa', dce=False, jobs=1, generators=None, profiler=None):
+    if profile:
+        # tracemalloc slows every allocation, so memory is measured in a pass of its own
+        # and the times come from a second pass without it
+        memory = Profiler(filename)
+        compile_file(filename, backend, optimize, peephole, inline, None, False, parser, dump_json, dump_ast, target, lexer, dce, jobs, None, memory)
+        memory.stop()
+        result = compile_file(filename, backend, optimize, peephole, inline, None, False, parser, dump_json, dump_ast, target, lexer, dce, jobs, None, Profiler(filename, memory=False))
+        result.profiler.take_peaks(memory)
+        return result
+
+    base = os.path.splitext(filename)[0]
+    result = Result(filename, base + targets[target].extension)
+    if profiler != None:
+        # A cache hit or a reused fragment would skip the work being measured
+        result.profiler = profiler
+        cache = None
+        generators = None
+    profiler = result.profiler or null_profiler
+    start = time.perf_counter()
     try:
-        text = generator.generate(ast)
-    except SemanticError as e:
-        print(e)
-    
-    with open(filename.split('.')[0] + '.asm', 'w') as file:
-        file.write(text)
\ No newline at end of file
+        ast = None
+        source = None
+        if filename.endswith('.ast'):
+            # A saved tree skips tokenizing and parsing; with no source to key on it is not cached
+            with profiler.phase('load'):
+                ast = astfile.load(filename)
+            cache = None
+            dump_ast = False
+        else:
+            with open(filename, 'r') as file:
+                source = file.read().strip()
+            if dump_json or dump_ast:
+                ast = parse_text(source, result.profiler, parser, lexer)
+
+        if dump_json:
+            with profiler.phase('json'):
+                with open(base + '.json', 'w') as file:
+                    write_json(ast, file)
+        if dump_ast:
+            with profiler.phase('dump'):
+                astfile.dump(ast, base + '.ast')
+
+        entry = None
+        if cache != None:
+            # Both parsers build the same tree, so the parser is not part of the key.
+            # The lexers differ on a keyword followed by identifier characters.
+            # Parallel generation gives byte-identical output, so the job count is left out too.
+            key = cache.key(source, token_list, (backend, optimize, peephole, inline, target, lexer, dce), modules)
+            entry = cache.get(key)
+            result.cached = entry != None
+        if entry != None:
+            text = entry['asm']
+            result.messages = entry['messages']
+        else:
+            if ast == None:
+                text = compile_text(source, result, backend, optimize, peephole, inline, result.profiler, parser, target, lexer, dce, jobs, generators)
+            else:
+                text = compile_ast(ast, result, backend, optimize, peephole, inline, result.profiler, target, dce, jobs, generators)
+            if cache != None:
+                cache.put(key, {'asm': text, 'messages': result.messages})
+        with open(result.output, 'w') as file:
+            file.write(text)
+    except (tokenizer.TokenError, ParseError, SemanticError, astfile.ASTFormatError, OSError) as e:
+        result.error = str(e)
+        result.output = None
+    result.elapsed = time.perf_counter() - start
+    return result
+
+def expand(inputs):
+    files = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '**', '*.py')
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        for filename in matches:
+            if filename not in files:
+                files.append(filename)
+    return files
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('inputs', nargs='*', default=['algorithm.py'])
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
+    parser.add_argument('--function-jobs', type=int, default=1, help='generate the functions of a large file in a process pool of this size')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--registers', action='store_const', dest='backend', const='registers', default='stack')
+    group.add_argument('--ir', action='store_const', dest='backend', const='ir', help='lower through the three-address IR')
+    parser.add_argument('--lexer', choices=list(lexers), default='dfa', help='tokenizer, the generated automaton or the original regular expression')
+    parser.add_argument('--parser', choices=list(parsers), default='recursive', help='parser engine, the table-driven one avoids copying token slices')
+    parser.add_argument('--target', choices=list(targets), default='masm', help='assembler syntax, gas builds i386 Linux programs')
+    parser.add_argument('--optimize', action='store_true')
+    parser.add_argument('--peephole', action='store_true')
+    parser.add_argument('--inline', action='store_true', help='inline small functions and turn self tail calls into jumps')
+    parser.add_argument('--dce', action='store_true', help='drop functions main cannot reach, dead stores and code after return')
+    parser.add_argument('--dump-json', action='store_true', help='write the AST as JSON next to each input')
+    parser.add_argument('--dump-ast', action='store_true', help='write the AST in the binary format, which can be compiled instead of the source')
+    parser.add_argument('--cache-dir', default='.asmcache')
+    parser.add_argument('--cache-size', type=int, default=64, help='cache size limit in MiB')
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--profile', action='store_true', help='time each phase, bypassing the cache')
+    parser.add_argument('--profile-output', help='write the profile as a JSON Chrome trace')
+    args = parser.parse_args()
+
+    files = expand(args.inputs)
+    cache = None if args.no_cache else Cache(args.cache_dir, args.cache_size * 2 ** 20)
+    options = (args.backend, args.optimize, args.peephole, args.inline, cache, args.profile or args.profile_output != None, args.parser, args.dump_json, args.dump_ast, args.target, args.lexer, args.dce, args.function_jobs)
+    start = time.perf_counter()
+    if args.jobs > 1 and len(files) > 1:
+        with ProcessPoolExecutor(args.jobs) as executor:
+            results = executor.map(compile_file, files, *[[x] * len(files) for x in options])
+            results = list(results)
+    else:
+        results = [compile_file(filename, *options) for filename in files]
+    elapsed = time.perf_counter() - start
+
+    failed = 0
+    for result in results:
+        for message in result.messages:
+            print(message)
+        if result.error != None:
+            failed += 1
+            print('{}: {} ({:.1f} ms)'.format(result.filename, result.error, result.elapsed * 1000))
+        else:
+            print('{} -> {} ({:.1f} ms)'.format(result.filename, result.output, result.elapsed * 1000))
+    print('{} files, {} failed in {:.1f} ms'.format(len(results), failed, elapsed * 1000))
+    if cache != None:
+        cache.hits = sum(1 for x in results if x.cached == True)
+        cache.misses = sum(1 for x in results if x.cached == False)
+        cache.evict()
+        print('Cache: {} hits, {} misses, {} evicted'.format(cache.hits, cache.misses, cache.evicted))
+    if options[5]:
+        profiler = Profiler(memory=False)
+        for result in results:
+            if result.profiler != None:
+                profiler.merge(result.profiler)
+        print(profiler.report())
+        if args.profile_output != None:
+            profiler.dump(args.profile_output)
+    sys.exit(1 if failed else 0)
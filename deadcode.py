@@ -0,0 +1,184 @@
+from nodes import *
+from generator import called_functions
+from optimizer import assigned_names
+from semantics import check_program
+
+def used_names(node, names):
+    kind = node.kind
+    if kind == ID:
+        if node.name not in ('True', 'False'):
+            names.add(node.name)
+    elif kind == FUNCTION_CALL:
+        for parameter in node.parameters:
+            used_names(parameter, names)
+    elif kind in binary_ops:
+        used_names(node.op1, names)
+        used_names(node.op2, names)
+    return names
+
+def removable(node):
+    # Calls may print or never return and idiv faults on zero and on INT_MIN % -1,
+    # so only expressions without either can be dropped
+    kind = node.kind
+    if kind == FUNCTION_CALL:
+        return False
+    if kind == PERCENT and (node.op2.kind != NUMBER or int(node.op2.value) in (0, -1)):
+        return False
+    if kind in binary_ops:
+        return removable(node.op1) and removable(node.op2)
+    return True
+
+def split_ternaries(body):
+    # The conditional store can write another name than the assignment it hangs off,
+    # every backend emits it right after that assignment, so it becomes a statement of its own
+    result = []
+    for node in body:
+        kind = node.kind
+        if kind == ASSIGNMENT and node.ternary != None:
+            result.append(Assignment(node.name, node.value))
+            result.extend(split_ternaries([node.ternary]))
+        elif kind == IF:
+            result.append(If(node.condition, split_ternaries(node.body)))
+        elif kind == WHILE:
+            result.append(While(node.condition, split_ternaries(node.body)))
+        else:
+            result.append(node)
+    return result
+
+class DeadCodeEliminator:
+    def __init__(self):
+        self.functions = []
+        self.stores = 0
+        self.unreachable = 0
+        self.needed = {}
+        self.order = {}
+        self.stores_at = {}
+        self.first_read = {}
+
+    def __live(self, body, live):
+        # Backward liveness, records for every assignment whether its value is read
+        for node in reversed(body):
+            kind = node.kind
+            if kind == ASSIGNMENT:
+                self.needed[id(node)] = self.needed.get(id(node), False) or node.name in live
+                live = (live - {node.name}) | used_names(node.value, set())
+            elif kind == RETURN:
+                live = used_names(node.expression, set())
+            elif kind == PRINT:
+                live = live | used_names(node.expression, set())
+            elif kind == IF:
+                live = live | self.__live(node.body, live) | used_names(node.condition, set())
+            elif kind == WHILE:
+                # The test runs first and after every iteration, so iterate to a fixed point
+                test = live | used_names(node.condition, set())
+                while True:
+                    updated = test | self.__live(node.body, test)
+                    if updated == test:
+                        break
+                    test = updated
+                live = test
+        return live
+
+    def __number(self, body):
+        # Statements in emission order, with the stores and the first read of every name
+        for node in body:
+            index = self.order[id(node)] = len(self.order)
+            kind = node.kind
+            reads = set()
+            if kind == ASSIGNMENT:
+                used_names(node.value, reads)
+                self.stores_at.setdefault(node.name, []).append(index)
+            elif kind in (RETURN, PRINT):
+                used_names(node.expression, reads)
+            elif kind in (IF, WHILE):
+                used_names(node.condition, reads)
+            for name in reads:
+                self.first_read.setdefault(name, index)
+            if kind in (IF, WHILE):
+                self.__number(node.body)
+
+    def __dead(self, node, defined):
+        if node.kind != ASSIGNMENT or self.needed.get(id(node), True) or not removable(node.value):
+            return False
+        name = node.name
+        if name in defined or name not in self.first_read:
+            return True
+        # The generator accepts a read once a store to the name has been emitted, so
+        # the first store may only go when another one is emitted before any read
+        index = self.order[id(node)]
+        later = [x for x in self.stores_at[name] if x > index]
+        return later != [] and later[0] < self.first_read[name]
+
+    def __body(self, body, defined):
+        result = []
+        for i, node in enumerate(body):
+            if self.__dead(node, defined):
+                self.stores += 1
+                continue
+            kind = node.kind
+            if kind == IF:
+                node = If(node.condition, self.__body(node.body, defined))
+            elif kind == WHILE:
+                node = While(node.condition, self.__body(node.body, defined))
+            elif kind == ASSIGNMENT:
+                defined.add(node.name)
+            result.append(node)
+            if kind == RETURN:
+                # Statements after a return are dropped unless a later read relies on one of their stores
+                rest = body[i + 1:]
+                if all(name in defined or name not in self.first_read for name in assigned_names(rest, set())):
+                    self.unreachable += len(rest)
+                    break
+        return result
+
+    def eliminate_function(self, function):
+        body = split_ternaries(function.body)
+        # Removing a store can leave the stores feeding it dead, repeat until nothing changes
+        while True:
+            self.needed = {}
+            self.order = {}
+            self.stores_at = {}
+            self.first_read = {}
+            self.__live(body, set())
+            self.__number(body)
+            count = self.stores + self.unreachable
+            body = self.__body(body, set(function.parameters))
+            if self.stores + self.unreachable == count:
+                break
+        return Function(function.name, function.parameters, body)
+
+    def eliminate(self, ast):
+        # Removed stores and functions would take the generator's errors with them
+        check_program(ast)
+        functions = [x for x in ast if x.kind == FUNCTION]
+        names = [x.name for x in functions]
+
+        bodies = {x.name: self.eliminate_function(x) for x in functions}
+        main_function = self.eliminate_function(Function('main', [], [x for x in ast if x.kind != FUNCTION]))
+
+        # Everything main can reach through the call graph stays
+        graph = {name: called_functions(x.body, set()) for name, x in bodies.items()}
+        reachable = set()
+        stack = list(called_functions(main_function.body, set()))
+        while stack:
+            name = stack.pop()
+            if name in reachable or name not in graph:
+                continue
+            reachable.add(name)
+            stack.extend(graph[name])
+
+        # The generator collects the top-level statements into main in order,
+        # so they can follow the functions
+        result = []
+        for name in names:
+            if name in reachable:
+                result.append(bodies[name])
+            else:
+                self.functions.append(name)
+        return result + main_function.body
+
+    def report(self):
+        lines = ['Dead code: {} functions, {} stores, {} unreachable statements removed'.format(len(self.functions), self.stores, self.unreachable)]
+        if self.functions:
+            lines.append('Unreachable functions: {}'.format(', '.join(self.functions)))
+        return lines
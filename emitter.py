@@ -0,0 +1,33 @@
+def is_instruction(line):
+    # Directives start with a dot in both assembler syntaxes
+    return line != '' and '\n' not in line and not line.endswith((':', ' proc', ' endp')) and line != 'end start' \
+        and not line.startswith('.')
+
+def count_instructions(text):
+    return sum(1 for line in text.split('\n') if is_instruction(line.strip()))
+
+class Emitter:
+    def __init__(self):
+        self.lines = []
+
+    def emit(self, *lines):
+        self.lines.extend(lines)
+
+    def getvalue(self):
+        return '\n'.join(self.lines)
+
+class StreamEmitter(Emitter):
+    def __init__(self, stream):
+        self.stream = stream
+        self.started = False
+
+    def emit(self, *lines):
+        if not lines:
+            return
+        if self.started:
+            self.stream.write('\n')
+        self.stream.write('\n'.join(lines))
+        self.started = True
+
+    def getvalue(self):
+        return None
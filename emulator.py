@@ -0,0 +1,304 @@
+from optimizer import wrap
+
+class EmulatorError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return 'EmulatorError: {}'.format(self.msg)
+
+registers = ['eax', 'ebx', 'ecx', 'edx', 'esi', 'edi', 'ebp', 'esp']
+low_registers = {'al': 'eax', 'bl': 'ebx', 'cl': 'ecx', 'dl': 'edx'}
+
+conditions = {
+    'e': lambda a, b: a == b,
+    'ne': lambda a, b: a != b,
+    'l': lambda a, b: a < b,
+    'le': lambda a, b: a <= b,
+    'g': lambda a, b: a > b,
+    'ge': lambda a, b: a >= b
+}
+
+# Return address pushed by the startup code, main returns through it
+halt = -1
+stack_top = 0x100000
+
+def parse_operand(text):
+    text = text.strip()
+    if text.startswith('dword ptr '):
+        text = text[len('dword ptr '):]
+    if text.startswith('['):
+        inner = text[1:-1]
+        for sign in '+-':
+            if sign in inner:
+                base, offset = inner.split(sign)
+                return ('mem', base, int(offset) if sign == '+' else -int(offset))
+        return ('mem', inner, 0)
+    if text in registers:
+        return ('reg', text)
+    if text in low_registers:
+        return ('low', low_registers[text])
+    try:
+        # The assembler encodes immediates in 32 bits
+        return ('imm', wrap(int(text)))
+    except ValueError:
+        return ('label', text)
+
+class Emulator:
+    def __init__(self, text, max_steps=10 ** 8):
+        self.max_steps = max_steps
+        self.code = []
+        self.labels = {}
+        self.__load(text)
+
+    def __load(self, text):
+        # The MASM header and startup code are replaced by the emulator itself
+        body = text.split('invoke ExitProcess, 0', 1)[-1]
+        for line in body.split('\n'):
+            line = line.strip()
+            if line == '' or line == 'end start' or line.endswith(' endp'):
+                continue
+            if line.endswith(' proc'):
+                self.labels[line[:-len(' proc')]] = len(self.code)
+                continue
+            if line.endswith(':'):
+                self.labels[line[:-1]] = len(self.code)
+                continue
+            parts = line.split(None, 1)
+            operands = [parse_operand(x) for x in parts[1].split(',')] if len(parts) > 1 else []
+            self.code.append((parts[0], operands))
+
+    def __address(self, operand):
+        return self.registers[operand[1]] + operand[2]
+
+    def __read(self, operand):
+        kind = operand[0]
+        if kind == 'reg':
+            return self.registers[operand[1]]
+        if kind == 'imm':
+            return operand[1]
+        if kind == 'low':
+            return self.registers[operand[1]] & 0xff
+        if kind == 'mem':
+            return self.__load_word(self.__address(operand))
+        raise EmulatorError('Cannot read operand "{}"'.format(operand[1]))
+
+    def __write(self, operand, value):
+        kind = operand[0]
+        if kind == 'reg':
+            self.registers[operand[1]] = wrap(value)
+        elif kind == 'low':
+            name = operand[1]
+            self.registers[name] = wrap((self.registers[name] & ~0xff) | (value & 0xff))
+        elif kind == 'mem':
+            self.__store_word(self.__address(operand), value)
+        else:
+            raise EmulatorError('Cannot write operand "{}"'.format(operand[1]))
+
+    def __load_word(self, address):
+        self.reads += 1
+        if address not in self.memory:
+            raise EmulatorError('Read of uninitialized memory at {:#x}'.format(address))
+        return self.memory[address]
+
+    def __store_word(self, address, value):
+        self.writes += 1
+        self.memory[address] = wrap(value)
+
+    def __push(self, value):
+        self.registers['esp'] -= 4
+        self.__store_word(self.registers['esp'], value)
+
+    def __pop(self):
+        value = self.__load_word(self.registers['esp'])
+        self.registers['esp'] += 4
+        return value
+
+    def run(self):
+        self.registers = {name: 0 for name in registers}
+        self.registers['esp'] = stack_top
+        self.memory = {}
+        self.output = []
+        self.compare = (0, 0)
+        self.instructions = 0
+        self.reads = 0
+        self.writes = 0
+        self.calls = 0
+        self.histogram = {}
+
+        if 'main' not in self.labels:
+            raise EmulatorError('No main procedure')
+        self.__push(halt)
+        ip = self.labels['main']
+        code = self.code
+        regs = self.registers
+
+        while ip != halt:
+            if self.instructions >= self.max_steps:
+                raise EmulatorError('Step limit of {} exceeded'.format(self.max_steps))
+            if ip < 0 or ip >= len(code):
+                raise EmulatorError('Jump outside the program to {}'.format(ip))
+            op, operands = code[ip]
+            ip += 1
+            self.instructions += 1
+            self.histogram[op] = self.histogram.get(op, 0) + 1
+
+            if op == 'mov':
+                self.__write(operands[0], self.__read(operands[1]))
+            elif op == 'push':
+                self.__push(self.__read(operands[0]))
+            elif op == 'pop':
+                self.__write(operands[0], self.__pop())
+            elif op == 'add':
+                self.__write(operands[0], self.__read(operands[0]) + self.__read(operands[1]))
+            elif op == 'sub':
+                self.__write(operands[0], self.__read(operands[0]) - self.__read(operands[1]))
+            elif op == 'inc':
+                self.__write(operands[0], self.__read(operands[0]) + 1)
+            elif op == 'dec':
+                self.__write(operands[0], self.__read(operands[0]) - 1)
+            elif op == 'and':
+                self.__write(operands[0], self.__read(operands[0]) & self.__read(operands[1]))
+            elif op == 'shl':
+                self.__write(operands[0], self.__read(operands[0]) << self.__read(operands[1]))
+            elif op == 'sar':
+                self.__write(operands[0], self.__read(operands[0]) >> self.__read(operands[1]))
+            elif op == 'imul':
+                if len(operands) == 3:
+                    value = self.__read(operands[1]) * self.__read(operands[2])
+                else:
+                    value = self.__read(operands[0]) * self.__read(operands[1])
+                self.__write(operands[0], value)
+            elif op == 'mul':
+                product = (regs['eax'] & 0xffffffff) * (self.__read(operands[0]) & 0xffffffff)
+                regs['eax'] = wrap(product)
+                regs['edx'] = wrap(product >> 32)
+            elif op == 'cdq':
+                regs['edx'] = -1 if regs['eax'] < 0 else 0
+            elif op == 'idiv':
+                divisor = self.__read(operands[0])
+                if divisor == 0:
+                    raise EmulatorError('Division by zero')
+                dividend = (regs['edx'] << 32) | (regs['eax'] & 0xffffffff)
+                quotient = abs(dividend) // abs(divisor)
+                if (dividend < 0) != (divisor < 0):
+                    quotient = -quotient
+                if wrap(quotient) != quotient:
+                    raise EmulatorError('Division overflow')
+                regs['eax'] = quotient
+                regs['edx'] = dividend - quotient * divisor
+            elif op == 'cmp':
+                self.compare = (self.__read(operands[0]), self.__read(operands[1]))
+            elif op == 'movzx':
+                self.__write(operands[0], self.__read(operands[1]))
+            elif op.startswith('set') and op[3:] in conditions:
+                self.__write(operands[0], int(conditions[op[3:]](*self.compare)))
+            elif op == 'jmp':
+                ip = self.__target(operands[0])
+            elif op.startswith('j') and op[1:] in conditions:
+                if conditions[op[1:]](*self.compare):
+                    ip = self.__target(operands[0])
+            elif op == 'call':
+                self.calls += 1
+                name = operands[0][1]
+                if name == '__print':
+                    self.__print()
+                else:
+                    self.__push(ip)
+                    ip = self.__target(operands[0])
+            elif op == 'ret':
+                ip = self.__pop()
+            else:
+                raise EmulatorError('Unsupported instruction "{}"'.format(op))
+
+        if regs['esp'] != stack_top:
+            raise EmulatorError('Stack is unbalanced by {} bytes after main'.format(stack_top - regs['esp']))
+        return self.output
+
+    def __target(self, operand):
+        if operand[1] not in self.labels:
+            raise EmulatorError('Unknown label "{}"'.format(operand[1]))
+        return self.labels[operand[1]]
+
+    def __print(self):
+        self.output.append(self.__load_word(self.registers['esp']))
+        # MessageBox does not preserve the caller-saved registers
+        for name in ('eax', 'ecx', 'edx'):
+            self.registers[name] = wrap(0xdeadbeef)
+
+def python_output(text):
+    lines = []
+    def capture(value):
+        lines.append(int(value))
+    try:
+        exec(compile(text, '<program>', 'exec'), {'print': capture})
+    except Exception:
+        return None
+    return lines
+
+if __name__ == '__main__':
+    import sys, os, glob
+    import tokenizer
+    from compiler import token_list
+    from parse import Parser
+    from generator import Generator
+    from regalloc import RegisterGenerator
+    from lowering import IRGenerator
+    from optimizer import Optimizer
+    from peephole import Peephole
+    from inliner import Inliner
+    from deadcode import DeadCodeEliminator
+
+    configurations = [
+        ('stack', Generator, False, False, False, False),
+        ('stack+peephole', Generator, False, True, False, False),
+        ('stack+optimize', Generator, True, True, False, False),
+        ('stack+inline', Generator, True, True, True, False),
+        ('stack+dce', Generator, False, False, False, True),
+        ('ir', IRGenerator, False, False, False, False),
+        ('ir+optimize', IRGenerator, True, True, False, False),
+        ('ir+inline', IRGenerator, True, True, True, False),
+        ('ir+dce', IRGenerator, True, True, True, True),
+        ('registers', RegisterGenerator, False, False, False, False),
+        ('registers+optimize', RegisterGenerator, True, True, False, False),
+        ('registers+inline', RegisterGenerator, True, True, True, False),
+        ('registers+dce', RegisterGenerator, True, True, True, True)
+    ]
+    files = sys.argv[1:] or ['algorithm.py'] + sorted(glob.glob('samples/*.py')) + sorted(glob.glob('samples/faults/*.py'))
+    failed = 0
+    print('{:<32}{:<20}{:>12}{:>10}{:>10}{:>8}  {}'.format('file', 'backend', 'executed', 'reads', 'writes', 'calls', 'result'))
+    for filename in files:
+        with open(filename, 'r') as file:
+            text = file.read().strip()
+        ast = Parser().parse(tokenizer.tokenize(text, token_list))
+        # Programs under samples/faults must fault in every configuration, no pass may remove the fault
+        faults = os.path.basename(os.path.dirname(filename)) == 'faults'
+        reference = None
+        for name, backend, optimize, peephole, inline, dce in configurations:
+            program = Inliner().inline(ast) if inline else ast
+            program = Optimizer().optimize(program) if optimize else program
+            program = DeadCodeEliminator().eliminate(program) if dce else program
+            generator = backend(Peephole() if peephole else None, optimize)
+            generator.tail_calls = inline
+            emulator = Emulator(generator.generate(program))
+            try:
+                output = emulator.run()
+            except EmulatorError as e:
+                if not faults:
+                    failed += 1
+                print('{:<32}{:<20}{}{}'.format(filename, name, e, ', as expected' if faults else ''))
+                continue
+            if faults:
+                failed += 1
+                status = 'NO FAULT, printed {}'.format(output)
+            elif reference == None:
+                reference = output
+                # Only informative: the language wraps at 32 bits and differs from Python in places
+                status = 'reference, {} CPython'.format('matches' if python_output(text) == output else 'differs from')
+            elif output == reference:
+                status = 'ok'
+            else:
+                failed += 1
+                status = 'MISMATCH {} != {}'.format(output, reference)
+            print('{:<32}{:<20}{:>12}{:>10}{:>10}{:>8}  {}'.format(filename, name, emulator.instructions, emulator.reads, emulator.writes, emulator.calls, status))
+    sys.exit(1 if failed else 0)
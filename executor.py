@@ -0,0 +1,457 @@
+import sys, operator
+from nodes import *
+from generator import SemanticError
+from optimizer import wrap
+
+class ExecutorError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return 'ExecutorError: {}'.format(self.msg)
+
+low = -2 ** 31
+high = 2 ** 31 - 1
+
+def remainder(a, b):
+    if b == 0:
+        raise ExecutorError('Division by zero')
+    if a == low and b == -1:
+        raise ExecutorError('Division overflow')
+    # idiv truncates, so the remainder takes the sign of the dividend
+    value = abs(a) % abs(b)
+    return -value if a < 0 else value
+
+def multiply(a, b):
+    value = a * b
+    return value if low <= value <= high else wrap(value)
+
+comparisons = {
+    LESS: operator.lt,
+    GREATER: operator.gt,
+    EQUALS: operator.eq
+}
+
+def returns(node):
+    if node.kind == RETURN:
+        return True
+    if node.kind in (IF, WHILE):
+        return any(returns(x) for x in node.body)
+    return False
+
+class Executor:
+    # Compiles the AST into nested closures over list frames, with every
+    # variable resolved to a slot index before the program runs
+    def __init__(self, ast, recursion_limit=10 ** 6):
+        self.recursion_limit = recursion_limit
+        self.functions = {}
+        self.output = []
+        self.calls = 0
+        self.main = None
+        self.__compile(ast)
+
+    def __function_cell(self, name):
+        # Calls go through a cell so they can be compiled before their callee
+        cell = self.functions.get(name)
+        if cell == None:
+            cell = self.functions[name] = [None, name]
+        return cell
+
+    def __compile(self, ast):
+        defined = set()
+        main_function = Function('main', [], [])
+        for node in ast:
+            if node.kind == FUNCTION:
+                if node.name in defined:
+                    raise SemanticError('Function "{}" is already defined'.format(node.name))
+                defined.add(node.name)
+                self.__function_cell(node.name)[0] = self.__function(node)
+            else:
+                main_function.body.append(node)
+        main_function.body.append(Return(Number('0')))
+        self.main = self.__function(main_function)
+
+    def __function(self, function):
+        name = function.name
+        count = len(function.parameters)
+        slots = {}
+        for parameter in function.parameters:
+            slots.setdefault(parameter, len(slots))
+        body = self.__block(function.body, slots)
+        size = len(slots)
+        executor = self
+
+        def invoke(args):
+            if len(args) != count:
+                raise ExecutorError('Function "{}" takes {} arguments, {} given'.format(name, count, len(args)))
+            frame = [0] * size
+            # The first parameter is bound to the last argument pushed
+            frame[:count] = args[::-1]
+            executor.calls += 1
+            result = body(frame)
+            if result == None:
+                raise ExecutorError('Function "{}" ended without a return'.format(name))
+            return result
+        return invoke
+
+    def __block(self, body, slots):
+        statements = [self.__statement(node, slots) for node in body]
+        if len(statements) == 1:
+            return statements[0]
+
+        def block(frame):
+            for statement in statements:
+                result = statement(frame)
+                if result != None:
+                    return result
+        return block
+
+    def __condition(self, node, slots):
+        expression = self.__expression(node, slots)
+        if node.kind in (LESS, GREATER, EQUALS):
+            return expression
+        return lambda frame: expression(frame) != 0
+
+    def __statement(self, node, slots):
+        kind = node.kind
+
+        if kind == ASSIGNMENT:
+            fused = self.__fused_operands(node.value, slots)
+            value = self.__expression(node.value, slots)
+            slot = slots.setdefault(node.name, len(slots))
+            if node.ternary == None:
+                if fused != None:
+                    return self.__fast_assign(node.value.kind, slot, fused[0], fused[1])
+                def assign(frame):
+                    frame[slot] = value(frame)
+                return assign
+            ternary = self.__statement(node.ternary, slots)
+
+            def assign_ternary(frame):
+                frame[slot] = value(frame)
+                ternary(frame)
+            return assign_ternary
+
+        if kind == RETURN:
+            expression = self.__expression(node.expression, slots)
+            return expression
+
+        if kind == PRINT:
+            expression = self.__expression(node.expression, slots)
+            executor = self
+
+            def print_value(frame):
+                executor.output.append(int(expression(frame)))
+            return print_value
+
+        if kind == IF:
+            compare = self.__comparison(node.condition, slots)
+            condition = self.__condition(node.condition, slots)
+            body = self.__block(node.body, slots)
+            if compare != None:
+                test, a, b, constant = compare
+                if constant:
+                    def if_constant(frame):
+                        if test(frame[a], b):
+                            return body(frame)
+                    return if_constant
+
+                def if_slots(frame):
+                    if test(frame[a], frame[b]):
+                        return body(frame)
+                return if_slots
+
+            def if_statement(frame):
+                if condition(frame):
+                    return body(frame)
+            return if_statement
+
+        if kind == WHILE:
+            # The test follows the body in the generated code, check it in source order
+            self.__check_defined(node.condition, slots)
+
+            statements = [self.__statement(x, slots) for x in node.body]
+            compare = self.__comparison(node.condition, slots)
+            if compare != None and not any(returns(x) for x in node.body):
+                # Nothing in the body can return, so no result needs checking
+                test, a, b, constant = compare
+                if constant:
+                    def loop_constant(frame):
+                        while test(frame[a], b):
+                            for statement in statements:
+                                statement(frame)
+                    return loop_constant
+
+                def loop_slots(frame):
+                    while test(frame[a], frame[b]):
+                        for statement in statements:
+                            statement(frame)
+                return loop_slots
+            if compare != None:
+                test, a, b, constant = compare
+                if constant:
+                    def while_constant(frame):
+                        while test(frame[a], b):
+                            for statement in statements:
+                                result = statement(frame)
+                                if result != None:
+                                    return result
+                    return while_constant
+
+                def while_slots(frame):
+                    while test(frame[a], frame[b]):
+                        for statement in statements:
+                            result = statement(frame)
+                            if result != None:
+                                return result
+                return while_slots
+            condition = self.__condition(node.condition, slots)
+
+            # The body is run inline, a block closure per iteration is measurable in tight loops
+            def while_statement(frame):
+                while condition(frame):
+                    for statement in statements:
+                        result = statement(frame)
+                        if result != None:
+                            return result
+            return while_statement
+
+        raise SemanticError('Unknow operation "{}"'.format(kind_names[kind]))
+
+    def __check_defined(self, node, slots):
+        if node.kind == ID:
+            if node.name not in ('True', 'False') and node.name not in slots:
+                raise SemanticError('Variable "{}" is undefined'.format(node.name))
+        elif node.kind == FUNCTION_CALL:
+            for parameter in node.parameters:
+                self.__check_defined(parameter, slots)
+        elif node.kind in binary_ops:
+            self.__check_defined(node.op1, slots)
+            self.__check_defined(node.op2, slots)
+
+    def __operand(self, node, slots):
+        # Slot index or constant for operands that need no closure of their own
+        if node.kind == NUMBER:
+            return ('constant', wrap(int(node.value)))
+        if node.kind == ID:
+            if node.name == 'True':
+                return ('constant', 1)
+            if node.name == 'False':
+                return ('constant', 0)
+            if node.name not in slots:
+                raise SemanticError('Variable "{}" is undefined'.format(node.name))
+            return ('slot', slots[node.name])
+        return None
+
+    def __expression(self, node, slots):
+        kind = node.kind
+
+        operand = self.__operand(node, slots)
+        if operand != None:
+            value = operand[1]
+            if operand[0] == 'constant':
+                return lambda frame: value
+            return lambda frame: frame[value]
+
+        if kind == FUNCTION_CALL:
+            cell = self.__function_cell(node.name)
+            arguments = [self.__expression(x, slots) for x in node.parameters]
+
+            def call(frame):
+                function = cell[0]
+                if function == None:
+                    raise ExecutorError('Function "{}" is undefined'.format(cell[1]))
+                return function([x(frame) for x in arguments])
+            return call
+
+        if kind == SHL:
+            op1 = self.__expression(node.op1, slots)
+            shift = int(node.op2.value)
+            return lambda frame: wrap(op1(frame) << shift)
+
+        if kind == MASK:
+            op1 = self.__expression(node.op1, slots)
+            mask = int(node.op2.value)
+
+            def mask_value(frame):
+                value = op1(frame)
+                bias = mask if value < 0 else 0
+                return ((value + bias) & mask) - bias
+            return mask_value
+
+        if kind in binary_ops:
+            left = self.__operand(node.op1, slots)
+            right = self.__operand(node.op2, slots)
+            if kind in (PLUS, MINUS, LESS, GREATER, EQUALS) and left != None and left[0] == 'slot' and right != None:
+                return self.__fast_binary(kind, left[1], right)
+            return self.__binary(kind, self.__expression(node.op1, slots), self.__expression(node.op2, slots))
+
+        raise SemanticError('Unknow operation "{}"'.format(kind_names[kind]))
+
+    def __comparison(self, node, slots):
+        # A comparison of a slot with a slot or a constant, tested without a closure call
+        if node.kind not in comparisons:
+            return None
+        left = self.__operand(node.op1, slots)
+        right = self.__operand(node.op2, slots)
+        if left == None or left[0] != 'slot' or right == None:
+            return None
+        return comparisons[node.kind], left[1], right[1], right[0] == 'constant'
+
+    def __fused_operands(self, node, slots):
+        # Both operands of an arithmetic node as slots or constants, with a slot on the left
+        if node.kind not in (PLUS, MINUS, PERCENT):
+            return None
+        left = self.__operand(node.op1, slots)
+        right = self.__operand(node.op2, slots)
+        if left == None or left[0] != 'slot' or right == None:
+            return None
+        return left[1], right
+
+    def __fast_assign(self, kind, slot, a, right):
+        # The assignment and its arithmetic in one closure
+        b = right[1]
+        if right[0] == 'constant':
+            if kind == PLUS:
+                def assign_plus(frame):
+                    value = frame[a] + b
+                    frame[slot] = value if low <= value <= high else wrap(value)
+                return assign_plus
+            if kind == MINUS:
+                def assign_minus(frame):
+                    value = frame[a] - b
+                    frame[slot] = value if low <= value <= high else wrap(value)
+                return assign_minus
+            if b > 0:
+                def assign_percent(frame):
+                    value = frame[a]
+                    frame[slot] = value % b if value >= 0 else remainder(value, b)
+                return assign_percent
+            return lambda frame: frame.__setitem__(slot, remainder(frame[a], b))
+
+        if kind == PLUS:
+            def assign_plus_slots(frame):
+                value = frame[a] + frame[b]
+                frame[slot] = value if low <= value <= high else wrap(value)
+            return assign_plus_slots
+        if kind == MINUS:
+            def assign_minus_slots(frame):
+                value = frame[a] - frame[b]
+                frame[slot] = value if low <= value <= high else wrap(value)
+            return assign_minus_slots
+
+        def assign_percent_slots(frame):
+            value = frame[a]
+            divisor = frame[b]
+            # Python and idiv agree when neither operand is negative
+            frame[slot] = value % divisor if value >= 0 and divisor > 0 else remainder(value, divisor)
+        return assign_percent_slots
+
+    def __fast_binary(self, kind, a, right):
+        # A variable against a variable or a constant, the shape of most loop code
+        b = right[1]
+        if right[0] == 'constant':
+            if kind == PLUS:
+                def plus(frame):
+                    value = frame[a] + b
+                    return value if low <= value <= high else wrap(value)
+                return plus
+            if kind == MINUS:
+                def minus(frame):
+                    value = frame[a] - b
+                    return value if low <= value <= high else wrap(value)
+                return minus
+            if kind == LESS:
+                return lambda frame: frame[a] < b
+            if kind == GREATER:
+                return lambda frame: frame[a] > b
+            return lambda frame: frame[a] == b
+
+        if kind == PLUS:
+            def plus_slots(frame):
+                value = frame[a] + frame[b]
+                return value if low <= value <= high else wrap(value)
+            return plus_slots
+        if kind == MINUS:
+            def minus_slots(frame):
+                value = frame[a] - frame[b]
+                return value if low <= value <= high else wrap(value)
+            return minus_slots
+        if kind == LESS:
+            return lambda frame: frame[a] < frame[b]
+        if kind == GREATER:
+            return lambda frame: frame[a] > frame[b]
+        return lambda frame: frame[a] == frame[b]
+
+    def __binary(self, kind, op1, op2):
+        if kind == PLUS:
+            def plus(frame):
+                value = op1(frame) + op2(frame)
+                return value if low <= value <= high else wrap(value)
+            return plus
+        if kind == MINUS:
+            def minus(frame):
+                value = op1(frame) - op2(frame)
+                return value if low <= value <= high else wrap(value)
+            return minus
+        if kind == MUL:
+            return lambda frame: multiply(op1(frame), op2(frame))
+        if kind == PERCENT:
+            return lambda frame: remainder(op1(frame), op2(frame))
+        if kind == LESS:
+            return lambda frame: op1(frame) < op2(frame)
+        if kind == GREATER:
+            return lambda frame: op1(frame) > op2(frame)
+        return lambda frame: op1(frame) == op2(frame)
+
+    def run(self):
+        self.output = []
+        self.calls = 0
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, self.recursion_limit))
+        try:
+            self.main([])
+        except RecursionError:
+            raise ExecutorError('Call stack overflow')
+        finally:
+            sys.setrecursionlimit(limit)
+        return self.output
+
+if __name__ == '__main__':
+    import time, argparse
+    import tokenizer
+    from compiler import token_list
+    from parse import Parser, ParseError
+    from optimizer import Optimizer
+    from inliner import Inliner
+
+    parser = argparse.ArgumentParser(description='Run programs without assembling them')
+    parser.add_argument('inputs', nargs='*', default=['algorithm.py'])
+    parser.add_argument('--optimize', action='store_true', help='run the optimized tree')
+    parser.add_argument('--inline', action='store_true', help='run the tree after inlining')
+    parser.add_argument('--time', action='store_true', help='print the compile and run times')
+    args = parser.parse_args()
+
+    failed = 0
+    for filename in args.inputs:
+        try:
+            with open(filename, 'r') as file:
+                ast = Parser().parse(tokenizer.tokenize(file.read().strip(), token_list))
+            if args.inline:
+                ast = Inliner().inline(ast)
+            if args.optimize:
+                ast = Optimizer().optimize(ast)
+            start = time.perf_counter()
+            executor = Executor(ast)
+            compiled = time.perf_counter()
+            output = executor.run()
+            finished = time.perf_counter()
+        except (OSError, tokenizer.TokenError, ParseError, SemanticError, ExecutorError) as e:
+            failed += 1
+            print('{}: {}'.format(filename, e))
+            continue
+        for value in output:
+            print(value)
+        if args.time:
+            print('{}: compiled in {:.2f} ms, ran in {:.2f} ms, {} calls'.format(filename, (compiled - start) * 1000, (finished - compiled) * 1000, executor.calls))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,119 @@
+from nodes import *
+
+class Interval:
+    __slots__ = ('name', 'start', 'end', 'weight', 'crosses_call', 'register')
+
+    def __init__(self, name, start):
+        self.name = name
+        self.start = start
+        self.end = start
+        self.weight = 0
+        self.crosses_call = False
+        self.register = None
+
+class LiveIntervals:
+    def __init__(self, function):
+        self.intervals = {}
+        self.calls = []
+        self.position = 0
+        self.loops = []
+
+        for parameter in function.parameters:
+            self.__touch(parameter, -1)
+        self.__walk(function.body)
+
+        for interval in self.intervals.values():
+            interval.crosses_call = any(interval.start <= p <= interval.end for p in self.calls)
+
+    def __touch(self, name, pos):
+        interval = self.intervals.get(name)
+        if interval == None:
+            interval = Interval(name, pos)
+            self.intervals[name] = interval
+        interval.end = max(interval.end, pos)
+        interval.weight += 10 ** len(self.loops)
+        if self.loops:
+            self.loops[0][1].add(name)
+
+    def __expression(self, node, pos):
+        kind = node.kind
+        if kind == ID:
+            if node.name not in ('True', 'False'):
+                self.__touch(node.name, pos)
+        elif kind == FUNCTION_CALL:
+            self.calls.append(pos)
+            for parameter in node.parameters:
+                self.__expression(parameter, pos)
+        elif kind in binary_ops:
+            self.__expression(node.op1, pos)
+            self.__expression(node.op2, pos)
+
+    def __walk(self, body):
+        for node in body:
+            pos = self.position
+            self.position += 1
+            kind = node.kind
+
+            if kind == ASSIGNMENT:
+                self.__expression(node.value, pos)
+                self.__touch(node.name, pos)
+                if node.ternary != None:
+                    self.__walk([node.ternary])
+            elif kind == RETURN:
+                self.__expression(node.expression, pos)
+            elif kind == PRINT:
+                self.calls.append(pos)
+                self.__expression(node.expression, pos)
+            elif kind == IF:
+                self.__expression(node.condition, pos)
+                self.__walk(node.body)
+            elif kind == WHILE:
+                self.loops.append((pos, set()))
+                self.__expression(node.condition, pos)
+                self.__walk(node.body)
+                start, names = self.loops.pop()
+                # Values must survive the back edge, so cover the whole loop
+                if not self.loops:
+                    for name in names:
+                        interval = self.intervals[name]
+                        interval.start = min(interval.start, start)
+                        interval.end = max(interval.end, self.position - 1)
+
+class FrameLayout:
+    # Gives every local of a function an ebp offset before any code is emitted,
+    # locals whose live intervals do not overlap share a slot
+    def __init__(self, function, reserved=0, intervals=None, skip=()):
+        if intervals == None:
+            intervals = LiveIntervals(function).intervals
+        self.reserved = reserved
+        self.slots = {}
+
+        parameters = set(function.parameters)
+        names = [x for x in assigned_locals(function.body, []) if x not in parameters and x not in skip]
+        # Greedy by start, a slot is free again once its last interval has ended
+        ends = []
+        for name in sorted(names, key=lambda x: intervals[x].start):
+            interval = intervals[name]
+            free = [slot for slot, end in enumerate(ends) if end < interval.start]
+            if free:
+                slot = free[0]
+            else:
+                slot = len(ends)
+                ends.append(None)
+            ends[slot] = interval.end
+            self.slots[name] = slot
+        self.size = len(ends)
+
+    def offset(self, name):
+        return -4 * (self.reserved + self.slots[name] + 1)
+
+def assigned_locals(body, names):
+    for node in body:
+        if node.kind == ASSIGNMENT:
+            if node.name not in names:
+                names.append(node.name)
+            if node.ternary != None:
+                assigned_locals([node.ternary], names)
+        elif node.kind in (IF, WHILE):
+            assigned_locals(node.body, names)
+    return names
@@ -1,271 +1,591 @@
-class SemanticError(Exception):
-    def __init__(self, msg):
-        self.msg = msg
-    
-    def __str__(self):
-        return 'SemanticError: {}'.format(self.msg)
+import time
+from concurrent.futures import ProcessPoolExecutor
+from nodes import *
+from emitter import *
+from loops import LoopAnalysis
+from frame import FrameLayout
+from targets import targets
+from semantics import SemanticError, check_defined
+
+# Jump taken when a comparison holds and when it does not
+jumps = {
+    LESS: ('jl', 'jge'),
+    GREATER: ('jg', 'jle'),
+    EQUALS: ('je', 'jne')
+}
+
+loop_registers = ['esi', 'edi', 'ecx']
+
+def contains_loop(body):
+    for node in body:
+        if node.kind == WHILE or (node.kind == IF and contains_loop(node.body)):
+            return True
+    return False
+
+def called_functions(body, names):
+    for node in body:
+        if node.kind == FUNCTION_CALL:
+            names.add(node.name)
+            called_functions(node.parameters, names)
+        elif node.kind in binary_ops:
+            called_functions([node.op1, node.op2], names)
+        elif node.kind in (RETURN, PRINT):
+            called_functions([node.expression], names)
+        elif node.kind == ASSIGNMENT:
+            called_functions([node.value], names)
+            if node.ternary != None:
+                called_functions([node.ternary], names)
+        elif node.kind in (IF, WHILE):
+            called_functions([node.condition], names)
+            called_functions(node.body, names)
+    return names
+
+def has_tail_call(body, function):
+    for node in body:
+        if node.kind == RETURN:
+            expression = node.expression
+            if expression.kind == FUNCTION_CALL and expression.name == function.name \
+                    and len(expression.parameters) == len(function.parameters):
+                return True
+        elif node.kind in (IF, WHILE) and has_tail_call(node.body, function):
+            return True
+    return False
+
+def generate_chunk(generator, functions):
+    # Runs in a pool worker; an error is returned in place so the caller raises the first one in source order
+    fragments = []
+    for function in functions:
+        try:
+            before = len(generator.tail_jumps)
+            lines = generator.function_lines(function)
+            fragments.append((lines, len(generator.tail_jumps) - before))
+        except SemanticError as e:
+            fragments.append(e)
+            break
+    generator.emit = None
+    return fragments, generator
 
 class Generator:
-    text_start = """
-.386
-.model flat, stdcall
-include \masm32\include\masm32rt.inc
-main proto
-.data
-.code
-__print proc
-    push  ebp 
-    mov   ebp, esp
-    fn MessageBox, 0, str$(8[ebp]), "Result", MB_OK
-    pop   ebp
-    ret
-__print endp
-start:
-invoke main
-invoke ExitProcess, 0
-"""
-    
-    binary_ops = [
-        'plus',
-        'minus',
-        'mul',
-        'percent',
-        'less',
-        'greater',
-        'equals'
-    ]
-    
-    def __init__(self):
+    def __init__(self, peephole=None, loops=False, fragment_limit=1024):
         self.function_ids = []
+        self.function = None
+        self.parameters = []
         self.jmp_counter = 0
+        self.emit = None
+        self.peephole = peephole
+        self.loops = loops
+        self.cache = {}
+        self.hoisted = {}
+        self.saves_registers = False
+        self.fragments = {}
+        self.fragment_limit = fragment_limit
+        self.generated = 0
+        self.reused = 0
+        self.profiler = None
+        self.tail_calls = False
+        self.tail_jumps = []
+        self.target = targets['masm']
+        self.jobs = 1
+        self.parallel_threshold = 64
+    
+    def is_tail_call(self, expression):
+        return self.tail_calls and expression.kind == FUNCTION_CALL and expression.name == self.function \
+            and len(expression.parameters) == len(self.parameters)
+    
+    def next_label(self):
+        # Labels are numbered per function so that cached fragments stay valid
+        self.jmp_counter += 1
+        return '{}_{}'.format(self.function, self.jmp_counter)
     
     def __generate_expression(self, node, variables):
-        type = node['type']
+        kind = node.kind
+        emit = self.emit
+        
+        if self.hoisted and kind in binary_ops:
+            register = self.hoisted.get(key(node))
+            if register != None:
+                emit('push {}'.format(register))
+                return
         
-        if type == 'number':
-            return ['push {}'.format(node['value'])]
+        if kind == NUMBER:
+            emit('push {}'.format(node.value))
+            return
         
-        if type == 'id':
-            name = node['name']
+        if kind == ID:
+            name = node.name
             
             if name == 'True':
-                return ['push 1']
+                emit('push 1')
+                return
             elif name == 'False':
-                return ['push 0']
+                emit('push 0')
+                return
+            
+            if name in self.cache:
+                emit('push {}'.format(self.cache[name]))
+                return
             
             if name not in variables[1]:
                 raise SemanticError('Variable "{}" is undefined'.format(name))
-            return [
+            emit(
                 'mov eax, [ebp{:+}]'.format(variables[1][name]),
                 'push eax'
-            ]
+            )
+            return
         
-        if type == 'function_call':    
-            name = node['name']
-            parameters = node['parameters']
-            code = []
+        if kind == FUNCTION_CALL:    
+            name = node.name
+            parameters = node.parameters
             for parameter in parameters:
-                code.extend(self.__generate_expression(parameter, variables))
-            return code + [
+                self.__generate_expression(parameter, variables)
+            emit(
                 'call {}'.format(name),
                 'add esp, {}'.format(4 * len(parameters)),
                 'push ebx'
-            ]
+            )
+            return
         
-        if type in self.binary_ops:
-            op1 = self.__generate_expression(node['op1'], variables)
-            op2 = self.__generate_expression(node['op2'], variables)
+        if kind == SHL:
+            self.__generate_expression(node.op1, variables)
+            emit(
+                'pop eax',
+                'shl eax, {}'.format(node.op2.value),
+                'push eax'
+            )
+            return
+        
+        if kind == MASK:
+            self.__generate_expression(node.op1, variables)
+            emit(
+                'pop eax',
+                'cdq',
+                'and edx, {}'.format(node.op2.value),
+                'add eax, edx',
+                'and eax, {}'.format(node.op2.value),
+                'sub eax, edx',
+                'push eax'
+            )
+            return
+        
+        if kind in binary_ops:
+            self.__generate_expression(node.op1, variables)
+            self.__generate_expression(node.op2, variables)
             
-            if type == 'plus':
-                return op1 + op2 + [
+            if kind == PLUS:
+                emit(
                     'pop eax',
                     'pop ebx',
                     'add ebx, eax',
                     'push ebx'
-                ]
+                )
             
-            if type == 'minus':
-                return op1 + op2 + [
+            elif kind == MINUS:
+                emit(
                     'pop eax',
                     'pop ebx',
                     'sub ebx, eax',
                     'push ebx'
-                ]
+                )
             
-            if type == 'mul':
-                return op1 + op2 + [
+            elif kind == MUL:
+                emit(
                     'pop ebx',
                     'pop eax',
                     'mul ebx',
                     'push eax'
-                ]
+                )
             
-            if type == 'percent':
-                return op1 + op2 + [
+            elif kind == PERCENT:
+                emit(
                     'pop ebx',
                     'pop eax',
                     'cdq',
                     'idiv ebx',
                     'push edx'
-                ]
+                )
             
-            if type == 'less':
-                return op1 + op2 + [
+            elif kind == LESS:
+                emit(
                     'pop ebx',
                     'pop eax',
                     'cmp eax, ebx',
                     'mov eax, 0',
                     'setl al',
                     'push eax'
-                ]
+                )
             
-            if type == 'greater':
-                return op1 + op2 + [
+            elif kind == GREATER:
+                emit(
                     'pop ebx',
                     'pop eax',
                     'cmp eax, ebx',
                     'mov eax, 0',
                     'setg al',
                     'push eax'
-                ]
+                )
             
-            if type == 'equals':
-                return op1 + op2 + [
+            elif kind == EQUALS:
+                emit(
                     'pop ebx',
                     'pop eax',
                     'cmp eax, ebx',
                     'mov eax, 0',
                     'sete al',
                     'push eax'
-                ]
+                )
+            return
+        
+        raise SemanticError('Unknow operation "{}"'.format(kind_names[kind]))
+    
+    def __register(self, node):
+        if node.kind == ID:
+            return self.cache.get(node.name)
+        if self.hoisted and node.kind in binary_ops:
+            return self.hoisted.get(key(node))
+        return None
+    
+    def __generate_branch(self, condition, variables, label, jump_if):
+        if condition.kind in jumps:
+            left = self.__register(condition.op1)
+            right = self.__register(condition.op2)
+            if right == None and condition.op2.kind == NUMBER:
+                right = condition.op2.value
+            if left != None and right != None:
+                self.emit(
+                    'cmp {}, {}'.format(left, right),
+                    '{} {}'.format(jumps[condition.kind][0 if jump_if else 1], label)
+                )
+                return
+            
+            self.__generate_expression(condition.op1, variables)
+            self.__generate_expression(condition.op2, variables)
+            self.emit(
+                'pop ebx',
+                'pop eax',
+                'cmp eax, ebx',
+                '{} {}'.format(jumps[condition.kind][0 if jump_if else 1], label)
+            )
+            return
         
-        raise SemanticError('Unknow operation "{}"'.format(type))
+        self.__generate_expression(condition, variables)
+        self.emit(
+            'pop eax',
+            'cmp eax, 0',
+            '{} {}'.format('jne' if jump_if else 'je', label)
+        )
     
     def __generate_inner(self, node, variables):
-        type = node['type']
+        if self.profiler == None:
+            self.__generate_statement(node, variables)
+            return
+        self.profiler.enter()
+        self.__generate_statement(node, variables)
+        self.profiler.leave(kind_names[node.kind])
+    
+    def __generate_statement(self, node, variables):
+        kind = node.kind
+        emit = self.emit
         
-        if type == 'return':
-            return self.__generate_expression(node['expression'], variables) + [
-                'pop ebx',
+        if kind == RETURN:
+            if self.is_tail_call(node.expression):
+                # A self call in tail position reuses the frame and jumps back to the start
+                for parameter in node.expression.parameters:
+                    self.__generate_expression(parameter, variables)
+                for i in range(len(self.parameters)):
+                    emit(
+                        'pop eax',
+                        'mov [ebp{:+}], eax'.format(8 + 4 * i)
+                    )
+                emit('mov esp, ebp')
+                if self.saves_registers:
+                    emit('sub esp, 8')
+                emit('jmp _tail_{}'.format(self.function))
+                self.tail_jumps.append(self.function)
+                return
+            self.__generate_expression(node.expression, variables)
+            emit('pop ebx')
+            if self.saves_registers:
+                emit(
+                    'mov esi, [ebp-4]',
+                    'mov edi, [ebp-8]'
+                )
+            emit(
                 'mov esp, ebp',
                 'pop ebp',
                 'ret'
-            ]
+            )
+            return
         
-        if type == 'assignment':
-            name = node['name']
-            node_value = node['value']
-            value = self.__generate_expression(node_value, variables)
-            ternary_operator = []
-            if 'ternary' in node:
-                ternary_operator = self.__generate_inner(node['ternary'], variables)
-            code = []
+        if kind == ASSIGNMENT:
+            name = node.name
             
-            if name not in variables[1]:
-                variables[0] -= 1
-                variables[1][name] = variables[0] * 4
-                code.append('sub esp, 4')
+            if name in self.cache:
+                # Only induction variables are cached and assigned inside a loop
+                register = self.cache[name]
+                step = int(node.value.op2.value)
+                if node.value.kind == MINUS:
+                    step = -step
+                if step == 1:
+                    emit('inc {}'.format(register))
+                elif step == -1:
+                    emit('dec {}'.format(register))
+                elif step != 0:
+                    emit('{} {}, {}'.format('add' if step > 0 else 'sub', register, abs(step)))
+                return
+            
+            slot = variables[1].get(name)
             
-            code.extend(value)
+            if slot == None:
+                slot = variables[0].offset(name)
             
-            return code + [
+            self.__generate_expression(node.value, variables)
+            variables[1][name] = slot
+            emit(
                 'pop ebx',
-                'mov [ebp{:+}], ebx'.format(variables[1][name])
-            ] + ternary_operator
+                'mov [ebp{:+}], ebx'.format(slot)
+            )
+            if node.ternary != None:
+                self.__generate_inner(node.ternary, variables)
+            return
         
-        if type == 'if':
-            condition = self.__generate_expression(node['condition'], variables)
-            body = []
-            for inner_node in node['body']:
-                body.extend(self.__generate_inner(inner_node, variables))
-            self.jmp_counter += 1
-            return condition + [
-                'pop ebx',
-                'cmp ebx, 0',
-                'je _if_end_{}'.format(self.jmp_counter)
-            ] + body + [
-                '_if_end_{}:'.format(self.jmp_counter)
-            ]
+        if kind == IF:
+            label = self.next_label()
+            self.__generate_branch(node.condition, variables, '_if_end_{}'.format(label), False)
+            for inner_node in node.body:
+                self.__generate_inner(inner_node, variables)
+            emit('_if_end_{}:'.format(label))
+            return
         
-        if type == 'while':
-            condition = self.__generate_expression(node['condition'], variables)
-            body = []
-            for inner_node in node['body']:
-                body.extend(self.__generate_inner(inner_node, variables))
-            self.jmp_counter += 1
-            return ['_while_{}:'.format(self.jmp_counter)] + condition + [
-                'pop eax',
-                'cmp eax, 0',
-                'je _while_end_{}'.format(self.jmp_counter)
-            ] + body + [
-                'jmp _while_{}'.format(self.jmp_counter),
-                '_while_end_{}:'.format(self.jmp_counter)
-            ]
+        if kind == WHILE:
+            label = self.next_label()
+            # The test is emitted after the body, so check it in source order
+            check_defined(node.condition, variables[1])
+            outer = self.__cache_loop(node, variables) if self.loops else None
+            emit(
+                'jmp _while_test_{}'.format(label),
+                '_while_{}:'.format(label)
+            )
+            for inner_node in node.body:
+                self.__generate_inner(inner_node, variables)
+            emit('_while_test_{}:'.format(label))
+            self.__generate_branch(node.condition, variables, '_while_{}'.format(label), True)
+            if outer != None:
+                self.__release_loop(outer, variables)
+            return
+        
+        if kind == PRINT:
+            self.__generate_expression(node.expression, variables)
+            emit('call __print')
+            return
+        
+        raise SemanticError('Unknow operation "{}"'.format(kind_names[kind]))
+    
+    def __cache_loop(self, loop, variables):
+        analysis = LoopAnalysis(loop)
+        busy = set(self.cache.values()) | set(self.hoisted.values())
+        free = [r for r in loop_registers if r not in busy and (r != 'ecx' or not analysis.has_calls)]
         
-        if type == 'print':
-            return self.__generate_expression(node['expression'], variables) + [
-                'call __print'
-            ]
+        candidates = []
+        for name in sorted(analysis.inductions | analysis.invariants):
+            if name in variables[1] and name not in self.cache:
+                candidates.append((analysis.uses.get(name, 0) + (name in analysis.inductions), name))
+        for node, count in analysis.hoistable():
+            if key(node) not in self.hoisted:
+                candidates.append((3 * count, node))
+        candidates.sort(key=lambda x: -x[0])
         
-        raise SemanticError('Unknow operation "{}"'.format(type))
+        outer = (self.cache, self.hoisted, [])
+        self.cache = dict(self.cache)
+        self.hoisted = dict(self.hoisted)
+        for weight, item in candidates[:len(free)]:
+            register = free.pop(0)
+            if isinstance(item, str):
+                self.emit('mov {}, [ebp{:+}]'.format(register, variables[1][item]))
+                self.cache[item] = register
+                if item in analysis.inductions:
+                    outer[2].append((item, register))
+            else:
+                self.__generate_expression(item, variables)
+                self.emit('pop {}'.format(register))
+                self.hoisted[key(item)] = register
+        return outer
     
-    def __generate_function(self, function):
-        name = function['name']
-        parameters = function['parameters']
-        variables = [0, {}]
+    def __release_loop(self, outer, variables):
+        # Induction variables live in registers until the loop exits
+        for name, register in outer[2]:
+            self.emit('mov [ebp{:+}], {}'.format(variables[1][name], register))
+        self.cache, self.hoisted = outer[0], outer[1]
+    
+    def generate_function(self, function):
+        name = function.name
+        parameters = function.parameters
         
-        code = [
-            '{} proc'.format(name),
+        self.emit(
+            *self.target.begin_function(name),
             'push ebp',
             'mov ebp, esp'
-        ]
+        )
+        
+        # Loops may pin values in esi/edi, which callers expect to survive
+        self.saves_registers = self.loops and contains_loop(function.body)
+        if self.saves_registers:
+            self.emit(
+                'push esi',
+                'push edi'
+            )
+        
+        if self.tail_calls and has_tail_call(function.body, function):
+            self.emit('_tail_{}:'.format(name))
+        
+        # Every local has its offset before the body is emitted, so the frame is reserved once
+        layout = FrameLayout(function, 2 if self.saves_registers else 0)
+        if layout.size:
+            self.emit('sub esp, {}'.format(4 * layout.size))
+        variables = [layout, {}]
         
         i = 2
         for parameter in parameters:
             variables[1][parameter] = i * 4
             i += 1
         
-        for node in function['body']:
-            code.extend(self.__generate_inner(node, variables))
+        for node in function.body:
+            self.__generate_inner(node, variables)
             
-        code.append('{} endp'.format(name))
+        self.emit(*self.target.end_function(name))
+    
+    def function_lines(self, function):
+        emitter = Emitter()
+        self.emit = emitter.emit
+        self.function = function.name
+        self.parameters = function.parameters
+        self.jmp_counter = 0
+        self.generate_function(function)
+        lines = emitter.lines
+        if self.peephole != None:
+            lines = self.peephole.optimize(lines)
+        return lines
+    
+    def __fragment_key(self, function, signatures):
+        callees = tuple(sorted((name, signatures.get(name)) for name in called_functions(function.body, set())))
+        return (key(function), callees, self.target.name)
+    
+    def __store(self, fragment_key, fragment, cached):
+        if not cached:
+            self.generated += 1
+            if len(self.fragments) >= self.fragment_limit:
+                del self.fragments[next(iter(self.fragments))]
+        else:
+            self.reused += 1
+        # Reinserting keeps the dictionary in least recently used order
+        self.fragments[fragment_key] = fragment
+    
+    def __fragment(self, function, signatures):
+        # A fragment is the emitted lines and the number of tail jumps made while emitting them
+        fragment_key = self.__fragment_key(function, signatures)
+        fragment = self.fragments.pop(fragment_key, None)
+        cached = fragment != None
+        start = time.perf_counter()
+        if not cached:
+            before = len(self.tail_jumps)
+            lines = self.function_lines(function)
+            fragment = (lines, len(self.tail_jumps) - before)
+        else:
+            self.tail_jumps.extend([function.name] * fragment[1])
+        if self.profiler != None:
+            self.profiler.function(function.name, start, time.perf_counter() - start, cached)
+        self.__store(fragment_key, fragment, cached)
+        return fragment[0]
+    
+    def worker(self):
+        # A fresh generator with the same settings, labels are numbered per function
+        # so its fragments stitch together exactly as the serial ones do
+        generator = type(self)(None if self.peephole == None else type(self.peephole)(self.peephole.rules), self.loops)
+        generator.tail_calls = self.tail_calls
+        generator.target = self.target
+        return generator
+    
+    def reset_counts(self):
+        # Counts describe the last generate call, also when the fragment cache is kept between calls
+        self.tail_jumps = []
+        self.generated = 0
+        self.reused = 0
+        if self.peephole != None:
+            self.peephole.hits = {name: 0 for name in self.peephole.hits}
+    
+    def merge(self, worker):
+        if self.peephole != None:
+            for name, hits in worker.peephole.hits.items():
+                self.peephole.hits[name] += hits
+    
+    def __parallel(self, functions, signatures):
+        # Only the functions missing from the fragment cache go to the pool, in contiguous
+        # chunks so that the workers are merged back in source order
+        keys = [self.__fragment_key(x, signatures) for x in functions]
+        reused = {}
+        for i, fragment_key in enumerate(keys):
+            fragment = self.fragments.pop(fragment_key, None)
+            if fragment != None:
+                reused[i] = fragment
+        missing = [i for i in range(len(keys)) if i not in reused]
+        generated = {}
+        if missing:
+            size = -(-len(missing) // (self.jobs * 4))
+            chunks = [missing[i:i + size] for i in range(0, len(missing), size)]
+            with ProcessPoolExecutor(min(self.jobs, len(chunks))) as executor:
+                results = executor.map(generate_chunk, [self.worker() for _ in chunks], [[functions[i] for i in chunk] for chunk in chunks])
+                for chunk, (fragments, worker) in zip(chunks, results):
+                    generated.update(zip(chunk, fragments))
+                    self.merge(worker)
         
-        return code
+        fragments = []
+        for i, fragment_key in enumerate(keys):
+            cached = i in reused
+            fragment = reused[i] if cached else generated.get(i)
+            if fragment == None:
+                # A worker stops at its first error
+                break
+            if isinstance(fragment, SemanticError):
+                fragments.append(fragment)
+                break
+            fragments.append(fragment[0])
+            self.tail_jumps.extend([functions[i].name] * fragment[1])
+            self.__store(fragment_key, fragment, cached)
+        return fragments
     
-    def generate(self, ast):
-        main_function = {
-            'type': 'function',
-            'name': 'main',
-            'parameters': [], 
-            'body': [] }
-        functions = []
+    def generate(self, ast, stream=None):
+        emitter = Emitter() if stream == None else StreamEmitter(stream)
+        self.function_ids = []
+        self.reset_counts()
         
+        main_function = Function('main', [], [])
+        functions = []
+        signatures = {}
         for node in ast:
-            if node['type'] == 'function':
-                if node['name'] in self.function_ids:
-                    raise SemanticError('Function "{}" is already defined'.format(node['name']))
-                functions.append(self.__generate_function(node))
-                self.function_ids.append(node['name'])
+            if node.kind == FUNCTION:
+                signatures[node.name] = tuple(node.parameters)
+                functions.append(node)
             else:
-                main_function['body'].append(node)
-        
-        main_function['body'].append({
-            'type': 'return', 
-            'expression': {
-                'type': 'number',
-                'value': '0'
-            }})
-        functions.append(self.__generate_function(main_function))
-        
-        code = []
-        for function in functions:
-            code.append('\n'.join(function))
-        
-        return "{}\n{}\n{}".format(self.text_start, '\n\n'.join(code), 'end start')
-        
-        
-        
-        
+                main_function.body.append(node)
+        main_function.body.append(Return(Number('0')))
+        functions.append(main_function)
         
+        # Node timings are collected in this process, so profiling stays serial
+        fragments = None
+        if self.jobs > 1 and self.profiler == None and len(functions) >= self.parallel_threshold:
+            fragments = self.__parallel(functions, signatures)
         
-        
\ No newline at end of file
+        emitter.emit(self.target.text_start)
+        for i, node in enumerate(functions):
+            if node is not main_function:
+                if node.name in self.function_ids:
+                    raise SemanticError('Function "{}" is already defined'.format(node.name))
+                self.function_ids.append(node.name)
+            lines = self.__fragment(node, signatures) if fragments == None else fragments[i]
+            if isinstance(lines, SemanticError):
+                raise lines
+            emitter.emit(*lines)
+            if node is not main_function:
+                emitter.emit('')
+        emitter.emit(self.target.text_end)
+        self.emit = None
+        return emitter.getvalue()
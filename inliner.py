@@ -0,0 +1,177 @@
+from nodes import *
+from generator import called_functions
+
+def has_return(body):
+    for node in body:
+        if node.kind == RETURN:
+            return True
+        if node.kind in (IF, WHILE) and has_return(node.body):
+            return True
+    return False
+
+class Inliner:
+    def __init__(self, limit=24):
+        self.limit = limit
+        self.functions = {}
+        self.graph = {}
+        self.counter = 0
+        self.inlined = []
+        self.skipped = []
+
+    def __reaches(self, start, target):
+        seen = set()
+        stack = list(self.graph.get(start, ()))
+        while stack:
+            name = stack.pop()
+            if name == target:
+                return True
+            if name in seen:
+                continue
+            seen.add(name)
+            stack.extend(self.graph.get(name, ()))
+        return False
+
+    def __reason(self, call, limit):
+        callee = self.functions.get(call.name)
+        if callee == None:
+            return 'undefined'
+        if self.__reaches(call.name, call.name):
+            return 'recursive'
+        if len(call.parameters) != len(callee.parameters):
+            return 'argument count'
+        if any(x.kind not in (ID, NUMBER) for x in call.parameters):
+            return 'complex argument'
+        body = callee.body
+        if not body or body[-1].kind != RETURN or has_return(body[:-1]):
+            return 'no single return'
+        if count_nodes(body) > limit:
+            return 'too large'
+        return None
+
+    def __name(self, name, names, prefix):
+        if name not in names:
+            names[name] = '{}.{}'.format(prefix, name)
+        return names[name]
+
+    def __rename(self, node, names, prefix):
+        if isinstance(node, list):
+            return [self.__rename(x, names, prefix) for x in node]
+        kind = node.kind
+        if kind == ID:
+            if node.name in ('True', 'False'):
+                return node
+            return Id(self.__name(node.name, names, prefix))
+        if kind == NUMBER:
+            return node
+        if kind == FUNCTION_CALL:
+            return FunctionCall(node.name, self.__rename(node.parameters, names, prefix))
+        if kind in binary_ops:
+            return BinaryOp(kind, self.__rename(node.op1, names, prefix), self.__rename(node.op2, names, prefix))
+        if kind == ASSIGNMENT:
+            ternary = self.__rename(node.ternary, names, prefix) if node.ternary != None else None
+            value = self.__rename(node.value, names, prefix)
+            return Assignment(self.__name(node.name, names, prefix), value, ternary)
+        if kind == RETURN:
+            return Return(self.__rename(node.expression, names, prefix))
+        if kind == PRINT:
+            return Print(self.__rename(node.expression, names, prefix))
+        if kind == IF:
+            return If(self.__rename(node.condition, names, prefix), self.__rename(node.body, names, prefix))
+        if kind == WHILE:
+            return While(self.__rename(node.condition, names, prefix), self.__rename(node.body, names, prefix))
+        return node
+
+    def __expand(self, call, caller, in_loop, statements):
+        # Returns the callee's result expression, or None when the call stays
+        limit = self.limit * 2 if in_loop else self.limit
+        reason = self.__reason(call, limit)
+        if reason != None:
+            self.skipped.append((caller, call.name, reason))
+            return None
+
+        callee = self.functions[call.name]
+        self.counter += 1
+        prefix = '{}.{}'.format(callee.name, self.counter)
+        names = {}
+        # The first parameter is bound to the last argument pushed
+        count = len(call.parameters)
+        for i, parameter in enumerate(callee.parameters):
+            statements.append(Assignment(self.__name(parameter, names, prefix), call.parameters[count - 1 - i]))
+        body = self.__rename(callee.body, names, prefix)
+        statements.extend(body[:-1])
+        self.inlined.append((caller, call.name))
+        return body[-1].expression
+
+    def __body(self, body, caller, in_loop):
+        result = []
+        for node in body:
+            kind = node.kind
+            if kind == ASSIGNMENT and node.value.kind == FUNCTION_CALL:
+                value = self.__expand(node.value, caller, in_loop, result)
+                if value != None:
+                    node = Assignment(node.name, value, node.ternary)
+            elif kind in (RETURN, PRINT) and node.expression.kind == FUNCTION_CALL:
+                value = self.__expand(node.expression, caller, in_loop, result)
+                if value != None:
+                    node = Return(value) if kind == RETURN else Print(value)
+            elif kind == IF:
+                condition = node.condition
+                if condition.kind == FUNCTION_CALL:
+                    value = self.__expand(condition, caller, in_loop, result)
+                    if value != None:
+                        condition = value
+                node = If(condition, self.__body(node.body, caller, in_loop))
+            elif kind == WHILE:
+                # The condition is evaluated on every iteration, so its calls stay
+                node = While(node.condition, self.__body(node.body, caller, True))
+            result.append(node)
+        return result
+
+    def __visit(self, name, order, seen):
+        if name in seen or name not in self.functions:
+            return
+        seen.add(name)
+        for callee in sorted(self.graph[name]):
+            self.__visit(callee, order, seen)
+        order.append(name)
+
+    def inline(self, ast):
+        functions = [x for x in ast if x.kind == FUNCTION]
+        names = [x.name for x in functions]
+        if len(set(names)) != len(names):
+            # The generator reports duplicate definitions
+            return ast
+
+        self.functions = {x.name: x for x in functions}
+        self.graph = {x.name: called_functions(x.body, set()) for x in functions}
+
+        # Callees are processed before their callers so inlined bodies are already expanded
+        order = []
+        seen = set()
+        for name in names:
+            self.__visit(name, order, seen)
+        for name in order:
+            function = self.functions[name]
+            self.functions[name] = Function(name, function.parameters, self.__body(function.body, name, False))
+
+        result = []
+        for node in ast:
+            if node.kind == FUNCTION:
+                result.append(self.functions[node.name])
+            else:
+                result.extend(self.__body([node], 'main', False))
+        return result
+
+    def report(self):
+        sites = {}
+        for caller, callee in self.inlined:
+            key = '{} -> {}'.format(caller, callee)
+            sites[key] = sites.get(key, 0) + 1
+        skipped = {}
+        for caller, callee, reason in self.skipped:
+            key = '{} -> {} ({})'.format(caller, callee, reason)
+            skipped[key] = skipped.get(key, 0) + 1
+        lines = ['Inlined: {}'.format(', '.join('{} x{}'.format(k, v) for k, v in sites.items()) or 'nothing')]
+        if skipped:
+            lines.append('Not inlined: {}'.format(', '.join('{} x{}'.format(k, v) for k, v in skipped.items())))
+        return lines
@@ -0,0 +1,334 @@
+from nodes import *
+from generator import SemanticError, check_defined
+
+# Operations without side effects, which may be removed when their result is unused
+pure_ops = ('copy', 'plus', 'minus', 'mul', 'percent', 'less', 'greater', 'equals', 'shl', 'mask')
+commutative_ops = ('plus', 'mul', 'equals')
+terminators = ('jump', 'branch', 'return')
+
+class Instruction:
+    __slots__ = ('op', 'dest', 'args')
+
+    def __init__(self, op, dest, args):
+        self.op = op
+        self.dest = dest
+        self.args = args
+
+    def uses(self):
+        if self.op == 'branch':
+            return [x for x in self.args[1:3] if isinstance(x, str)]
+        if self.op == 'jump':
+            return []
+        return [x for x in self.args if isinstance(x, str)]
+
+    def targets(self):
+        if self.op == 'jump':
+            return [self.args[0]]
+        if self.op == 'branch':
+            return [self.args[3], self.args[4]]
+        return []
+
+    def __repr__(self):
+        args = ', '.join(str(x) for x in self.args)
+        if self.dest != None:
+            return '{} = {} {}'.format(self.dest, self.op, args)
+        return '{} {}'.format(self.op, args)
+
+class Block:
+    def __init__(self, label):
+        self.label = label
+        self.instructions = []
+
+    def terminator(self):
+        if self.instructions and self.instructions[-1].op in terminators:
+            return self.instructions[-1]
+        return None
+
+    def successors(self):
+        terminator = self.terminator()
+        return terminator.targets() if terminator != None else []
+
+class FunctionIR:
+    def __init__(self, name, parameters):
+        self.name = name
+        self.parameters = parameters
+        self.blocks = []
+
+    def __repr__(self):
+        lines = ['{}({}):'.format(self.name, ', '.join(self.parameters))]
+        for block in self.blocks:
+            lines.append('{}:'.format(block.label))
+            lines.extend('    {}'.format(x) for x in block.instructions)
+        return '\n'.join(lines)
+
+class Builder:
+    def __init__(self, function, tail_calls=False):
+        self.ir = FunctionIR(function.name, list(function.parameters))
+        self.defined = set(function.parameters)
+        self.tail_calls = tail_calls
+        self.tail_jumps = 0
+        self.temps = 0
+        self.blocks = 0
+        self.block = None
+        self.__place(self.__make_block())
+        for node in function.body:
+            self.__statement(node)
+        if self.block.terminator() == None:
+            # Falling off the end returns whatever ebx happens to hold
+            self.__emit('return', None, [])
+
+    def __make_block(self):
+        self.blocks += 1
+        return Block('_block_{}_{}'.format(self.ir.name, self.blocks))
+
+    def __place(self, block):
+        if self.block != None and self.block.terminator() == None:
+            self.__emit('jump', None, [block.label])
+        self.ir.blocks.append(block)
+        self.block = block
+
+    def __temp(self):
+        self.temps += 1
+        return '%{}'.format(self.temps)
+
+    def __emit(self, op, dest, args):
+        self.block.instructions.append(Instruction(op, dest, args))
+
+    def __operand(self, node, dest=None):
+        kind = node.kind
+        if kind == NUMBER:
+            return int(node.value)
+        if kind == ID:
+            if node.name == 'True':
+                return 1
+            if node.name == 'False':
+                return 0
+            if node.name not in self.defined:
+                raise SemanticError('Variable "{}" is undefined'.format(node.name))
+            return node.name
+        if kind == FUNCTION_CALL:
+            args = [self.__operand(x) for x in node.parameters]
+            dest = dest or self.__temp()
+            self.__emit('call', dest, [node.name] + args)
+            return dest
+        if kind in binary_ops:
+            op1 = self.__operand(node.op1)
+            op2 = self.__operand(node.op2)
+            dest = dest or self.__temp()
+            self.__emit(kind_names[kind], dest, [op1, op2])
+            return dest
+        raise SemanticError('Unknow operation "{}"'.format(kind_names[kind]))
+
+    def __branch(self, condition, true_block, false_block):
+        if condition.kind in (LESS, GREATER, EQUALS):
+            args = [kind_names[condition.kind], self.__operand(condition.op1), self.__operand(condition.op2)]
+        else:
+            args = ['nonzero', self.__operand(condition), 0]
+        self.__emit('branch', None, args + [true_block.label, false_block.label])
+
+    def __statement(self, node):
+        kind = node.kind
+
+        if self.block.terminator() != None:
+            # Code after a return is unreachable but still has to be checked
+            self.__place(self.__make_block())
+
+        if kind == ASSIGNMENT:
+            value = self.__operand(node.value, node.name)
+            self.defined.add(node.name)
+            if value != node.name:
+                self.__emit('copy', node.name, [value])
+            if node.ternary != None:
+                self.__statement(node.ternary)
+            return
+
+        if kind == RETURN:
+            expression = node.expression
+            if self.tail_calls and expression.kind == FUNCTION_CALL and expression.name == self.ir.name \
+                    and len(expression.parameters) == len(self.ir.parameters):
+                # Rebind the parameters, the first one to the last argument, and restart
+                args = []
+                for parameter in expression.parameters:
+                    temp = self.__temp()
+                    self.__emit('copy', temp, [self.__operand(parameter)])
+                    args.append(temp)
+                for parameter, arg in zip(self.ir.parameters, reversed(args)):
+                    self.__emit('copy', parameter, [arg])
+                self.__emit('jump', None, [self.ir.blocks[0].label])
+                self.tail_jumps += 1
+                return
+            self.__emit('return', None, [self.__operand(expression)])
+            return
+
+        if kind == PRINT:
+            self.__emit('print', None, [self.__operand(node.expression)])
+            return
+
+        if kind == IF:
+            body = self.__make_block()
+            end = self.__make_block()
+            self.__branch(node.condition, body, end)
+            self.__place(body)
+            for inner_node in node.body:
+                self.__statement(inner_node)
+            self.__place(end)
+            return
+
+        if kind == WHILE:
+            # The test follows the body, so check it in source order
+            check_defined(node.condition, self.defined)
+            body = self.__make_block()
+            test = self.__make_block()
+            end = self.__make_block()
+            self.__emit('jump', None, [test.label])
+            self.__place(body)
+            for inner_node in node.body:
+                self.__statement(inner_node)
+            self.__place(test)
+            self.__branch(node.condition, body, end)
+            self.__place(end)
+            return
+
+        raise SemanticError('Unknow operation "{}"'.format(kind_names[kind]))
+
+def build(function, tail_calls=False):
+    return Builder(function, tail_calls).ir
+
+class Passes:
+    def __init__(self):
+        self.unreachable = 0
+        self.cse = 0
+        self.propagated = 0
+        self.eliminated = 0
+
+    def __remove_unreachable(self, ir):
+        blocks = {block.label: block for block in ir.blocks}
+        reached = set()
+        stack = [ir.blocks[0].label]
+        while stack:
+            label = stack.pop()
+            if label in reached:
+                continue
+            reached.add(label)
+            stack.extend(blocks[label].successors())
+        kept = [block for block in ir.blocks if block.label in reached]
+        self.unreachable += len(ir.blocks) - len(kept)
+        ir.blocks = kept
+
+    def __local(self, block):
+        # Copy propagation and value numbering within one block
+        copies = {}
+        values = {}
+        changed = False
+
+        def kill(name):
+            copies.pop(name, None)
+            for x in [x for x, source in copies.items() if source == name]:
+                del copies[x]
+            for x in [x for x, dest in values.items() if dest == name or name in x[1:]]:
+                del values[x]
+
+        for instruction in block.instructions:
+            args = instruction.args
+            start = 1 if instruction.op in ('call', 'branch') else 0
+            end = 3 if instruction.op == 'branch' else len(args)
+            if instruction.op == 'jump':
+                end = 0
+            for i in range(start, end):
+                if isinstance(args[i], str) and args[i] in copies:
+                    args[i] = copies[args[i]]
+                    self.propagated += 1
+                    changed = True
+
+            op = instruction.op
+            dest = instruction.dest
+            if op in pure_ops and op != 'copy':
+                value = (op,) + tuple(args)
+                if op in commutative_ops:
+                    value = (op,) + tuple(sorted(args, key=repr))
+                if value in values and values[value] != dest:
+                    instruction.op = 'copy'
+                    instruction.args = [values[value]]
+                    self.cse += 1
+                    changed = True
+            if dest != None:
+                kill(dest)
+                if instruction.op == 'copy':
+                    if instruction.args[0] != dest:
+                        copies[dest] = instruction.args[0]
+                elif instruction.op in pure_ops and dest not in args:
+                    values[value] = dest
+        return changed
+
+    def __is_removable(self, instruction):
+        if instruction.op not in pure_ops:
+            return False
+        if instruction.op == 'percent':
+            # A division that might fault cannot be removed, idiv also faults on INT_MIN % -1
+            divisor = instruction.args[1]
+            return not isinstance(divisor, str) and divisor not in (0, -1)
+        return True
+
+    def __eliminate(self, ir):
+        blocks = {block.label: block for block in ir.blocks}
+        live_in = {block.label: set() for block in ir.blocks}
+        changed = True
+        while changed:
+            changed = False
+            for block in reversed(ir.blocks):
+                live = set()
+                for label in block.successors():
+                    live |= live_in[label]
+                for instruction in reversed(block.instructions):
+                    if instruction.dest != None:
+                        live.discard(instruction.dest)
+                    live.update(instruction.uses())
+                if live != live_in[block.label]:
+                    live_in[block.label] = live
+                    changed = True
+
+        removed = False
+        for block in ir.blocks:
+            live = set()
+            for label in block.successors():
+                live |= live_in[label]
+            kept = []
+            for instruction in reversed(block.instructions):
+                dead = instruction.dest != None and instruction.dest not in live
+                if instruction.op == 'copy' and instruction.args[0] == instruction.dest:
+                    dead = True
+                if dead and self.__is_removable(instruction):
+                    self.eliminated += 1
+                    removed = True
+                    continue
+                if instruction.dest != None:
+                    live.discard(instruction.dest)
+                live.update(instruction.uses())
+                kept.append(instruction)
+            kept.reverse()
+            block.instructions = kept
+        return removed
+
+    def run(self, ir):
+        self.__remove_unreachable(ir)
+        changed = True
+        while changed:
+            changed = False
+            for block in ir.blocks:
+                changed = self.__local(block) or changed
+            changed = self.__eliminate(ir) or changed
+        return ir
+
+if __name__ == '__main__':
+    import sys
+    import tokenizer
+    from compiler import token_list
+    from parse import Parser
+
+    filename = sys.argv[1] if len(sys.argv) > 1 else 'algorithm.py'
+    with open(filename, 'r') as file:
+        ast = Parser().parse(tokenizer.tokenize(file.read().strip(), token_list))
+    main_function = Function('main', [], [x for x in ast if x.kind != FUNCTION] + [Return(Number('0'))])
+    for function in [x for x in ast if x.kind == FUNCTION] + [main_function]:
+        print(Passes().run(build(function)))
+        print()
@@ -0,0 +1,458 @@
+from tokenizer import Token, TokenError, newline_pattern
+import re
+
+class LexerError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return 'LexerError: {}'.format(self.msg)
+
+# Character classes the patterns may use besides explicit characters, with the
+# same meaning as in re for str patterns
+predicates = {
+    'd': str.isdecimal,
+    's': str.isspace
+}
+
+escapes = {'n': '\n', 'r': '\r', 't': '\t', 'v': '\v', 'f': '\f'}
+
+class CharSet:
+    def __init__(self, chars=(), names=()):
+        self.chars = frozenset(chars)
+        self.names = tuple(names)
+
+    def contains(self, c):
+        return c in self.chars or any(predicates[name](c) for name in self.names)
+
+class PatternParser:
+    # The subset of re used by token lists: literals, escapes, classes with
+    # ranges, \d and \s, alternation and the *, +, ? and {n} repeats
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.pos = 0
+
+    def __peek(self):
+        return self.pattern[self.pos] if self.pos < len(self.pattern) else None
+
+    def __next(self):
+        c = self.__peek()
+        if c == None:
+            raise LexerError('Unexpected end of pattern "{}"'.format(self.pattern))
+        self.pos += 1
+        return c
+
+    def parse(self):
+        node = self.__alternation()
+        if self.pos != len(self.pattern):
+            raise LexerError('Unsupported syntax at {} in "{}"'.format(self.pos, self.pattern))
+        return node
+
+    def __alternation(self):
+        branches = [self.__sequence()]
+        while self.__peek() == '|':
+            self.pos += 1
+            branches.append(self.__sequence())
+        return branches[0] if len(branches) == 1 else ('alt', branches)
+
+    def __sequence(self):
+        items = []
+        while self.__peek() not in (None, '|', ')'):
+            items.append(self.__repeat(self.__atom()))
+        return ('seq', items)
+
+    def __repeat(self, node):
+        c = self.__peek()
+        if c == '*':
+            self.pos += 1
+            return ('star', node)
+        if c == '+':
+            self.pos += 1
+            return ('seq', [node, ('star', node)])
+        if c == '?':
+            self.pos += 1
+            return ('alt', [node, ('seq', [])])
+        if c == '{':
+            end = self.pattern.find('}', self.pos)
+            count = self.pattern[self.pos + 1:end]
+            if end < 0 or not count.isdigit():
+                raise LexerError('Unsupported repeat in "{}"'.format(self.pattern))
+            self.pos = end + 1
+            return ('seq', [node] * int(count))
+        return node
+
+    def __atom(self):
+        c = self.__next()
+        if c == '(':
+            if self.pattern.startswith('?:', self.pos):
+                self.pos += 2
+            node = self.__alternation()
+            if self.__next() != ')':
+                raise LexerError('Unbalanced group in "{}"'.format(self.pattern))
+            return node
+        if c == '[':
+            return ('char', self.__char_class())
+        if c == '\\':
+            return ('char', self.__escape())
+        if c in '.^$)*+?{':
+            raise LexerError('Unsupported syntax "{}" in "{}"'.format(c, self.pattern))
+        return ('char', CharSet(c))
+
+    def __escape(self):
+        c = self.__next()
+        if c in predicates:
+            return CharSet((), c)
+        return CharSet(self.__escaped_char(c))
+
+    def __escaped_char(self, c):
+        if c in escapes:
+            return escapes[c]
+        if c in 'xu':
+            size = 2 if c == 'x' else 4
+            digits = self.pattern[self.pos:self.pos + size]
+            self.pos += size
+            return chr(int(digits, 16))
+        if c.isalnum():
+            raise LexerError('Unsupported escape "\\{}" in "{}"'.format(c, self.pattern))
+        return c
+
+    def __class_char(self):
+        c = self.__next()
+        return self.__escaped_char(self.__next()) if c == '\\' else c
+
+    def __char_class(self):
+        if self.__peek() == '^':
+            raise LexerError('Negated classes are not supported in "{}"'.format(self.pattern))
+        chars = set()
+        names = []
+        while self.__peek() != ']':
+            if self.pattern.startswith('\\', self.pos) and self.pattern[self.pos + 1:self.pos + 2] in predicates:
+                names.append(self.pattern[self.pos + 1])
+                self.pos += 2
+                continue
+            first = self.__class_char()
+            if self.__peek() == '-' and self.pattern[self.pos + 1:self.pos + 2] not in ('', ']'):
+                self.pos += 1
+                last = self.__class_char()
+                chars.update(chr(x) for x in range(ord(first), ord(last) + 1))
+            else:
+                chars.add(first)
+        self.pos += 1
+        return CharSet(chars, names)
+
+def literal(node):
+    # The text a pattern matches when it matches exactly one string
+    kind = node[0]
+    if kind == 'char':
+        charset = node[1]
+        return next(iter(charset.chars)) if len(charset.chars) == 1 and not charset.names else None
+    if kind == 'seq':
+        parts = [literal(x) for x in node[1]]
+        return None if None in parts else ''.join(parts)
+    return None
+
+class NFA:
+    def __init__(self):
+        self.edges = []
+        self.accept = {}
+
+    def state(self):
+        self.edges.append([])
+        return len(self.edges) - 1
+
+    def add(self, node, start):
+        # Thompson construction, returns the state reached at the end of node
+        kind = node[0]
+        if kind == 'char':
+            end = self.state()
+            self.edges[start].append((node[1], end))
+            return end
+        if kind == 'seq':
+            for item in node[1]:
+                start = self.add(item, start)
+            return start
+        if kind == 'alt':
+            end = self.state()
+            for branch in node[1]:
+                self.edges[self.add(branch, start)].append((None, end))
+            return end
+        loop = self.state()
+        self.edges[start].append((None, loop))
+        self.edges[self.add(node[1], loop)].append((None, loop))
+        return loop
+
+    def closure(self, states):
+        stack = list(states)
+        result = set(states)
+        while stack:
+            for charset, target in self.edges[stack.pop()]:
+                if charset == None and target not in result:
+                    result.add(target)
+                    stack.append(target)
+        return frozenset(result)
+
+class ClassMap(dict):
+    # Ordinal to character class for str.translate, characters outside the
+    # explicit sets are classified by the predicates on first sight
+    def __init__(self, classes, predicate_classes):
+        dict.__init__(self, classes)
+        self.predicate_classes = predicate_classes
+
+    def __missing__(self, code):
+        c = chr(code)
+        value = self[code] = self.predicate_classes[tuple(predicates[name](c) for name in sorted(predicates))]
+        return value
+
+class Lexer:
+    # Compiles a token list into one DFA over character classes, earlier entries
+    # win ties. Literal tokens that another pattern also matches, the keywords,
+    # are taken out of the automaton and looked up when that pattern matches.
+    def __init__(self, token_list, newlines=True):
+        rules = [('_NEWLINE', newline_pattern)] if newlines else []
+        rules += list(token_list)
+        patterns = [(name, PatternParser(pattern).parse()) for name, pattern in rules]
+
+        self.keywords = {}
+        self.keyword_kind = None
+        kept = []
+        for name, node in patterns:
+            text = literal(node)
+            owner = None
+            if text != None:
+                owner = next((other for other, pattern in rules if other != name and literal(dict(patterns)[other]) == None and re.fullmatch(pattern, text)), None)
+            if owner == None:
+                kept.append((name, node))
+                continue
+            if self.keyword_kind not in (None, owner):
+                raise LexerError('Keywords are matched by both {} and {}'.format(self.keyword_kind, owner))
+            self.keyword_kind = owner
+            self.keywords[text] = name
+
+        nfa = NFA()
+        start = nfa.state()
+        for priority, (name, node) in enumerate(kept):
+            nfa.accept[nfa.add(node, start)] = priority
+        self.__partition(nfa)
+        self.__build(nfa, start, [name for name, node in kept])
+
+    def __partition(self, nfa):
+        # Characters that no pattern tells apart share a class
+        charsets = []
+        for edges in nfa.edges:
+            for charset, target in edges:
+                if charset != None and charset not in charsets:
+                    charsets.append(charset)
+        explicit = set(chr(x) for x in range(128))
+        for charset in charsets:
+            explicit.update(charset.chars)
+
+        signatures = {(False,) * len(charsets): 0}
+        classes = {}
+        for c in sorted(explicit):
+            signature = tuple(x.contains(c) for x in charsets)
+            classes[ord(c)] = signatures.setdefault(signature, len(signatures))
+        predicate_classes = {}
+        names = sorted(predicates)
+        for mask in range(2 ** len(names)):
+            values = tuple(bool(mask >> i & 1) for i in range(len(names)))
+            signature = tuple(any(values[names.index(name)] for name in x.names) for x in charsets)
+            predicate_classes[values] = signatures.setdefault(signature, len(signatures))
+        if len(signatures) > 256:
+            raise LexerError('Too many character classes')
+
+        self.members = [[charsets[i] for i, value in enumerate(signature) if value] for signature in sorted(signatures, key=signatures.get)]
+        self.classes = ClassMap(classes, predicate_classes)
+
+    def __build(self, nfa, start, names):
+        # Subset construction, state 0 is the dead state and state 1 the start
+        width = self.width = len(self.members)
+        pending = [nfa.closure([start])]
+        states = {frozenset(): 0, pending[0]: 1}
+        table = [[0] * width, None]
+        accept = [None, None]
+        while pending:
+            current = pending.pop()
+            index = states[current]
+            row = []
+            for members in self.members:
+                targets = [target for state in current for charset, target in nfa.edges[state] if charset != None and charset in members]
+                target_set = nfa.closure(targets) if targets else frozenset()
+                if target_set not in states:
+                    states[target_set] = len(table)
+                    table.append(None)
+                    accept.append(None)
+                    pending.append(target_set)
+                row.append(states[target_set])
+            table[index] = row
+            priorities = [nfa.accept[x] for x in current if x in nfa.accept]
+            accept[index] = names[min(priorities)] if priorities else None
+        self.__minimize(table, accept)
+        self.__shortcuts()
+
+    def __minimize(self, table, accept):
+        # Moore's refinement, states that accept the same kind and move to the
+        # same groups on every class are merged, so a loop becomes one state
+        groups = {}
+        group = [groups.setdefault(x, len(groups)) for x in accept]
+        group[0], group[1] = -1, -2
+        while True:
+            signatures = {}
+            refined = [signatures.setdefault((group[index], tuple(group[x] for x in row)), len(signatures)) for index, row in enumerate(table)]
+            if len(signatures) == len(set(group)):
+                break
+            group = refined
+        # Renumber so the dead state stays 0 and the start state 1
+        order = {}
+        for index in range(len(table)):
+            order.setdefault(group[index], len(order))
+        self.table = [None] * len(order)
+        merged = [None] * len(order)
+        for index, row in enumerate(table):
+            target = order[group[index]]
+            self.table[target] = [order[group[x]] for x in row]
+            merged[target] = accept[index]
+        # Kinds are strings, an empty one marks a state that accepts nothing
+        self.accept = [x or '' for x in merged]
+
+    def __shortcuts(self):
+        # Tables that let the scanner take most tokens without stepping the
+        # automaton once per character
+        table = self.table
+        accept = self.accept
+        width = self.width
+        size = len(table)
+
+        # States a token cannot continue from, other than by looping in place
+        self.final = [not any(target not in (0, index) for target in table[index]) for index in range(size)]
+
+        # A state that loops on some classes is left with one bytes.find over
+        # a mask of those classes instead of a step per character
+        self.masks = []
+        self.skips = [None] * size
+        for index in range(2, size):
+            loop = bytes(int(target == index) for target in table[index]) + bytes(256 - width)
+            if any(loop):
+                if loop not in self.masks:
+                    self.masks.append(loop)
+                self.skips[index] = self.masks.index(loop)
+        self.runs = [None] * width
+        self.run_kinds = [''] * width
+        for first in range(width):
+            state = table[1][first]
+            if self.skips[state] != None and self.final[state] and accept[state]:
+                self.runs[first] = self.skips[state]
+                self.run_kinds[first] = accept[state]
+
+        # A unique sequence of classes that leads to a final state, like the
+        # spaces of an indent, is checked with one startswith
+        self.chains = [None] * size
+        for index in range(2, size):
+            chain = bytearray()
+            state = index
+            while not self.final[state]:
+                live = [c for c, target in enumerate(table[state]) if target != 0]
+                if len(live) != 1 or table[state][live[0]] == state:
+                    break
+                chain.append(live[0])
+                state = table[state][live[0]]
+            if chain and self.final[state] and accept[state]:
+                self.chains[index] = (bytes(chain), state)
+
+        # For each pair of classes, the kind of a token that is just the first
+        # character, which covers operators and the spaces between tokens
+        self.single = [''] * (width * width)
+        for first in range(width):
+            state = table[1][first]
+            if state != 0 and accept[state]:
+                for second in range(width):
+                    if table[state][second] == 0:
+                        self.single[first * width + second] = accept[state]
+        self.blank = [x == 'WHITESPACE' for x in self.single]
+
+    def tokenize(self, text):
+        # Same stream as tokenizer.tokenize, lines of (indent level, tokens),
+        # except that a keyword running into identifier characters is an ID.
+        # The class data ends with the dead class, so every run, chain and
+        # step stops there without checking for the end of the text.
+        data = text.translate(self.classes).encode('latin-1') + bytes(2)
+        masks = [data.translate(x) for x in self.masks]
+        skips = [None if x == None else masks[x] for x in self.skips]
+        runs = [None if x == None else masks[x] for x in self.runs]
+        run_kinds = self.run_kinds
+        single = self.single
+        blank = self.blank
+        width = self.width
+        table = self.table
+        accept = self.accept
+        chains = self.chains
+        keywords = self.keywords
+        keyword_kind = self.keyword_kind
+
+        count = 1
+        level = 0
+        tokens = []
+        line_start = 0
+        pos = 0
+        end = len(text)
+
+        while pos < end:
+            begin = pos
+            first = data[pos]
+            pos += 1
+            kind = single[first * width + data[pos]]
+            if kind:
+                pass
+            elif runs[first]:
+                # A token that only repeats its first class, one find skips it
+                pos = runs[first].find(0, pos)
+                kind = run_kinds[first]
+            else:
+                # Longest match, remembering where the last accepting state was
+                state = table[1][first]
+                last = begin
+                while state:
+                    if skips[state]:
+                        pos = skips[state].find(0, pos)
+                    chain = chains[state]
+                    if chain and data.startswith(chain[0], pos):
+                        pos += len(chain[0])
+                        state = chain[1]
+                    if accept[state]:
+                        kind = accept[state]
+                        last = pos
+                    state = table[state][data[pos]]
+                    pos += 1
+                if last == begin:
+                    raise TokenError(text[begin], count)
+                pos = last
+
+            if kind == 'WHITESPACE':
+                continue
+            if kind == '_NEWLINE':
+                yield (level, tokens)
+                count += 1
+                level = 0
+                tokens = []
+                line_start = pos
+            elif kind == 'TAB':
+                level += 1
+            else:
+                value = text[begin:pos]
+                if kind == keyword_kind:
+                    kind = keywords.get(value, kind)
+                tokens.append(Token(kind, value, count))
+                # The single space that usually follows a token is skipped here
+                if blank[data[pos] * width + data[pos + 1]]:
+                    pos += 1
+
+        if line_start < end:
+            yield (level, tokens)
+
+lexer_cache = {}
+
+def tokenize(text, token_list):
+    key = tuple(token_list)
+    lexer = lexer_cache.get(key)
+    if lexer == None:
+        lexer = lexer_cache[key] = Lexer(token_list)
+    return lexer.tokenize(text)
@@ -0,0 +1,73 @@
+from nodes import *
+from optimizer import assigned_names, is_pure
+
+class LoopAnalysis:
+    def __init__(self, loop):
+        self.uses = {}
+        self.expressions = {}
+        self.increments = {}
+        self.has_calls = False
+
+        self.assigned = assigned_names(loop.body, set())
+        self.__expression(loop.condition)
+        self.__body(loop.body)
+
+        self.inductions = set(name for name, increment in self.increments.items() if increment)
+        self.invariants = set(name for name in self.uses if name not in self.assigned)
+
+    def __expression(self, node):
+        kind = node.kind
+        if kind == ID:
+            if node.name not in ('True', 'False'):
+                self.uses[node.name] = self.uses.get(node.name, 0) + 1
+        elif kind == FUNCTION_CALL:
+            self.has_calls = True
+            for parameter in node.parameters:
+                self.__expression(parameter)
+        elif kind in binary_ops:
+            self.__expression(node.op1)
+            self.__expression(node.op2)
+            expression = key(node)
+            found = self.expressions.get(expression)
+            self.expressions[expression] = (node, 1 if found == None else found[1] + 1)
+
+    def __is_increment(self, node):
+        value = node.value
+        return value.kind in (PLUS, MINUS) and value.op1.kind == ID and value.op1.name == node.name \
+            and value.op2.kind == NUMBER
+
+    def __body(self, body):
+        for node in body:
+            kind = node.kind
+            if kind == ASSIGNMENT:
+                self.__expression(node.value)
+                self.increments[node.name] = self.increments.get(node.name, True) and self.__is_increment(node)
+                if node.ternary != None:
+                    self.__body([node.ternary])
+            elif kind in (RETURN, PRINT):
+                if kind == PRINT:
+                    self.has_calls = True
+                self.__expression(node.expression)
+            elif kind in (IF, WHILE):
+                self.__expression(node.condition)
+                self.__body(node.body)
+
+    def is_invariant(self, node):
+        kind = node.kind
+        if kind == NUMBER:
+            return True
+        if kind == ID:
+            return node.name in ('True', 'False') or node.name in self.invariants
+        if kind in binary_ops:
+            # Hoisting runs the expression even when the loop does not, so never hoist a division that may fault
+            if kind == PERCENT and (node.op2.kind != NUMBER or int(node.op2.value) in (0, -1)):
+                return False
+            return self.is_invariant(node.op1) and self.is_invariant(node.op2)
+        return False
+
+    def hoistable(self):
+        found = []
+        for node, count in self.expressions.values():
+            if is_pure(node) and self.is_invariant(node) and not (node.op1.kind == NUMBER and node.op2.kind == NUMBER):
+                found.append((node, count))
+        return found
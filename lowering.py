@@ -0,0 +1,180 @@
+from nodes import *
+from generator import Generator, SemanticError
+from ir import Builder, Passes
+
+conditions = {
+    'less': ('l', 'ge'),
+    'greater': ('g', 'le'),
+    'equals': ('e', 'ne'),
+    'nonzero': ('ne', 'e')
+}
+
+arithmetic = {
+    'plus': 'add',
+    'minus': 'sub',
+    'mul': 'imul'
+}
+
+class IRGenerator(Generator):
+    def __init__(self, peephole=None, loops=False, fragment_limit=1024):
+        super().__init__(peephole, loops, fragment_limit)
+        self.passes = Passes()
+        self.slots = {}
+
+    def reset_counts(self):
+        super().reset_counts()
+        self.passes = Passes()
+
+    def merge(self, worker):
+        super().merge(worker)
+        for name in ('unreachable', 'cse', 'propagated', 'eliminated'):
+            setattr(self.passes, name, getattr(self.passes, name) + getattr(worker.passes, name))
+
+    def __operand(self, value):
+        if isinstance(value, int):
+            return str(value)
+        return 'dword ptr [ebp{:+}]'.format(self.slots[value])
+
+    def __load(self, register, value):
+        self.emit('mov {}, {}'.format(register, self.__operand(value)))
+
+    def __store(self, name, register):
+        self.emit('mov {}, {}'.format(self.__operand(name), register))
+
+    def __binary(self, instruction):
+        op = instruction.op
+        a = instruction.args[0]
+        emit = self.emit
+
+        if op == 'copy':
+            if a == instruction.dest:
+                return
+            if isinstance(a, int):
+                self.__store(instruction.dest, a)
+                return
+            self.__load('eax', a)
+            self.__store(instruction.dest, 'eax')
+            return
+
+        b = instruction.args[1]
+        self.__load('eax', a)
+        if op in arithmetic:
+            if op == 'mul' and isinstance(b, int):
+                emit('imul eax, eax, {}'.format(b))
+            else:
+                emit('{} eax, {}'.format(arithmetic[op], self.__operand(b)))
+        elif op == 'percent':
+            if isinstance(b, int):
+                self.__load('ecx', b)
+                divisor = 'ecx'
+            else:
+                divisor = self.__operand(b)
+            emit('cdq', 'idiv {}'.format(divisor), 'mov eax, edx')
+        elif op in conditions:
+            emit(
+                'cmp eax, {}'.format(self.__operand(b)),
+                'set{} al'.format(conditions[op][0]),
+                'movzx eax, al'
+            )
+        elif op == 'shl':
+            emit('shl eax, {}'.format(b))
+        elif op == 'mask':
+            emit(
+                'cdq',
+                'and edx, {}'.format(b),
+                'add eax, edx',
+                'and eax, {}'.format(b),
+                'sub eax, edx'
+            )
+        else:
+            raise SemanticError('Unknow operation "{}"'.format(op))
+        self.__store(instruction.dest, 'eax')
+
+    def __instruction(self, instruction, next_label):
+        op = instruction.op
+        args = instruction.args
+        emit = self.emit
+
+        if op == 'call':
+            for arg in args[1:]:
+                emit('push {}'.format(self.__operand(arg)))
+            emit('call {}'.format(args[0]))
+            if len(args) > 1:
+                emit('add esp, {}'.format(4 * (len(args) - 1)))
+            if instruction.dest != None:
+                self.__store(instruction.dest, 'ebx')
+            return
+
+        if op == 'print':
+            emit(
+                'push {}'.format(self.__operand(args[0])),
+                'call __print',
+                'add esp, 4'
+            )
+            return
+
+        if op == 'return':
+            if args:
+                self.__load('ebx', args[0])
+            emit(
+                'mov esp, ebp',
+                'pop ebp',
+                'ret'
+            )
+            return
+
+        if op == 'jump':
+            if args[0] != next_label:
+                emit('jmp {}'.format(args[0]))
+            return
+
+        if op == 'branch':
+            condition, a, b, true_label, false_label = args
+            self.__load('eax', a)
+            emit('cmp eax, {}'.format(self.__operand(b)))
+            if true_label == next_label:
+                emit('j{} {}'.format(conditions[condition][1], false_label))
+                return
+            emit('j{} {}'.format(conditions[condition][0], true_label))
+            if false_label != next_label:
+                emit('jmp {}'.format(false_label))
+            return
+
+        self.__binary(instruction)
+
+    def __layout(self, ir):
+        self.slots = {}
+        i = 2
+        for parameter in ir.parameters:
+            self.slots[parameter] = i * 4
+            i += 1
+        size = 0
+        for block in ir.blocks:
+            for instruction in block.instructions:
+                for name in [instruction.dest] + instruction.uses():
+                    if name != None and name not in self.slots:
+                        size += 4
+                        self.slots[name] = -size
+        return size
+
+    def generate_function(self, function):
+        builder = Builder(function, self.tail_calls)
+        self.tail_jumps.extend([function.name] * builder.tail_jumps)
+        ir = self.passes.run(builder.ir)
+        size = self.__layout(ir)
+
+        self.emit(
+            *self.target.begin_function(function.name),
+            'push ebp',
+            'mov ebp, esp'
+        )
+        if size:
+            self.emit('sub esp, {}'.format(size))
+
+        labels = [block.label for block in ir.blocks] + [None]
+        for i, block in enumerate(ir.blocks):
+            self.emit('{}:'.format(block.label))
+            for instruction in block.instructions:
+                self.__instruction(instruction, labels[i + 1])
+
+        self.emit(*self.target.end_function(function.name))
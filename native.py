@@ -0,0 +1,100 @@
+import os, sys, time, glob, shutil, tempfile, subprocess, argparse
+from compiler import Result, compile_text
+from emulator import Emulator, EmulatorError
+import tokenizer
+from parse import ParseError
+from generator import SemanticError
+
+class NativeError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return 'NativeError: {}'.format(self.msg)
+
+def check_tools():
+    for tool in ('as', 'ld'):
+        if shutil.which(tool) == None:
+            raise NativeError('"{}" was not found, the harness needs GNU binutils'.format(tool))
+
+def build(text, directory, name='program'):
+    source = os.path.join(directory, name + '.s')
+    obj = os.path.join(directory, name + '.o')
+    executable = os.path.join(directory, name)
+    with open(source, 'w') as file:
+        file.write(text)
+    for command in (['as', '--32', source, '-o', obj], ['ld', '-m', 'elf_i386', obj, '-o', executable]):
+        process = subprocess.run(command, capture_output=True, text=True)
+        if process.returncode != 0:
+            raise NativeError('{} failed: {}'.format(command[0], process.stderr.strip()))
+    return executable
+
+def run(executable, repeat=1, timeout=60):
+    best = None
+    output = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            process = subprocess.run([executable], capture_output=True, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            raise NativeError('Timed out after {} s'.format(timeout))
+        elapsed = time.perf_counter() - start
+        if process.returncode < 0:
+            raise NativeError('Killed by signal {}'.format(-process.returncode))
+        if process.returncode != 0:
+            raise NativeError('Exited with status {}'.format(process.returncode))
+        output = [int(x) for x in process.stdout.split()]
+        best = elapsed if best == None else min(best, elapsed)
+    return output, best
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Assemble, link and time compiled programs with GNU binutils')
+    parser.add_argument('inputs', nargs='*')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--registers', action='store_const', dest='backend', const='registers', default='stack')
+    group.add_argument('--ir', action='store_const', dest='backend', const='ir')
+    parser.add_argument('--optimize', action='store_true')
+    parser.add_argument('--peephole', action='store_true')
+    parser.add_argument('--inline', action='store_true')
+    parser.add_argument('--dce', action='store_true')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='runs per program, the fastest is reported')
+    parser.add_argument('--check', action='store_true', help='compare the output with the emulator')
+    parser.add_argument('--show', action='store_true', help='print the program output')
+    args = parser.parse_args()
+
+    try:
+        check_tools()
+    except NativeError as e:
+        print(e)
+        sys.exit(2)
+
+    files = args.inputs or ['algorithm.py'] + sorted(glob.glob('samples/*.py'))
+    directory = tempfile.mkdtemp()
+    failed = 0
+    print('{:<24}{:<12}{:>12}{:>10}  {}'.format('file', 'backend', 'wall, ms', 'lines', 'result'))
+    for filename in files:
+        name = os.path.splitext(os.path.basename(filename))[0]
+        try:
+            with open(filename, 'r') as file:
+                source = file.read().strip()
+            text = compile_text(source, Result(filename), args.backend, args.optimize, args.peephole, args.inline, target='gas', dce=args.dce)
+            output, elapsed = run(build(text, directory, name), args.repeat)
+            status = 'ok'
+            if args.check:
+                masm = compile_text(source, Result(filename), args.backend, args.optimize, args.peephole, args.inline, dce=args.dce)
+                expected = Emulator(masm).run()
+                if output != expected:
+                    failed += 1
+                    status = 'MISMATCH {} != {}'.format(output, expected)
+                else:
+                    status = 'matches emulator'
+        except (tokenizer.TokenError, ParseError, SemanticError, EmulatorError, NativeError, OSError) as e:
+            failed += 1
+            print('{:<24}{:<12}{}'.format(filename, args.backend, e))
+            continue
+        print('{:<24}{:<12}{:>12.2f}{:>10}  {}'.format(filename, args.backend, elapsed * 1000, len(output), status))
+        if args.show:
+            for value in output:
+                print(value)
+    shutil.rmtree(directory)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,207 @@
+import json
+
+NUMBER = 0
+ID = 1
+FUNCTION_CALL = 2
+PLUS = 3
+MINUS = 4
+MUL = 5
+PERCENT = 6
+LESS = 7
+GREATER = 8
+EQUALS = 9
+FUNCTION = 10
+RETURN = 11
+ASSIGNMENT = 12
+IF = 13
+WHILE = 14
+PRINT = 15
+SHL = 16
+MASK = 17
+
+kind_names = [
+    'number',
+    'id',
+    'function_call',
+    'plus',
+    'minus',
+    'mul',
+    'percent',
+    'less',
+    'greater',
+    'equals',
+    'function',
+    'return',
+    'assignment',
+    'if',
+    'while',
+    'print',
+    'shl',
+    'mask'
+]
+
+kinds = {name: kind for kind, name in enumerate(kind_names)}
+
+binary_ops = (PLUS, MINUS, MUL, PERCENT, LESS, GREATER, EQUALS, SHL, MASK)
+
+class Node:
+    __slots__ = ()
+    fields = ()
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(repr(getattr(self, x)) for x in self.fields))
+
+class Number(Node):
+    __slots__ = ('value',)
+    fields = ('value',)
+    kind = NUMBER
+
+    def __init__(self, value):
+        self.value = value
+
+class Id(Node):
+    __slots__ = ('name',)
+    fields = ('name',)
+    kind = ID
+
+    def __init__(self, name):
+        self.name = name
+
+class FunctionCall(Node):
+    __slots__ = ('name', 'parameters')
+    fields = ('name', 'parameters')
+    kind = FUNCTION_CALL
+
+    def __init__(self, name, parameters):
+        self.name = name
+        self.parameters = parameters
+
+class BinaryOp(Node):
+    __slots__ = ('kind', 'op1', 'op2')
+    fields = ('op1', 'op2')
+
+    def __init__(self, kind, op1, op2):
+        self.kind = kind
+        self.op1 = op1
+        self.op2 = op2
+
+class Function(Node):
+    __slots__ = ('name', 'parameters', 'body')
+    fields = ('name', 'parameters', 'body')
+    kind = FUNCTION
+
+    def __init__(self, name, parameters, body):
+        self.name = name
+        self.parameters = parameters
+        self.body = body
+
+class Return(Node):
+    __slots__ = ('expression',)
+    fields = ('expression',)
+    kind = RETURN
+
+    def __init__(self, expression):
+        self.expression = expression
+
+class Assignment(Node):
+    __slots__ = ('name', 'value', 'ternary')
+    fields = ('name', 'ternary', 'value')
+    kind = ASSIGNMENT
+
+    def __init__(self, name, value, ternary=None):
+        self.name = name
+        self.value = value
+        self.ternary = ternary
+
+class If(Node):
+    __slots__ = ('condition', 'body')
+    fields = ('condition', 'body')
+    kind = IF
+
+    def __init__(self, condition, body):
+        self.condition = condition
+        self.body = body
+
+class While(Node):
+    __slots__ = ('condition', 'body')
+    fields = ('condition', 'body')
+    kind = WHILE
+
+    def __init__(self, condition, body):
+        self.condition = condition
+        self.body = body
+
+class Print(Node):
+    __slots__ = ('expression',)
+    fields = ('expression',)
+    kind = PRINT
+
+    def __init__(self, expression):
+        self.expression = expression
+
+def to_json(node):
+    if isinstance(node, list):
+        return [to_json(x) for x in node]
+    if not isinstance(node, Node):
+        return node
+
+    obj = {'type': kind_names[node.kind]}
+    for field in node.fields:
+        value = getattr(node, field)
+        if value is None and field == 'ternary':
+            continue
+        obj[field] = to_json(value)
+    return obj
+
+def from_json(obj):
+    if isinstance(obj, list):
+        return [from_json(x) for x in obj]
+    if not isinstance(obj, dict):
+        return obj
+
+    kind = kinds[obj['type']]
+    if kind == NUMBER:
+        return Number(obj['value'])
+    if kind == ID:
+        return Id(obj['name'])
+    if kind == FUNCTION_CALL:
+        return FunctionCall(obj['name'], from_json(obj['parameters']))
+    if kind in binary_ops:
+        return BinaryOp(kind, from_json(obj['op1']), from_json(obj['op2']))
+    if kind == FUNCTION:
+        return Function(obj['name'], obj['parameters'], from_json(obj['body']))
+    if kind == RETURN:
+        return Return(from_json(obj['expression']))
+    if kind == ASSIGNMENT:
+        return Assignment(obj['name'], from_json(obj['value']), from_json(obj.get('ternary')))
+    if kind == IF:
+        return If(from_json(obj['condition']), from_json(obj['body']))
+    if kind == WHILE:
+        return While(from_json(obj['condition']), from_json(obj['body']))
+    return Print(from_json(obj['expression']))
+
+def write_json(ast, stream):
+    # Same text as json.dumps(to_json(ast), indent=4), one statement at a time
+    if not ast:
+        stream.write('[]')
+        return
+    stream.write('[\n')
+    for i, node in enumerate(ast):
+        if i:
+            stream.write(',\n')
+        stream.write('    ' + json.dumps(to_json(node), indent=4).replace('\n', '\n    '))
+    stream.write('\n]')
+
+def key(node):
+    if isinstance(node, list):
+        return tuple(key(x) for x in node)
+    if not isinstance(node, Node):
+        return node
+    return (node.kind,) + tuple(key(getattr(node, field)) for field in node.fields)
+
+def count_nodes(node):
+    if isinstance(node, list):
+        return sum(count_nodes(x) for x in node)
+    if not isinstance(node, Node):
+        return 0
+    return 1 + sum(count_nodes(getattr(node, field)) for field in node.fields)
@@ -0,0 +1,220 @@
+from nodes import *
+from semantics import check_program
+
+def wrap(value):
+    return (value + 2 ** 31) % 2 ** 32 - 2 ** 31
+
+def fold(kind, a, b):
+    if kind == PLUS:
+        return wrap(a + b)
+    if kind == MINUS:
+        return wrap(a - b)
+    if kind == MUL:
+        return wrap(a * b)
+    if kind == PERCENT:
+        # Both fault in idiv, so they are left for run time
+        if b == 0 or (a == -2 ** 31 and b == -1):
+            return None
+        # idiv truncates, so the remainder takes the sign of the dividend
+        remainder = abs(a) % abs(b)
+        return wrap(-remainder if a < 0 else remainder)
+    if kind == LESS:
+        return int(a < b)
+    if kind == GREATER:
+        return int(a > b)
+    if kind == EQUALS:
+        return int(a == b)
+    return None
+
+def power_of_two(value):
+    if value > 1 and value & (value - 1) == 0:
+        return value.bit_length() - 1
+    return None
+
+def constant(node):
+    if node.kind == NUMBER:
+        # Literals are 32-bit in the generated code, so 2147483648 is -2147483648
+        return wrap(int(node.value))
+    if node.kind == ID:
+        if node.name == 'True':
+            return 1
+        if node.name == 'False':
+            return 0
+    return None
+
+def is_pure(node):
+    if node.kind == FUNCTION_CALL:
+        return False
+    if node.kind in binary_ops:
+        return is_pure(node.op1) and is_pure(node.op2)
+    return True
+
+def assigned_names(body, names):
+    for node in body:
+        if node.kind == ASSIGNMENT:
+            names.add(node.name)
+            if node.ternary != None:
+                assigned_names([node.ternary], names)
+        elif node.kind in (IF, WHILE):
+            assigned_names(node.body, names)
+    return names
+
+class Optimizer:
+    def __init__(self):
+        self.folded = 0
+        self.simplified = 0
+        self.reduced = 0
+        self.propagated = 0
+        self.eliminated = 0
+
+    def __number(self, value):
+        return Number(str(value))
+
+    def __expression(self, node, env):
+        kind = node.kind
+
+        if kind == ID:
+            if node.name in env:
+                self.propagated += 1
+                return self.__number(env[node.name])
+            return node
+
+        if kind == FUNCTION_CALL:
+            return FunctionCall(node.name, [self.__expression(x, env) for x in node.parameters])
+
+        if kind not in binary_ops:
+            return node
+
+        op1 = self.__expression(node.op1, env)
+        op2 = self.__expression(node.op2, env)
+        a = constant(op1)
+        b = constant(op2)
+
+        if a != None and b != None:
+            value = fold(kind, a, b)
+            if value != None:
+                self.folded += 1
+                return self.__number(value)
+
+        simplified = self.__simplify(kind, op1, op2, a, b)
+        if simplified != None:
+            self.simplified += 1
+            return simplified
+
+        if kind == MUL:
+            if b != None and power_of_two(b) != None:
+                self.reduced += 1
+                return BinaryOp(SHL, op1, self.__number(power_of_two(b)))
+            if a != None and power_of_two(a) != None:
+                self.reduced += 1
+                return BinaryOp(SHL, op2, self.__number(power_of_two(a)))
+
+        if kind == PERCENT and b != None and power_of_two(b) != None:
+            self.reduced += 1
+            return BinaryOp(MASK, op1, self.__number(b - 1))
+
+        return BinaryOp(kind, op1, op2)
+
+    def __simplify(self, kind, op1, op2, a, b):
+        if kind == PLUS:
+            if b == 0:
+                return op1
+            if a == 0:
+                return op2
+        elif kind == MINUS:
+            if b == 0:
+                return op1
+        elif kind == MUL:
+            if b == 1:
+                return op1
+            if a == 1:
+                return op2
+            if (b == 0 and is_pure(op1)) or (a == 0 and is_pure(op2)):
+                return self.__number(0)
+        elif kind == PERCENT:
+            if b == 1 and is_pure(op1):
+                return self.__number(0)
+
+        # x % x is left alone, it faults when x is 0
+        if op1.kind == ID and op2.kind == ID and op1.name == op2.name:
+            if kind in (MINUS, LESS, GREATER):
+                return self.__number(0)
+            if kind == EQUALS:
+                return self.__number(1)
+        return None
+
+    def __body(self, body, env, defined):
+        result = []
+        for node in body:
+            result.extend(self.__statement(node, env, defined))
+        return result
+
+    def __statement(self, node, env, defined):
+        kind = node.kind
+
+        if kind == ASSIGNMENT:
+            value = self.__expression(node.value, env)
+            defined.add(node.name)
+            if value.kind == NUMBER:
+                env[node.name] = constant(value)
+            else:
+                env.pop(node.name, None)
+            result = [Assignment(node.name, value)]
+            if node.ternary != None:
+                result.extend(self.__statement(node.ternary, env, defined))
+            return result
+
+        if kind == RETURN:
+            return [Return(self.__expression(node.expression, env))]
+
+        if kind == PRINT:
+            return [Print(self.__expression(node.expression, env))]
+
+        if kind == IF:
+            condition = self.__expression(node.condition, env)
+            value = constant(condition)
+            if value != None and value != 0:
+                self.eliminated += 1
+                return self.__body(node.body, env, defined)
+            if value == 0 and assigned_names(node.body, set()) <= defined:
+                self.eliminated += 1
+                return []
+
+            body = self.__body(node.body, dict(env), set(defined))
+            for name in assigned_names(node.body, set()):
+                env.pop(name, None)
+            defined.update(assigned_names(node.body, set()))
+            return [If(condition, body)]
+
+        if kind == WHILE:
+            for name in assigned_names(node.body, set()):
+                env.pop(name, None)
+            condition = self.__expression(node.condition, env)
+            if constant(condition) == 0 and assigned_names(node.body, set()) <= defined:
+                self.eliminated += 1
+                return []
+
+            body = self.__body(node.body, dict(env), set(defined))
+            defined.update(assigned_names(node.body, set()))
+            return [While(condition, body)]
+
+        return [node]
+
+    def optimize_function(self, function):
+        return Function(function.name, function.parameters,
+            self.__body(function.body, {}, set(function.parameters)))
+
+    def optimize(self, ast):
+        # Folding and branch elimination can drop the reads the generator would reject
+        check_program(ast)
+        result = []
+        main_env = {}
+        main_defined = set()
+
+        for node in ast:
+            if node.kind == FUNCTION:
+                result.append(self.optimize_function(node))
+            else:
+                result.extend(self.__statement(node, main_env, main_defined))
+
+        return result
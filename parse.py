@@ -1,4 +1,5 @@
 from tokenizer import Token
+from nodes import *
 
 class ParseError(Exception):
     def __init__(self, msg, line):
@@ -10,18 +11,19 @@ class ParseError(Exception):
 
 class Parser:
     def __init__(self):
-        self.lines = []
+        self.lines = iter(())
+        self.next_line = None
         self.count = -1
         pass
     
-    def __tokens_to_lines(self, tokens):
-        lines = []
-        
-        for line in tokens:
-            level = sum(1 for x in line if x.kind == 'TAB')
-            lines.append((level, [x for x in line if x.kind != 'TAB']))
-        
-        return lines
+    def __next_line(self):
+        line = self.next_line
+        self.next_line = next(self.lines, None)
+        self.count += 1
+        return line
+    
+    def __has_inner(self, level):
+        return self.next_line != None and self.next_line[0] > level
     
     def __parse_symbol(self, start, line):
         node = None
@@ -32,13 +34,13 @@ class Parser:
         
         if line[pos].kind == 'NUMBER':
             pos += 1
-            node = {'type': 'number', 'value': line[pos - 1].value}
+            node = Number(line[pos - 1].value)
         elif line[pos].kind == 'ID':
             pos += 1
             if pos < len(line) and line[pos].kind == 'LPAR':
-                node = {'type': 'function_call', 'name': line[pos - 1].value}
+                node = FunctionCall(line[pos - 1].value, [])
                 pos += 1
-                params = []
+                params = node.parameters
                 while line[pos].kind != 'RPAR':
                     pos, param = self.__parse_symbol(pos, line)
                     if param == None: 
@@ -47,15 +49,13 @@ class Parser:
                     if line[pos].kind == 'COMMA':
                         pos += 1
                 
-                node['parameters'] = params
-                
                 if pos >= len(line) or line[pos].kind != 'RPAR':
                     raise ParseError('Expected ")"', self.count)
 
             else:
-                node = {'type': 'id', 'name': line[pos - 1].value}
+                node = Id(line[pos - 1].value)
         elif pos < len(line) and line[pos].kind == 'IF':
-            node = {'type': 'if'}
+            node = If(None, [])
             pos += 1
             operation = line[pos + 1]
             if operation.kind == 'LESS':
@@ -65,16 +65,14 @@ class Parser:
                 line[pos + 1].kind = 'LESS'
                 line[pos + 1].value = '<'
             condition = self.__parse_expression(line[pos:-2])
-            node['condition'] = condition
+            node.condition = condition
 
-            body = []
+            body = node.body
             initial_value = self.__parse_symbol(0, line[-1:])
             initial_value = initial_value[1]
             false_value = self.__parse_symbol(0, line[-2:])
             false_value = false_value[1]
-            assignment = {'type': 'assignment', 'name': initial_value['name'], 'value': false_value}
-            body.append(assignment)
-            node['body'] = body
+            body.append(Assignment(initial_value.name, false_value))
 
         else:
             raise ParseError('Unexpected symbol "{}"'.format(line[pos].value), self.count)
@@ -92,16 +90,14 @@ class Parser:
             op2 = self.__parse_symbol(pos + 1, line)
             if op2 == None:
                 raise ParseError('Expected second operand', self.count)
-            return {'type': line[pos].kind.lower(), 'op1': op, 'op2': op2[1]}
+            return BinaryOp(kinds[line[pos].kind.lower()], op, op2[1])
         
         return op
     
     def __parse_line(self):
-        self.count += 1
         node = None
         pos = 0
-        line = self.lines[self.count][1]
-        level = self.lines[self.count][0]
+        level, line = self.__next_line()
         
         if len(line) == 0:
             return node
@@ -112,14 +108,14 @@ class Parser:
             pos += 1
             if pos >= len(line) or line[pos].kind != 'ID':
                 raise ParseError('Expected function identifier', self.count)
-            node = {'type': 'function', 'name': line[pos].value}
+            node = Function(line[pos].value, [], [])
             pos += 1
             
             if pos >= len(line) or line[pos].kind != 'LPAR':
                 raise ParseError('Expected "("', self.count)
             pos += 1
             
-            params = []
+            params = node.parameters
             while line[pos].kind != 'RPAR':
                 if line[pos].kind != 'ID':
                     raise ParseError('Expected identifier', line[pos])
@@ -128,8 +124,6 @@ class Parser:
                 if line[pos].kind == 'COMMA':
                     pos += 1
             
-            node['parameters'] = params
-            
             if pos >= len(line) or line[pos].kind != 'RPAR':
                 raise ParseError('Expected ")"', self.count)
             pos += 1
@@ -137,57 +131,54 @@ class Parser:
             if pos >= len(line) or line[pos].kind != 'COLON':
                 raise ParseError('Expected ":"', self.count)
             
-            body = []
-            while self.count + 1 < len(self.lines) and self.lines[self.count + 1][0] > level:
+            body = node.body
+            while self.__has_inner(level):
                 inner = self.__parse_line()
                 if (inner != None): body.append(inner)
             if len(body) == 0:
                 raise ParseError('Expected an indented block after function definition', self.count)
-            node['body'] = body
         
         elif line[pos].kind == 'RET':
             pos += 1
-            node = {'type': 'return'}
+            node = Return(None)
             expression = self.__parse_expression(line[pos:])
             if expression == None:
                 raise ParseError('Expected an expression after return', self.count)
-            node['expression'] = expression
+            node.expression = expression
         
         elif line[pos].kind == 'IF':
             pos += 1
-            node = {'type': 'if'}
+            node = If(None, [])
             condition = self.__parse_expression(line[pos:-1])
             if condition == None:
                 raise ParseError('Expected an expression after "if" statemenent', self.count)
-            node['condition'] = condition
+            node.condition = condition
             if line[len(line) - 1].kind != 'COLON':
                 raise ParseError('Expected ":"', self.count)
             
-            body = []
-            while self.count + 1 < len(self.lines) and self.lines[self.count + 1][0] > level:
+            body = node.body
+            while self.__has_inner(level):
                 inner = self.__parse_line()
                 if (inner != None): body.append(inner)
             if len(body) == 0:
                 raise ParseError('Expected an indented block after "if" statemenent', self.count)
-            node['body'] = body
         
         elif line[pos].kind == 'WHILE':
             pos += 1
-            node = {'type': 'while'}
+            node = While(None, [])
             condition = self.__parse_expression(line[pos:-1])
             if condition == None:
                 raise ParseError('Expected an expression after "while" statemenent', self.count)
-            node['condition'] = condition
+            node.condition = condition
             if line[len(line) - 1].kind != 'COLON':
                 raise ParseError('Expected ":"', self.count)
             
-            body = []
-            while self.count + 1 < len(self.lines) and self.lines[self.count + 1][0] > level:
+            body = node.body
+            while self.__has_inner(level):
                 inner = self.__parse_line()
                 if (inner != None): body.append(inner)
             if len(body) == 0:
                 raise ParseError('Expected an indented block after "while" statemenent', self.count)
-            node['body'] = body
         
         elif line[pos].kind == 'PRINT':
             pos += 1 
@@ -204,11 +195,11 @@ class Parser:
                 raise ParseError('Expected ")"', self.count)
             pos += 1
             
-            node = {'type': 'print', 'expression': expression}
+            node = Print(expression)
             
         
         elif line[pos].kind == 'ID':
-            node = {'type': 'assignment', 'name': line[pos].value}
+            node = Assignment(line[pos].value, None)
             pos += 1
             
             if pos >= len(line) or line[pos].kind != 'ASSIGN':
@@ -227,11 +218,11 @@ class Parser:
                         line.append(id_to_assign)
                         ternary_operator = self.__parse_symbol(0, line[pos:])
                         ternary_operator = ternary_operator[1]
-                        node['ternary'] = ternary_operator
+                        node.ternary = ternary_operator
 
                 if value == None:
                     raise ParseError('Expected an expression after variable assignment', self.count)
-                node['value'] = value
+                node.value = value
         
         else:
             node = self.__parse_expression(line)
@@ -242,10 +233,11 @@ class Parser:
         return node
     
     def parse(self, tokens):
-        self.lines = self.__tokens_to_lines(tokens)
+        self.lines = iter(tokens)
+        self.next_line = next(self.lines, None)
         
         ast = []
-        while self.count + 1 < len(self.lines):
+        while self.next_line != None:
             node = self.__parse_line()
             if node != None: ast.append(node)
          
@@ -0,0 +1,78 @@
+import re
+
+register = r'e[abcd]x|e[sd]i'
+memory = r'(?:dword ptr )?(\[ebp[-+]\d+\])'
+same_memory = r'(?:dword ptr )?\1'
+
+class Rule:
+    def __init__(self, name, pattern, replacement):
+        self.name = name
+        self.size = len(pattern)
+        self.pattern = re.compile('\n'.join(pattern))
+        self.replacement = '\n'.join(replacement)
+
+rules = [
+    Rule('push-pop-same', [r'push (\w+)', r'pop \1'], []),
+    Rule('push-pop-move', [r'push (.+)', r'pop ({})'.format(register)], [r'mov \2, \1']),
+    Rule('store-load-same', [r'mov {}, ({})'.format(memory, register), r'mov \2, ' + same_memory], [r'mov \1, \2']),
+    Rule('store-load', [r'mov {}, ({})'.format(memory, register), r'mov ({}), '.format(register) + same_memory], [r'mov \1, \2', r'mov \3, \2']),
+    Rule('zero-before-setcc', [r'mov (e([abcd])x), 0', r'set(\w+) \2l'], [r'set\3 \2l', r'movzx \1, \2l']),
+    Rule('dead-move', [r'mov ({}), .+'.format(register), r'mov \1, (?!.*\1)(.+)'], [r'mov \1, \2']),
+    Rule('self-move', [r'mov (\w+), \1'], []),
+    Rule('add-esp-zero', [r'add esp, 0'], []),
+    Rule('jump-to-next', [r'jmp (\w+)', r'\1:'], [r'\1:'])
+]
+
+class Peephole:
+    def __init__(self, rules=rules):
+        self.rules = rules
+        self.hits = {rule.name: 0 for rule in rules}
+
+    def __rewrite(self, output):
+        for rule in self.rules:
+            if len(output) < rule.size:
+                continue
+            match = rule.pattern.fullmatch('\n'.join(output[-rule.size:]))
+            if match:
+                replacement = match.expand(rule.replacement)
+                del output[-rule.size:]
+                if replacement:
+                    output.extend(replacement.split('\n'))
+                self.hits[rule.name] += 1
+                return True
+        return False
+
+    def optimize(self, lines):
+        changed = True
+        while changed:
+            changed = False
+            output = []
+            for line in lines:
+                output.append(line)
+                while self.__rewrite(output):
+                    changed = True
+            lines = output
+        return lines
+
+if __name__ == '__main__':
+    import sys, glob
+    import tokenizer
+    from compiler import token_list
+    from parse import Parser
+    from generator import Generator
+    from regalloc import RegisterGenerator
+    from emitter import count_instructions
+
+    files = sys.argv[1:] or ['algorithm.py'] + sorted(glob.glob('samples/*.py'))
+    peephole = Peephole()
+    print('{:<24}{:>10}{:>10}{:>10}{:>10}'.format('file', 'stack', 'peephole', 'registers', 'peephole'))
+    for filename in files:
+        with open(filename, 'r') as file:
+            ast = Parser().parse(tokenizer.tokenize(file.read().strip(), token_list))
+        counts = []
+        for backend in [Generator, RegisterGenerator]:
+            counts.append(count_instructions(backend().generate(ast)))
+            counts.append(count_instructions(backend(peephole).generate(ast)))
+        print('{:<24}{:>10}{:>10}{:>10}{:>10}'.format(filename, *counts))
+    for name, hits in peephole.hits.items():
+        print('{:<24}{:>10}'.format(name, hits))
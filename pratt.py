@@ -0,0 +1,232 @@
+from nodes import *
+from parse import ParseError
+
+infix = {
+    'PLUS': PLUS,
+    'MINUS': MINUS,
+    'MUL': MUL,
+    'PERCENT': PERCENT,
+    'LESS': LESS,
+    'GREATER': GREATER,
+    'EQUALS': EQUALS
+}
+
+# The conditional expression states its test the other way round
+flipped = {'LESS': 'GREATER', 'GREATER': 'LESS'}
+
+class PrattParser:
+    def __init__(self):
+        self.tokens = []
+        self.lines = None
+        self.next_line = None
+        self.count = -1
+        self.statements = {
+            'DEF': self.__function,
+            'RET': self.__return,
+            'IF': self.__if,
+            'WHILE': self.__while,
+            'PRINT': self.__print,
+            'ID': self.__assignment
+        }
+        self.prefix = {
+            'NUMBER': self.__number,
+            'ID': self.__identifier,
+            'IF': self.__conditional
+        }
+
+    def __error(self, msg):
+        return ParseError(msg, self.count)
+
+    def __symbol(self, pos, end):
+        if pos >= end:
+            return None
+        handler = self.prefix.get(self.tokens[pos].kind)
+        if handler == None:
+            raise self.__error('Unexpected symbol "{}"'.format(self.tokens[pos].value))
+        return handler(pos, end)
+
+    def __operand(self, pos, end):
+        tokens = self.tokens
+        token = tokens[pos]
+        kind = token.kind
+        # Plain operands are by far the most common, so they skip the prefix table
+        if kind == 'NUMBER':
+            return (pos + 1, Number(token.value))
+        if kind == 'ID' and (pos + 1 >= end or tokens[pos + 1].kind != 'LPAR'):
+            return (pos + 1, Id(token.value))
+        return self.__symbol(pos, end)
+
+    def __number(self, pos, end):
+        return (pos + 1, Number(self.tokens[pos].value))
+
+    def __identifier(self, pos, end):
+        tokens = self.tokens
+        name = tokens[pos].value
+        pos += 1
+        if pos >= end or tokens[pos].kind != 'LPAR':
+            return (pos, Id(name))
+
+        node = FunctionCall(name, [])
+        pos += 1
+        while pos < end and tokens[pos].kind != 'RPAR':
+            pos, parameter = self.__operand(pos, end)
+            node.parameters.append(parameter)
+            if pos < end and tokens[pos].kind == 'COMMA':
+                pos += 1
+        if pos >= end:
+            raise self.__error('Expected ")"')
+        # The closing parenthesis is left in place, so nothing after a call is parsed
+        return (pos, node)
+
+    def __conditional(self, pos, end):
+        if pos + 2 >= end:
+            raise self.__error('Incomplete conditional expression')
+        return self.__ternary(pos, end - 2, end - 1)
+
+    def __ternary(self, pos, false_pos, target):
+        condition = self.__expression(pos + 1, false_pos, pos + 2)
+        if self.tokens[target].kind != 'ID':
+            raise self.__error('Expected identifier')
+        false_value = self.__symbol(false_pos, false_pos + 1)[1]
+        return (pos + 1, If(condition, [Assignment(self.tokens[target].value, false_value)]))
+
+    def __expression(self, pos, end, flip=-1):
+        if pos >= end:
+            return None
+        pos, left = self.__operand(pos, end)
+        if pos >= end:
+            return left
+
+        kind = self.tokens[pos].kind
+        if pos == flip:
+            kind = flipped.get(kind, kind)
+        op = infix.get(kind)
+        if op == None:
+            return left
+        # Operators do not chain, an expression takes at most one of them
+        right = self.__symbol(pos + 1, end)
+        if right == None:
+            raise self.__error('Expected second operand')
+        return BinaryOp(op, left, right[1])
+
+    def __block(self, level, body):
+        while self.next_line != None and self.next_line[0] > level:
+            node = self.__line()
+            if node != None:
+                body.append(node)
+
+    def __function(self, start, end, level):
+        tokens = self.tokens
+        if level != 0:
+            raise self.__error('Function cannot be nested')
+        pos = start + 1
+        if pos >= end or tokens[pos].kind != 'ID':
+            raise self.__error('Expected function identifier')
+        node = Function(tokens[pos].value, [], [])
+        pos += 1
+
+        if pos >= end or tokens[pos].kind != 'LPAR':
+            raise self.__error('Expected "("')
+        pos += 1
+
+        while pos < end and tokens[pos].kind != 'RPAR':
+            if tokens[pos].kind != 'ID':
+                raise self.__error('Expected identifier')
+            node.parameters.append(tokens[pos].value)
+            pos += 1
+            if pos < end and tokens[pos].kind == 'COMMA':
+                pos += 1
+
+        if pos >= end:
+            raise self.__error('Expected ")"')
+        pos += 1
+
+        if pos >= end or tokens[pos].kind != 'COLON':
+            raise self.__error('Expected ":"')
+
+        self.__block(level, node.body)
+        if len(node.body) == 0:
+            raise self.__error('Expected an indented block after function definition')
+        return node
+
+    def __return(self, start, end, level):
+        expression = self.__expression(start + 1, end)
+        if expression == None:
+            raise self.__error('Expected an expression after return')
+        return Return(expression)
+
+    def __compound(self, node, name, start, end, level):
+        node.condition = self.__expression(start + 1, end - 1)
+        if node.condition == None:
+            raise self.__error('Expected an expression after "{}" statemenent'.format(name))
+        if self.tokens[end - 1].kind != 'COLON':
+            raise self.__error('Expected ":"')
+
+        self.__block(level, node.body)
+        if len(node.body) == 0:
+            raise self.__error('Expected an indented block after "{}" statemenent'.format(name))
+        return node
+
+    def __if(self, start, end, level):
+        return self.__compound(If(None, []), 'if', start, end, level)
+
+    def __while(self, start, end, level):
+        return self.__compound(While(None, []), 'while', start, end, level)
+
+    def __print(self, start, end, level):
+        if start + 1 >= end or self.tokens[start + 1].kind != 'LPAR':
+            raise self.__error('Expected "("')
+        expression = self.__expression(start + 2, end - 1)
+        if expression == None:
+            raise self.__error('Expected an expression after "print"')
+        if self.tokens[end - 1].kind != 'RPAR':
+            raise self.__error('Expected ")"')
+        return Print(expression)
+
+    def __assignment(self, start, end, level):
+        tokens = self.tokens
+        if start + 1 >= end or tokens[start + 1].kind != 'ASSIGN':
+            return self.__expression(start, end)
+
+        value = self.__expression(start + 2, end)
+        ternary = None
+        # Only a single token value can be followed by a conditional expression
+        if start + 3 < end and tokens[start + 3].kind == 'IF':
+            if start + 5 > end:
+                raise self.__error('Incomplete conditional expression')
+            ternary = self.__ternary(start + 3, end - 1, start + 2)[1]
+        if value == None:
+            raise self.__error('Expected an expression after variable assignment')
+        return Assignment(tokens[start].value, value, ternary)
+
+    def __line(self):
+        # Lines are pulled from the tokenizer one at a time with one line of lookahead,
+        # every expression is a range over the tokens of the current line
+        level, tokens = self.next_line
+        self.next_line = next(self.lines, None)
+        self.count += 1
+        if not tokens:
+            return None
+        self.tokens = tokens
+        start, end = 0, len(tokens)
+
+        handler = self.statements.get(self.tokens[start].kind)
+        if handler == None:
+            node = self.__expression(start, end)
+        else:
+            node = handler(start, end, level)
+        if node == None:
+            raise self.__error('Unexpected symbol')
+        return node
+
+    def parse(self, tokens):
+        self.lines = iter(tokens)
+        self.next_line = next(self.lines, None)
+        self.count = -1
+
+        ast = []
+        while self.next_line != None:
+            node = self.__line()
+            if node != None:
+                ast.append(node)
+        return ast
@@ -0,0 +1,146 @@
+import os, time, json, tracemalloc
+
+class Phase:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0
+        self.base = 0
+        self.elapsed = 0
+        self.peak = 0
+        self.counts = {}
+
+    def __enter__(self):
+        if self.profiler.memory:
+            tracemalloc.reset_peak()
+            self.base = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        if self.profiler.memory:
+            self.peak = tracemalloc.get_traced_memory()[1] - self.base
+        self.profiler.phases.append(self)
+        self.profiler.event(self.name, self.start, self.elapsed, self.counts)
+        return False
+
+class NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class NullProfiler:
+    # Stands in when nothing is measured, so an unprofiled compile builds no phases or events
+    phase_context = NullPhase()
+
+    def phase(self, name):
+        return self.phase_context
+
+null_profiler = NullProfiler()
+
+class Profiler:
+    def __init__(self, label='', memory=True):
+        self.label = label
+        self.memory = memory
+        self.phases = []
+        self.functions = {}
+        self.nodes = {}
+        self.events = []
+        self.stack = []
+        self.started = memory and not tracemalloc.is_tracing()
+        if self.started:
+            tracemalloc.start()
+
+    def stop(self):
+        # Tracing slows every later allocation, so it ends with the measurement
+        if self.started:
+            tracemalloc.stop()
+            self.started = False
+
+    def take_peaks(self, other):
+        # Peaks from a pass under tracemalloc, for the same phases timed without it
+        for phase, measured in zip(self.phases, other.phases):
+            if phase.name == measured.name:
+                phase.peak = measured.peak
+
+    def phase(self, name):
+        return Phase(self, name)
+
+    def event(self, name, start, elapsed, args=None):
+        self.events.append({
+            'name': name,
+            'ph': 'X',
+            'ts': start * 1e6,
+            'dur': elapsed * 1e6,
+            'pid': os.getpid(),
+            'tid': 0,
+            'args': dict(args or {}, file=self.label)
+        })
+
+    def function(self, name, start, elapsed, cached=False):
+        total = self.functions.setdefault(name, [0, 0])
+        total[0] += elapsed
+        total[1] += 1
+        if not cached:
+            self.event(name, start, elapsed)
+
+    def enter(self):
+        self.stack.append([time.perf_counter(), 0])
+
+    def leave(self, name):
+        start, children = self.stack.pop()
+        elapsed = time.perf_counter() - start
+        # Nodes keep their own time only, nested statements are charged separately
+        total = self.nodes.setdefault(name, [0, 0])
+        total[0] += elapsed - children
+        total[1] += 1
+        if self.stack:
+            self.stack[-1][1] += elapsed
+
+    def merge(self, other):
+        for phase in other.phases:
+            self.phases.append(phase)
+        for table, other_table in ((self.functions, other.functions), (self.nodes, other.nodes)):
+            for name, (elapsed, count) in other_table.items():
+                total = table.setdefault(name, [0, 0])
+                total[0] += elapsed
+                total[1] += count
+        self.events.extend(other.events)
+
+    def summary(self):
+        phases = {}
+        for phase in self.phases:
+            total = phases.setdefault(phase.name, {'time': 0, 'peak': 0, 'counts': {}})
+            total['time'] += phase.elapsed
+            total['peak'] = max(total['peak'], phase.peak)
+            for name, value in phase.counts.items():
+                total['counts'][name] = total['counts'].get(name, 0) + value
+        return {
+            'phases': phases,
+            'functions': {name: {'time': x[0], 'count': x[1]} for name, x in self.functions.items()},
+            'nodes': {name: {'time': x[0], 'count': x[1]} for name, x in self.nodes.items()}
+        }
+
+    def report(self, limit=10):
+        summary = self.summary()
+        lines = ['{:<16}{:>12}{:>12}  {}'.format('phase', 'time (ms)', 'peak (KiB)', 'counts')]
+        for name, phase in summary['phases'].items():
+            counts = ', '.join('{} {}'.format(value, key) for key, value in phase['counts'].items())
+            lines.append('{:<16}{:>12.2f}{:>12.1f}  {}'.format(name, phase['time'] * 1000, phase['peak'] / 1024, counts))
+        for title, table in (('function', summary['functions']), ('node', summary['nodes'])):
+            lines.append('')
+            lines.append('{:<16}{:>12}{:>12}'.format(title, 'time (ms)', 'count'))
+            ranked = sorted(table.items(), key=lambda x: -x[1]['time'])
+            for name, entry in ranked[:limit]:
+                lines.append('{:<16}{:>12.2f}{:>12}'.format(name, entry['time'] * 1000, entry['count']))
+        return '\n'.join(lines)
+
+    def dump(self, filename):
+        # Chrome's trace viewer ignores the extra keys, so one file serves both uses
+        obj = {'traceEvents': self.events, 'displayTimeUnit': 'ms'}
+        obj.update(self.summary())
+        with open(filename, 'w') as file:
+            json.dump(obj, file, indent=4)
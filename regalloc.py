@@ -0,0 +1,385 @@
+from nodes import *
+from generator import Generator, SemanticError, jumps, check_defined, has_tail_call
+from frame import LiveIntervals, FrameLayout
+
+variable_registers = ['esi', 'edi', 'ecx']
+registers = ('eax', 'ebx', 'ecx', 'edx', 'esi', 'edi')
+callee_saved = ['esi', 'edi']
+scratch_registers = ['eax', 'edx', 'ebx']
+
+low_bytes = {'eax': 'al', 'ebx': 'bl', 'ecx': 'cl', 'edx': 'dl'}
+conditions = {LESS: 'l', GREATER: 'g', EQUALS: 'e'}
+arithmetic = {PLUS: 'add', MINUS: 'sub'}
+
+spill_operand = 'dword ptr [esp]'
+
+def linear_scan(intervals):
+    free = list(variable_registers)
+    active = []
+
+    for interval in sorted(intervals, key=lambda x: (x.start, -x.weight)):
+        for other in list(active):
+            if other.end < interval.start:
+                active.remove(other)
+                free.append(other.register)
+
+        allowed = [r for r in variable_registers if r in free and (r != 'ecx' or not interval.crosses_call)]
+        if allowed:
+            interval.register = allowed[0]
+            free.remove(allowed[0])
+            active.append(interval)
+            continue
+
+        # Spill whichever competing interval is cheapest to keep in memory
+        candidates = [x for x in active if x.register != 'ecx' or not interval.crosses_call]
+        spill = min(candidates + [interval], key=lambda x: (x.weight, -x.end))
+        if spill != interval:
+            interval.register = spill.register
+            spill.register = None
+            active.remove(spill)
+            active.append(interval)
+
+    return {x.name: x.register for x in intervals if x.register != None}
+
+class RegisterGenerator(Generator):
+    def __init__(self, peephole=None, loops=False, fragment_limit=1024):
+        super().__init__(peephole, loops, fragment_limit)
+        self.registers = {}
+        self.slots = {}
+        self.saved = []
+        self.temps = []
+        self.defined = set()
+
+    def __is_immediate(self, operand):
+        return operand[0] in '-0123456789'
+
+    def __operand(self, node):
+        kind = node.kind
+        if kind == NUMBER:
+            return node.value
+        if kind == ID:
+            name = node.name
+            if name == 'True':
+                return '1'
+            elif name == 'False':
+                return '0'
+            if name not in self.defined:
+                raise SemanticError('Variable "{}" is undefined'.format(name))
+            if name in self.registers:
+                return self.registers[name]
+            return 'dword ptr [ebp{:+}]'.format(self.slots[name])
+        return None
+
+    def __has_call(self, node):
+        if node.kind == FUNCTION_CALL:
+            return True
+        if node.kind in binary_ops:
+            return self.__has_call(node.op1) or self.__has_call(node.op2)
+        return False
+
+    def __need(self, node):
+        # Sethi-Ullman label; calls clobber every scratch register
+        if node.kind == FUNCTION_CALL:
+            return len(self.temps) + 1
+        if node.kind in binary_ops:
+            left = self.__need(node.op1)
+            right = 0 if self.__operand(node.op2) != None else self.__need(node.op2)
+            return max(left, right) if left != right else left + 1
+        return 1
+
+    def __expression(self, node, target, free):
+        emit = self.emit
+        operand = self.__operand(node)
+        if operand != None:
+            if operand != target:
+                emit('mov {}, {}'.format(target, operand))
+            return
+
+        kind = node.kind
+        if kind == FUNCTION_CALL:
+            self.__call(node, target, free)
+            return
+
+        if kind not in binary_ops:
+            raise SemanticError('Unknow operation "{}"'.format(kind_names[kind]))
+
+        operand = self.__operand(node.op2)
+        if operand != None:
+            self.__expression(node.op1, target, free)
+            self.__apply(kind, target, operand, free)
+            return
+
+        if not free:
+            self.__expression(node.op1, target, free)
+            emit('push {}'.format(target))
+            self.__expression(node.op2, target, free)
+            emit('xchg {}, {}'.format(target, spill_operand))
+            self.__apply(kind, target, spill_operand, free)
+            emit('add esp, 4')
+            return
+
+        second, rest = free[0], free[1:]
+        if self.__need(node.op2) > self.__need(node.op1) and not self.__has_call(node.op1):
+            self.__expression(node.op2, second, [target] + rest)
+            self.__expression(node.op1, target, rest)
+        else:
+            self.__expression(node.op1, target, free)
+            self.__expression(node.op2, second, rest)
+        self.__apply(kind, target, second, rest)
+
+    def __apply(self, kind, target, operand, free):
+        emit = self.emit
+
+        if kind in arithmetic:
+            emit('{} {}, {}'.format(arithmetic[kind], target, operand))
+
+        elif kind == MUL:
+            if self.__is_immediate(operand):
+                emit('imul {0}, {0}, {1}'.format(target, operand))
+            else:
+                emit('imul {}, {}'.format(target, operand))
+
+        elif kind in conditions:
+            low = low_bytes[target]
+            emit(
+                'cmp {}, {}'.format(target, operand),
+                'set{} {}'.format(conditions[kind], low),
+                'movzx {}, {}'.format(target, low)
+            )
+
+        elif kind == SHL:
+            emit('shl {}, {}'.format(target, operand))
+
+        elif kind == MASK:
+            # Remainder by a power of two, rounded toward zero like idiv
+            if free:
+                sign = free[0]
+            else:
+                sign = 'edx' if target != 'edx' else 'eax'
+                emit('push {}'.format(sign))
+            emit(
+                'mov {}, {}'.format(sign, target),
+                'sar {}, 31'.format(sign),
+                'and {}, {}'.format(sign, operand),
+                'add {}, {}'.format(target, sign),
+                'and {}, {}'.format(target, operand),
+                'sub {}, {}'.format(target, sign)
+            )
+            if not free:
+                emit('pop {}'.format(sign))
+
+        elif kind == PERCENT:
+            saved = [r for r in ('eax', 'edx') if r != target and r != operand and r not in free]
+            for register in saved:
+                emit('push {}'.format(register))
+            if operand == spill_operand:
+                operand = 'dword ptr [esp+{}]'.format(4 * len(saved))
+            pushed = self.__is_immediate(operand) or operand in ('eax', 'edx')
+            if pushed:
+                emit('push {}'.format(operand))
+                operand = spill_operand
+            if target != 'eax':
+                emit('mov eax, {}'.format(target))
+            emit('cdq', 'idiv {}'.format(operand))
+            if pushed:
+                emit('add esp, 4')
+            if target != 'edx':
+                emit('mov {}, edx'.format(target))
+            for register in reversed(saved):
+                emit('pop {}'.format(register))
+
+    def __call(self, node, target, free):
+        emit = self.emit
+        busy = [r for r in self.temps if r not in free and r != target]
+        others = [r for r in self.temps if r != target]
+
+        for register in busy:
+            emit('push {}'.format(register))
+        for parameter in node.parameters:
+            operand = self.__operand(parameter)
+            if operand == None:
+                self.__expression(parameter, target, others)
+                operand = target
+            emit('push {}'.format(operand))
+        emit('call {}'.format(node.name))
+        if node.parameters:
+            emit('add esp, {}'.format(4 * len(node.parameters)))
+        if target != 'ebx':
+            emit('mov {}, ebx'.format(target))
+        for register in reversed(busy):
+            emit('pop {}'.format(register))
+
+    def __value(self, node):
+        operand = self.__operand(node)
+        if operand != None:
+            return operand
+        target = self.temps[0]
+        self.__expression(node, target, self.temps[1:])
+        return target
+
+    def __branch(self, condition, label, jump_if):
+        free = list(self.temps)
+
+        if condition.kind in jumps:
+            left = self.__operand(condition.op1)
+            if left == None or left not in registers:
+                left = free.pop(0)
+                self.__expression(condition.op1, left, free)
+            right = self.__operand(condition.op2)
+            if right == None:
+                right = free.pop(0)
+                self.__expression(condition.op2, right, free)
+            self.emit(
+                'cmp {}, {}'.format(left, right),
+                '{} {}'.format(jumps[condition.kind][0 if jump_if else 1], label)
+            )
+            return
+
+        target = free.pop(0)
+        self.__expression(condition, target, free)
+        self.emit(
+            'cmp {}, 0'.format(target),
+            '{} {}'.format('jne' if jump_if else 'je', label)
+        )
+
+    def __epilogue(self):
+        for i, register in enumerate(self.saved):
+            self.emit('mov {}, [ebp{:+}]'.format(register, -4 * (i + 1)))
+        self.emit(
+            'mov esp, ebp',
+            'pop ebp',
+            'ret'
+        )
+
+    def __assignment(self, node):
+        name = node.name
+        value = node.value
+        register = self.registers.get(name)
+
+        if register != None:
+            in_place = (value.kind in arithmetic or value.kind == MUL) and value.op1.kind == ID \
+                and value.op1.name == name and self.__operand(value.op2) != None
+            if in_place:
+                self.__operand(value.op1)
+                self.__apply(value.kind, register, self.__operand(value.op2), self.temps)
+            else:
+                operand = self.__value(value)
+                if operand != register:
+                    self.emit('mov {}, {}'.format(register, operand))
+        else:
+            operand = self.__value(value)
+            if operand.startswith('dword ptr'):
+                self.emit('mov {}, {}'.format(self.temps[0], operand))
+                operand = self.temps[0]
+            self.emit('mov dword ptr [ebp{:+}], {}'.format(self.slots[name], operand))
+
+        self.defined.add(name)
+        if node.ternary != None:
+            self.__statement(node.ternary)
+
+    def __statement(self, node):
+        if self.profiler == None:
+            self.__emit_statement(node)
+            return
+        self.profiler.enter()
+        self.__emit_statement(node)
+        self.profiler.leave(kind_names[node.kind])
+
+    def __emit_statement(self, node):
+        kind = node.kind
+        emit = self.emit
+
+        if kind == RETURN:
+            if self.is_tail_call(node.expression):
+                for parameter in node.expression.parameters:
+                    emit('push {}'.format(self.__value(parameter)))
+                for i in range(len(self.parameters)):
+                    emit(
+                        'pop {}'.format(self.temps[0]),
+                        'mov [ebp{:+}], {}'.format(8 + 4 * i, self.temps[0])
+                    )
+                emit('jmp _tail_{}'.format(self.function))
+                self.tail_jumps.append(self.function)
+                return
+            self.__expression(node.expression, 'ebx', [r for r in self.temps if r != 'ebx'])
+            self.__epilogue()
+            return
+
+        if kind == ASSIGNMENT:
+            self.__assignment(node)
+            return
+
+        if kind == IF:
+            label = self.next_label()
+            self.__branch(node.condition, '_if_end_{}'.format(label), False)
+            for inner_node in node.body:
+                self.__statement(inner_node)
+            emit('_if_end_{}:'.format(label))
+            return
+
+        if kind == WHILE:
+            label = self.next_label()
+            check_defined(node.condition, self.defined)
+            emit(
+                'jmp _while_test_{}'.format(label),
+                '_while_{}:'.format(label)
+            )
+            for inner_node in node.body:
+                self.__statement(inner_node)
+            emit('_while_test_{}:'.format(label))
+            self.__branch(node.condition, '_while_{}'.format(label), True)
+            return
+
+        if kind == PRINT:
+            emit(
+                'push {}'.format(self.__value(node.expression)),
+                'call __print',
+                'add esp, 4'
+            )
+            return
+
+        raise SemanticError('Unknow operation "{}"'.format(kind_names[kind]))
+
+    def generate_function(self, function):
+        name = function.name
+        parameters = function.parameters
+
+        intervals = LiveIntervals(function).intervals
+        self.registers = linear_scan(intervals.values())
+        used = set(self.registers.values())
+        self.saved = [r for r in callee_saved if r in used]
+        self.temps = scratch_registers + ([] if 'ecx' in used else ['ecx'])
+        self.defined = set(parameters)
+        self.slots = {}
+
+        i = 2
+        for parameter in parameters:
+            self.slots[parameter] = i * 4
+            i += 1
+
+        # Spilled locals share slots when their intervals do not overlap
+        layout = FrameLayout(function, len(self.saved), intervals, self.registers)
+        for local in layout.slots:
+            self.slots[local] = layout.offset(local)
+        offset = -4 * (len(self.saved) + layout.size)
+
+        self.emit(
+            *self.target.begin_function(name),
+            'push ebp',
+            'mov ebp, esp'
+        )
+        if offset:
+            self.emit('sub esp, {}'.format(-offset))
+        for i, register in enumerate(self.saved):
+            self.emit('mov [ebp{:+}], {}'.format(-4 * (i + 1), register))
+        # Tail calls store the new arguments in their slots and reload them from here
+        if self.tail_calls and has_tail_call(function.body, function):
+            self.emit('_tail_{}:'.format(name))
+        for parameter in parameters:
+            if parameter in self.registers:
+                self.emit('mov {}, [ebp{:+}]'.format(self.registers[parameter], self.slots[parameter]))
+
+        for node in function.body:
+            self.__statement(node)
+
+        self.emit(*self.target.end_function(name))
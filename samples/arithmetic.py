@@ -0,0 +1,35 @@
+def fact(n):
+    r = 1
+    while n > 1:
+        r = r * n
+        n = n - 1
+    return r
+
+def gcd(a, b):
+    while b > 0:
+        t = a % b
+        a = b
+        b = t
+    return a
+
+def add3(a, b, c):
+    return a + b + c
+
+x = fact(6)
+print(x)
+y = gcd(48, 18)
+print(y)
+z = add3(1, 2, 3)
+print(z)
+w = 7 - 10
+print(w)
+if w < 0:
+    print(0 - w)
+k = 2 * 3
+print(k)
+q = k % 4
+print(q)
+e = k == 6
+print(e)
+m = x if x < y else y
+print(m)
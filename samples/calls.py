@@ -0,0 +1,50 @@
+def sq(x):
+    return x * x
+
+def tri(n):
+    i = 0
+    s = 0
+    while i < n:
+        j = 0
+        while j < i:
+            s = s + j
+            j = j + 1
+        i = i + 1
+    return s
+
+def check(n):
+    c = 0
+    while sq(c) < n:
+        c = c + 1
+    return c
+
+def many(a, b):
+    p = a + b
+    q = a - b
+    r = a * b
+    s = a % b
+    t = p + q
+    u = r - s
+    v = t * u
+    w = v % 1000
+    x = w + p
+    y = x - q
+    z = y + r
+    return z
+
+print(tri(10))
+print(check(50))
+print(many(7, 3))
+n = 3
+m = sq(n) + sq(n)
+print(m)
+k = n - sq(n)
+print(k)
+o = sq(n) % n
+print(o)
+l = 100 % sq(n)
+print(l)
+e = sq(n) == 9
+print(e)
+f = 9 == sq(n)
+print(f)
@@ -0,0 +1,4 @@
+a = 0 - 2147483647
+a = a - 1
+b = 0 - 1
+print(a % b)
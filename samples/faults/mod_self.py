@@ -0,0 +1,5 @@
+def f(x):
+    return x % x
+
+print(f(1))
+print(f(0))
@@ -0,0 +1,62 @@
+def pw(x):
+    a = x * 8
+    b = 4 * x
+    c = x % 8
+    d = x % 2
+    e = x * 1
+    f = 1 * x
+    g = x + 0
+    h = 0 + x
+    k = x - 0
+    l = x * 0
+    m = x % 1
+    n = x - x
+    o = x == x
+    p = x < x
+    t = a + b
+    t = t + c
+    print(t)
+    print(d)
+    t = e + f
+    t = t + g
+    t = t + h
+    t = t + k
+    t = t + l
+    t = t + m
+    t = t + n
+    t = t + o
+    t = t + p
+    return t
+
+print(pw(13))
+n1 = 0 - 13
+print(pw(n1))
+n2 = 0 - 16
+print(pw(n2))
+q = 7 % 4
+print(q)
+q = 0 - 7
+q = q % 4
+print(q)
+r = 3 * 4
+s = r * 2
+s = s + r
+print(s)
+u = 2147483647 + 1
+print(u)
+if 3 < 2:
+    print(111)
+if 2 < 3:
+    print(222)
+v = 5
+while v > 0:
+    v = v - 1
+print(v)
+w = 10
+if v < 1:
+    w = 20
+print(w)
+z = 0
+while z < 0:
+    z = z + 1
+print(z)
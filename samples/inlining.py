@@ -0,0 +1,61 @@
+def gcd(a, b):
+    if b == 0:
+        return a
+    t = a % b
+    return gcd(t, b)
+
+def count(n, acc):
+    if n < 1:
+        return acc
+    acc = acc + n
+    n = n - 1
+    return count(acc, n)
+
+def down(n):
+    if n < 1:
+        return 0
+    m = n - 1
+    return down(m)
+
+def sq(x):
+    return x * x
+
+def inc(x):
+    y = x + 1
+    return y
+
+def lim(a, b):
+    c = a
+    if b < a:
+        c = b
+    return c
+
+def poly(x):
+    s = sq(x)
+    t = inc(s)
+    return t
+
+i = 0
+total = 0
+while i < 10:
+    v = sq(i)
+    w = poly(i)
+    total = total + v
+    total = total + w
+    i = inc(i)
+print(total)
+g = gcd(12, 18)
+print(g)
+c = count(5, 0)
+print(c)
+d = down(1000)
+print(d)
+k = lim(3, 9)
+print(k)
+if inc(k):
+    print(k)
+print(sq(k))
+m = 7
+n = 2
+z = lim(m, n)
+print(z)
@@ -0,0 +1,7 @@
+a = 2147483648
+if 0 < a:
+    print(1)
+print(a < 1)
+b = 4294967297
+print(b)
+print(b + 2147483647)
@@ -0,0 +1,64 @@
+def mix(a, b, c):
+    s = 0
+    t = 1
+    u = 2
+    v = 3
+    w = 4
+    k = 0
+    while k < a:
+        s = s + k
+        t = t * 3
+        t = t % 1000
+        u = u + t
+        v = v - 1
+        w = w % 7
+        w = w + u
+        q = b % c
+        kk = k + 1
+        r = 17 % kk
+        e = s == t
+        g = s > u
+        h = 3 - s
+        k = k + 1
+    x = s + t
+    x = x + u
+    x = x + v
+    x = x + w
+    x = x + q
+    x = x + r
+    x = x + e
+    x = x + g
+    x = x + h
+    return x
+
+def leaf(n):
+    m = n * 7
+    m = m % 5
+    return m
+
+def caller(n):
+    total = 0
+    j = 0
+    while j < n:
+        z = leaf(j)
+        total = total + z
+        print(total)
+        j = j + 1
+    return total
+
+print(mix(10, 37, 5))
+y = caller(6)
+print(y)
+neg = 0 - 17
+r1 = neg % 5
+print(r1)
+r2 = 17 % neg
+print(r2)
+big = 65536 * 65536
+print(big)
+big = 70000 * 70000
+print(big)
+c1 = 5 < neg
+c2 = neg < 5
+print(c1)
+print(c2)
@@ -0,0 +1,42 @@
+def collatz(n):
+    steps = 0
+    while n > 1:
+        r = n % 2
+        if r == 0:
+            h = 0
+            t = n
+            while t > 1:
+                t = t - 2
+                h = h + 1
+            n = h
+        if r == 1:
+            n = 3 * n + 1
+        steps = steps + 1
+    return steps
+
+def fib(n):
+    if n < 2:
+        return n
+    a = n - 1
+    b = n - 2
+    return fib(a) + fib(b)
+
+def count(n, acc):
+    if n == 0:
+        return acc
+    m = n - 1
+    s = acc + n
+    return count(m, s)
+
+i = 1
+total = 0
+while i < 20:
+    total = total + collatz(i)
+    i = i + 1
+print(total)
+print(fib(15))
+print(count(100, 0))
+unused = 5
+flag = True
+print(flag)
+print(False)
@@ -0,0 +1,5 @@
+x = 5
+y = 3
+c = x if x < y else y
+print(x)
+print(y)
@@ -0,0 +1,54 @@
+from nodes import *
+
+class SemanticError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+    
+    def __str__(self):
+        return 'SemanticError: {}'.format(self.msg)
+
+def check_defined(node, names):
+    kind = node.kind
+    if kind == ID:
+        if node.name not in ('True', 'False') and node.name not in names:
+            raise SemanticError('Variable "{}" is undefined'.format(node.name))
+    elif kind == FUNCTION_CALL:
+        for parameter in node.parameters:
+            check_defined(parameter, names)
+    elif kind in binary_ops:
+        check_defined(node.op1, names)
+        check_defined(node.op2, names)
+
+def check_body(body, names):
+    # Same order as the generator emits, so the first error is the one it would raise
+    for node in body:
+        kind = node.kind
+        if kind == ASSIGNMENT:
+            check_defined(node.value, names)
+            names.add(node.name)
+            if node.ternary != None:
+                check_body([node.ternary], names)
+        elif kind in (RETURN, PRINT):
+            check_defined(node.expression, names)
+        elif kind in (IF, WHILE):
+            check_defined(node.condition, names)
+            check_body(node.body, names)
+        else:
+            raise SemanticError('Unknow operation "{}"'.format(kind_names[kind]))
+
+def check_program(ast):
+    # Passes that fold or drop code would otherwise hide the errors the generator reports
+    functions = []
+    main = []
+    for node in ast:
+        if node.kind == FUNCTION:
+            functions.append(node)
+        else:
+            main.append(node)
+    seen = set()
+    for function in functions:
+        if function.name in seen:
+            raise SemanticError('Function "{}" is already defined'.format(function.name))
+        seen.add(function.name)
+        check_body(function.body, set(function.parameters))
+    check_body(main, set())
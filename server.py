@@ -0,0 +1,206 @@
+import os, sys, json, time, socket, socketserver, threading, argparse
+from collections import OrderedDict
+from compiler import compile_file, expand, backends, lexers, parsers, targets, GeneratorPool
+from cache import Cache
+
+default_address = '.compiler.sock'
+
+class WarmCache(Cache):
+    # Recent entries stay in memory in front of the cache directory
+    def __init__(self, directory, limit=64 * 2 ** 20, entries=256):
+        super().__init__(directory, limit)
+        self.entries = OrderedDict()
+        self.size = entries
+        self.lock = threading.Lock()
+
+    def __remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def record(self, hit):
+        # The server's worker threads share the counters, the directory is read outside the lock
+        with self.lock:
+            super().record(hit)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry != None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        entry = super().get(key)
+        if entry != None:
+            with self.lock:
+                self.__remember(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        super().put(key, entry)
+        with self.lock:
+            self.__remember(key, entry)
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.dispatch(json.loads(line.decode('utf-8')))
+            except (ValueError, KeyError, TypeError) as e:
+                response = {'error': 'Bad request: {}'.format(e)}
+            except Exception as e:
+                # A crash in one compile must not take the server down
+                response = {'error': 'Internal error: {}: {}'.format(type(e).__name__, e)}
+            self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+            self.wfile.flush()
+            if response.get('stopping'):
+                # shutdown() waits for serve_forever, so it cannot run on the serving thread
+                threading.Thread(target=self.server.shutdown).start()
+                return
+
+class CompileServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, address, cache=None, options=None):
+        self.cache = cache
+        self.options = options or {}
+        # Generators outlive a request, so a recompile only regenerates the functions that changed
+        self.generators = GeneratorPool()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.compiled = 0
+        self.started = time.time()
+        super().__init__(address, Handler)
+
+    def compile(self, files, options):
+        backend = options.get('backend', 'stack')
+        if backend not in backends:
+            raise ValueError('unknown backend "{}"'.format(backend))
+        lexer = options.get('lexer', 'dfa')
+        if lexer not in lexers:
+            raise ValueError('unknown lexer "{}"'.format(lexer))
+        parser = options.get('parser', 'recursive')
+        if parser not in parsers:
+            raise ValueError('unknown parser "{}"'.format(parser))
+        target = options.get('target', 'masm')
+        if target not in targets:
+            raise ValueError('unknown target "{}"'.format(target))
+
+        results = []
+        for filename in expand(files):
+            results.append(compile_file(filename, backend, bool(options.get('optimize')), bool(options.get('peephole')),
+                bool(options.get('inline')), self.cache, False, parser, bool(options.get('dump_json')), bool(options.get('dump_ast')), target, lexer, bool(options.get('dce')), generators=self.generators))
+        with self.lock:
+            self.requests += 1
+            self.compiled += len(results)
+            if self.cache != None:
+                self.cache.evict()
+        return results
+
+    def dispatch(self, request):
+        command = request.get('command', 'compile')
+        if command == 'compile':
+            options = dict(self.options)
+            options.update(request.get('options', {}))
+            results = self.compile(request['files'], options)
+            return {'results': [{
+                'filename': x.filename,
+                'output': x.output,
+                'error': x.error,
+                'messages': x.messages,
+                'elapsed': x.elapsed,
+                'cached': x.cached
+            } for x in results]}
+        if command == 'status':
+            status = {'pid': os.getpid(), 'uptime': time.time() - self.started, 'requests': self.requests, 'compiled': self.compiled}
+            if self.cache != None:
+                status.update({'hits': self.cache.hits, 'misses': self.cache.misses, 'evicted': self.cache.evicted})
+            return status
+        if command == 'stop':
+            return {'stopping': True}
+        raise ValueError('unknown command "{}"'.format(command))
+
+class Watcher(threading.Thread):
+    def __init__(self, server, directory, interval=0.5):
+        super().__init__(daemon=True)
+        self.server = server
+        self.directory = directory
+        self.interval = interval
+
+    def __scan(self):
+        mtimes = {}
+        for filename in expand([self.directory]):
+            try:
+                mtimes[filename] = os.stat(filename).st_mtime_ns
+            except OSError:
+                continue
+        return mtimes
+
+    def run(self):
+        seen = self.__scan()
+        while True:
+            time.sleep(self.interval)
+            current = self.__scan()
+            changed = [x for x, mtime in current.items() if seen.get(x) != mtime]
+            seen = current
+            if not changed:
+                continue
+            for result in self.server.compile(changed, self.server.options):
+                if result.error != None:
+                    print('{}: {} ({:.1f} ms)'.format(result.filename, result.error, result.elapsed * 1000))
+                else:
+                    print('{} -> {} ({:.1f} ms)'.format(result.filename, result.output, result.elapsed * 1000))
+            sys.stdout.flush()
+
+def is_listening(address):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(address)
+    except OSError:
+        return False
+    finally:
+        client.close()
+    return True
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile server, used through client.py')
+    parser.add_argument('--socket', default=default_address)
+    parser.add_argument('--watch', metavar='DIR', help='recompile .py files under DIR when they change')
+    parser.add_argument('--interval', type=float, default=0.5, help='watch polling interval in seconds')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--registers', action='store_const', dest='backend', const='registers', default='stack')
+    group.add_argument('--ir', action='store_const', dest='backend', const='ir')
+    parser.add_argument('--lexer', choices=list(lexers), default='dfa')
+    parser.add_argument('--parser', choices=list(parsers), default='recursive')
+    parser.add_argument('--target', choices=list(targets), default='masm')
+    parser.add_argument('--optimize', action='store_true')
+    parser.add_argument('--peephole', action='store_true')
+    parser.add_argument('--inline', action='store_true')
+    parser.add_argument('--dce', action='store_true')
+    parser.add_argument('--cache-dir', default='.asmcache')
+    parser.add_argument('--cache-size', type=int, default=64, help='cache size limit in MiB')
+    parser.add_argument('--no-cache', action='store_true')
+    args = parser.parse_args()
+
+    if os.path.exists(args.socket):
+        if is_listening(args.socket):
+            print('A compile server is already listening on {}'.format(args.socket))
+            sys.exit(1)
+        os.remove(args.socket)
+
+    cache = None if args.no_cache else WarmCache(args.cache_dir, args.cache_size * 2 ** 20)
+    # Defaults for the watcher; client requests override them
+    options = {'backend': args.backend, 'lexer': args.lexer, 'parser': args.parser, 'target': args.target, 'optimize': args.optimize, 'peephole': args.peephole, 'inline': args.inline, 'dce': args.dce}
+    server = CompileServer(args.socket, cache, options)
+    if args.watch != None:
+        Watcher(server, args.watch, args.interval).start()
+    print('Listening on {}'.format(args.socket))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(args.socket)
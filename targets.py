@@ -0,0 +1,97 @@
+class MasmTarget:
+    name = 'masm'
+    extension = '.asm'
+    text_start = """
+.386
+.model flat, stdcall
+include \\masm32\\include\\masm32rt.inc
+main proto
+.data
+.code
+__print proc
+    push  ebp 
+    mov   ebp, esp
+    fn MessageBox, 0, str$(8[ebp]), "Result", MB_OK
+    pop   ebp
+    ret
+__print endp
+start:
+invoke main
+invoke ExitProcess, 0
+"""
+    text_end = 'end start'
+
+    def begin_function(self, name):
+        return ['{} proc'.format(name)]
+
+    def end_function(self, name):
+        return ['{} endp'.format(name)]
+
+class GasTarget:
+    # GNU as in Intel syntax for i386 Linux, with a runtime built on int 0x80
+    name = 'gas'
+    extension = '.s'
+    text_start = """
+.intel_syntax noprefix
+.text
+.globl _start
+_start:
+    call main
+    mov eax, 1
+    xor ebx, ebx
+    int 0x80
+__print:
+    push ebp
+    mov ebp, esp
+    push ebx
+    push esi
+    push edi
+    sub esp, 16
+    mov eax, [ebp+8]
+    mov esi, eax
+    lea edi, [esp+15]
+    mov byte ptr [edi], 10
+    mov ecx, 1
+    test eax, eax
+    jns __print_digits
+    neg eax
+__print_digits:
+    xor edx, edx
+    mov ebx, 10
+    div ebx
+    add dl, 48
+    dec edi
+    mov [edi], dl
+    inc ecx
+    test eax, eax
+    jnz __print_digits
+    test esi, esi
+    jns __print_write
+    dec edi
+    mov byte ptr [edi], 45
+    inc ecx
+__print_write:
+    mov edx, ecx
+    mov ecx, edi
+    mov ebx, 1
+    mov eax, 4
+    int 0x80
+    add esp, 16
+    pop edi
+    pop esi
+    pop ebx
+    pop ebp
+    ret
+"""
+    text_end = ''
+
+    def begin_function(self, name):
+        return ['{}:'.format(name)]
+
+    def end_function(self, name):
+        return []
+
+targets = {
+    'masm': MasmTarget(),
+    'gas': GasTarget()
+}
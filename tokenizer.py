@@ -9,6 +9,8 @@ class TokenError(Exception):
         return 'LexicalError: Unexpected symbol "{}" at line {}'.format(self.symbol, self.line)
 
 class Token:
+    __slots__ = ('kind', 'value', 'pos')
+
     def __init__(self, kind, value, pos):
         self.kind = kind
         self.value = value
@@ -20,35 +22,49 @@ class Token:
     def __repr__(self):
         return self.kind
 
-def tokenize(text, token_list):
-    tokens = []
+# Same boundaries as str.splitlines()
+newline_pattern = r'\r\n|[\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]'
 
-    lines = text.splitlines()
-    pattern = '|'.join('(?P<%s>%s)' % pair for pair in token_list)
-    regex = re.compile(pattern)
-    
-    for count, line in enumerate(lines):
-        tokens += [tokenize_line(count + 1, line, regex)]
+regex_cache = {}
 
-    return tokens
+def compile_pattern(token_list):
+    key = tuple(token_list)
+    regex = regex_cache.get(key)
+    if regex == None:
+        pattern = '|'.join('(?P<%s>%s)' % pair for pair in token_list)
+        regex = re.compile('(?P<_NEWLINE>%s)|%s' % (newline_pattern, pattern))
+        regex_cache[key] = regex
+    return regex
 
-def tokenize_line(count, line, regex):
+def tokenize(text, token_list):
+    regex = compile_pattern(token_list)
+    match_at = regex.match
+    
+    count = 1
+    level = 0
     tokens = []
+    line_start = 0
     pos = 0
-
-    while pos < len(line):
-        
-        match = regex.match(line, pos)
+    end = len(text)
+    
+    while pos < end:
+        match = match_at(text, pos)
         if not match:
-            raise TokenError(line[pos], count)
+            raise TokenError(text[pos], count)
         
         kind = match.lastgroup
-        value = match.group(kind)
         pos = match.end()
         
-        if kind == 'WHITESPACE':
-            continue
-
-        tokens.append(Token(kind, value, count))
-
-    return tokens
\ No newline at end of file
+        if kind == '_NEWLINE':
+            yield (level, tokens)
+            count += 1
+            level = 0
+            tokens = []
+            line_start = pos
+        elif kind == 'TAB':
+            level += 1
+        elif kind != 'WHITESPACE':
+            tokens.append(Token(kind, match.group(kind), count))
+    
+    if line_start < end:
+        yield (level, tokens)